@@ -0,0 +1,257 @@
+# benchmarks/runner.py
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+import psutil
+
+RESOLUTIONS = {'360p': (640, 360), '480p': (854, 480), '720p': (1280, 720), '1080p': (1920, 1080)}
+SOURCE_IMAGE = "screenshots/source.jpg"
+TARGET_IMAGE = "screenshots/target.jpg"
+
+
+class ResourceSampler:
+    """Samples this process' CPU % and RSS in a background thread"""
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.proc = psutil.Process()
+        self._stop = threading.Event()
+        self._thread = None
+        self.cpu = []
+        self.rss = []
+
+    def __enter__(self):
+        self.proc.cpu_percent(None)  # First call only sets the baseline
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+    def _sample(self):
+        self.cpu.append(self.proc.cpu_percent(None))
+        self.rss.append(self.proc.memory_info().rss)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def summary(self):
+        return {
+            'cpu_percent_mean': round(float(np.mean(self.cpu)), 1) if self.cpu else None,
+            'cpu_percent_max': round(float(np.max(self.cpu)), 1) if self.cpu else None,
+            'rss_peak_mb': round(max(self.rss) / 2**20, 1) if self.rss else None,
+        }
+
+
+def timed(fn, repeats=5, warmup=1):
+    """Run fn warmup + repeats times; latency summary in ms plus CPU/RSS"""
+    for _ in range(warmup):
+        fn()
+    times = []
+    with ResourceSampler() as sampler:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+    times.sort()
+    result = {
+        'repeats': repeats,
+        'mean_ms': round(sum(times) / len(times) * 1000, 2),
+        'p50_ms': round(times[len(times) // 2] * 1000, 2),
+        'min_ms': round(times[0] * 1000, 2),
+    }
+    result.update(sampler.summary())
+    return result
+
+
+def load_image(path):
+    img = cv2.imread(path)
+    if img is None:
+        raise FileNotFoundError(f"Benchmark image not found: {path}")
+    return img
+
+
+def make_frame(face_img, num_faces, size):
+    """num_faces copies of face_img side by side, letterboxed into a size (w, h) frame"""
+    width, height = size
+    row = np.concatenate([face_img] * num_faces, axis=1)
+    scale = min(width / row.shape[1], height / row.shape[0])
+    resized = cv2.resize(row, (max(1, int(row.shape[1] * scale)), max(1, int(row.shape[0] * scale))),
+                         interpolation=cv2.INTER_AREA)
+    frame = np.zeros((height, width, 3), dtype=np.uint8)
+    y, x = (height - resized.shape[0]) // 2, (width - resized.shape[1]) // 2
+    frame[y:y + resized.shape[0], x:x + resized.shape[1]] = resized
+    return frame
+
+
+def make_video(path, frame, num_frames, fps=25):
+    """Synthetic clip: the frame drifting a few pixels, so detection/tracking see motion"""
+    h, w = frame.shape[:2]
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
+    for i in range(num_frames):
+        dx, dy = 8 * np.sin(i / 10.0), 4 * np.cos(i / 13.0)
+        M = np.float32([[1, 0, dx], [0, 1, dy]])
+        out.write(cv2.warpAffine(frame, M, (w, h), borderMode=cv2.BORDER_REPLICATE))
+    out.release()
+    return path
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import onnxruntime as ort
+    return {
+        'commit': commit,
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'memory_gb': round(psutil.virtual_memory().total / 2**30, 1),
+        'onnxruntime': ort.__version__,
+        'device': ort.get_device(),
+    }
+
+
+def run_benchmarks(resolutions, face_counts, repeats=5, video_frames=60, video_options=None,
+                   swapper_options=None, skip_video=False):
+    from core.face_swapper import FaceSwapper
+
+    results = {'environment': environment(), 'model_load': None, 'get_faces': [], 'swap_faces': [],
+               'process_video': []}
+
+    with ResourceSampler() as sampler:
+        start = time.perf_counter()
+        swapper = FaceSwapper(**(swapper_options or {}))
+        load_s = time.perf_counter() - start
+    results['model_load'] = dict(seconds=round(load_s, 3), **sampler.summary())
+    print(f"✓ Model load: {load_s:.2f}s")
+
+    source_img = load_image(SOURCE_IMAGE)
+    target_face = load_image(TARGET_IMAGE)
+    swapper.get_source_face(source_img)  # Warm the source cache, it isn't what we measure
+
+    for name in resolutions:
+        size = RESOLUTIONS[name]
+        for faces in face_counts:
+            frame = make_frame(target_face, faces, size)
+            case = {'resolution': name, 'width': size[0], 'height': size[1], 'faces': faces}
+            found = len(swapper.get_faces(frame))
+            if found == 0:
+                print(f"⚠ {name} x{faces}: no face detected, skipping")
+                continue
+
+            row = dict(case, detected=found, **timed(lambda: swapper.get_faces(frame), repeats))
+            results['get_faces'].append(row)
+            print(f"✓ get_faces   {name:>6} x{faces}: {row['p50_ms']:.1f} ms")
+
+            row = dict(case, **timed(lambda: swapper.swap_faces(source_img, frame), repeats))
+            results['swap_faces'].append(row)
+            print(f"✓ swap_faces  {name:>6} x{faces}: {row['p50_ms']:.1f} ms")
+
+            if skip_video:
+                continue
+            with tempfile.TemporaryDirectory() as tmp:
+                video = make_video(os.path.join(tmp, "target.mp4"), frame, video_frames)
+                output = os.path.join(tmp, "output.mp4")
+                with ResourceSampler() as sampler:
+                    start = time.perf_counter()
+                    swapper.process_video(SOURCE_IMAGE, video, output, **(video_options or {}))
+                    seconds = time.perf_counter() - start
+            row = dict(case, frames=video_frames, seconds=round(seconds, 3),
+                       fps=round(video_frames / seconds, 2), **sampler.summary())
+            results['process_video'].append(row)
+            print(f"✓ process_video {name:>6} x{faces}: {row['fps']:.1f} fps")
+    return results
+
+
+def _index(results):
+    """Flatten results to {metric key: value} for comparisons"""
+    flat = {}
+    if results.get('model_load'):
+        flat['model_load.seconds'] = results['model_load']['seconds']
+    for stage, metric in (('get_faces', 'p50_ms'), ('swap_faces', 'p50_ms'), ('process_video', 'fps')):
+        for row in results.get(stage, []):
+            flat[f"{stage}.{row['resolution']}.x{row['faces']}.{metric}"] = row[metric]
+    return flat
+
+
+def compare(baseline, current, threshold=0.10):
+    """Rows of (key, baseline, current, change) and whether anything regressed past threshold"""
+    old, new = _index(baseline), _index(current)
+    rows, regressed = [], False
+    for key in sorted(set(old) & set(new)):
+        if not old[key]:
+            continue
+        change = (new[key] - old[key]) / old[key]
+        # fps is better when higher, times when lower
+        worse = -change if key.endswith('.fps') else change
+        if worse > threshold:
+            regressed = True
+        rows.append((key, old[key], new[key], change, worse > threshold))
+    return rows, regressed
+
+
+def print_comparison(rows, baseline_commit, current_commit):
+    print(f"\n{'metric':<40}{baseline_commit or 'baseline':>12}{current_commit or 'current':>12}{'change':>9}")
+    for key, old, new, change, bad in rows:
+        print(f"{key:<40}{old:>12}{new:>12}{change:>+9.1%}{'  ✗' if bad else ''}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Benchmark model load, detection, swap and video throughput")
+    parser.add_argument("--resolutions", nargs="+", default=['480p', '720p', '1080p'], choices=list(RESOLUTIONS))
+    parser.add_argument("--faces", nargs="+", type=int, default=[1, 2, 4], help="Faces per frame")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--video-frames", type=int, default=60)
+    parser.add_argument("--skip-video", action="store_true")
+    parser.add_argument("--model-variant", default='fp32')
+    parser.add_argument("--track", action="store_true", help="process_video with keyframe tracking")
+    parser.add_argument("--backend", default='opencv', choices=('opencv', 'ffmpeg'))
+    parser.add_argument("--output", help="JSON results file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="Baseline JSON to compare against; exit code 1 on regression")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed slowdown before flagging (default: 10%%)")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.resolutions, args.faces, args.repeats, args.video_frames,
+                             video_options={'track': args.track, 'backend': args.backend},
+                             swapper_options={'model_variant': args.model_variant},
+                             skip_video=args.skip_video)
+    results['options'] = vars(args)
+
+    output = args.output or os.path.join("benchmarks", "results",
+                                         f"{results['environment']['commit'] or 'unknown'}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows, regressed = compare(baseline, results, args.threshold)
+        print_comparison(rows, baseline.get('environment', {}).get('commit'), results['environment']['commit'])
+        if regressed:
+            print(f"\n✗ Regression beyond {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+# core/batch.py
+import csv
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import cv2
+from PIL import Image
+
+from core.segments import process_video_sharded
+
+IMAGE_EXTS = ('png', 'jpg', 'jpeg', 'bmp', 'webp')
+VIDEO_EXTS = ('mp4', 'mov', 'avi', 'mkv')
+
+
+def is_video(path):
+    return path.lower().endswith(VIDEO_EXTS)
+
+
+def make_job(source, target, output, source_face_index=0, target_face_index=0):
+    return {
+        'source': source,
+        'target': target,
+        'output': output,
+        'source_face_index': int(source_face_index or 0),
+        'target_face_index': int(target_face_index or 0),
+    }
+
+
+def load_manifest(path):
+    """
+    Read jobs from a .csv (header: source,target,output[,source_face_index,
+    target_face_index]) or .jsonl manifest (one object per line, same keys).
+    Relative paths are resolved against the manifest's directory.
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    if path.lower().endswith('.csv'):
+        with open(path, newline='') as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(path) as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    jobs = []
+    for n, row in enumerate(rows, 1):
+        missing = [k for k in ('source', 'target', 'output') if not row.get(k)]
+        if missing:
+            raise ValueError(f"{path}: entry {n} is missing {', '.join(missing)}")
+        paths = [os.path.join(base, row[k]) for k in ('source', 'target', 'output')]
+        jobs.append(make_job(*paths, row.get('source_face_index'), row.get('target_face_index')))
+    return jobs
+
+
+def jobs_from_dirs(source, input_dir, output_dir, source_face_index=0, target_face_index=0):
+    """One job per image/video in input_dir, written under the same name to output_dir"""
+    jobs = []
+    for name in sorted(os.listdir(input_dir)):
+        if name.lower().endswith(IMAGE_EXTS + VIDEO_EXTS):
+            jobs.append(make_job(source, os.path.join(input_dir, name), os.path.join(output_dir, name),
+                                 source_face_index, target_face_index))
+    return jobs
+
+
+def save_image(path, image):
+    """Write an image, falling back to PIL when OpenCV can't (non-ASCII paths on Windows)"""
+    if not cv2.imwrite(path, image):
+        Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)).save(path)
+
+
+def run_job(swapper, job, video_options=None, enhance=False):
+    """Run one job and return its result record (never raises)"""
+    result = dict(job, status='ok', error=None)
+    start = time.perf_counter()
+    try:
+        out_dir = os.path.dirname(job['output'])
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        if is_video(job['target']):
+            if job['target_face_index']:
+                # Faces are re-detected every frame, so a fixed index doesn't name the same person throughout
+                raise ValueError("target_face_index is not supported for videos: the target face nearest the "
+                                 "source face's position is swapped (use --map for multi-person videos)")
+            options = dict(video_options or {}, source_face_index=job['source_face_index'])
+            sharding = options.pop('sharding', None)
+            if sharding is not None:
+                # Worker processes with their own models, not the shared swapper
+                process_video_sharded(job['source'], job['target'], job['output'], **sharding, **options)
+            else:
+                swapper.process_video(job['source'], job['target'], job['output'], **options)
+        else:
+            source_img = cv2.imread(job['source'])
+            target_img = cv2.imread(job['target'])
+            if source_img is None:
+                raise FileNotFoundError(f"Source image not found: {job['source']}")
+            if target_img is None:
+                raise FileNotFoundError(f"Target image not found: {job['target']}")
+            result_img = swapper.swap_faces(source_img, target_img,
+                                            job['source_face_index'], job['target_face_index'], enhance=enhance,
+                                            in_place=True)
+            save_image(job['output'], result_img)
+    except Exception as e:
+        result['status'] = 'failed'
+        result['error'] = f"{type(e).__name__}: {e}"
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def run_batch(swapper, jobs, workers=4, video_options=None, on_result=None, enhance=False):
+    """
+    Run jobs concurrently against one shared, already loaded swapper.
+    ONNX Runtime sessions are safe to call from several threads, so the
+    models are loaded once no matter how many jobs or workers there are.
+    """
+    results = [None] * len(jobs)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(run_job, swapper, job, video_options, enhance): i for i, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+            if on_result:
+                on_result(result)
+    return results  # In manifest order
@@ -0,0 +1,111 @@
+# core/checkpoint.py
+import json
+import os
+import shutil
+
+from core.segments import concat_segments
+
+
+class CheckpointJournal:
+    """
+    Frame-index journal for a resumable video job.
+
+    Output is written as fixed-size chunks of `chunk_frames` frames into
+    `<output_path>.parts/`, and journal.json lists the chunks that are
+    finished. A restarted job with the same key resumes after the last
+    finished chunk; a job with a different key starts over.
+    """
+
+    def __init__(self, output_path, key, chunk_frames):
+        self.output_path = output_path
+        self.key = key
+        self.chunk_frames = int(chunk_frames)
+        self.dir = os.path.abspath(output_path) + ".parts"
+        self.path = os.path.join(self.dir, "journal.json")
+        _, ext = os.path.splitext(output_path)
+        self.ext = ext or ".mp4"
+        self.chunks = []
+
+        state = self._load()
+        if state and state.get('key') == key and state.get('chunk_frames') == self.chunk_frames:
+            # Only trust chunks whose files actually made it to disk
+            for i in state.get('chunks', []):
+                if i != len(self.chunks) or not os.path.exists(self.chunk_path(i)):
+                    break
+                self.chunks.append(i)
+            if self.chunks:
+                print(f"Resuming from frame {self.frames_done} ({len(self.chunks)} chunks already done)")
+        else:
+            shutil.rmtree(self.dir, ignore_errors=True)
+        os.makedirs(self.dir, exist_ok=True)
+        self._save()
+
+    @property
+    def frames_done(self):
+        return len(self.chunks) * self.chunk_frames
+
+    def chunk_path(self, index, partial=False):
+        return os.path.join(self.dir, f"chunk_{index:06d}{'.part' if partial else ''}{self.ext}")
+
+    def mark_done(self, index):
+        os.replace(self.chunk_path(index, partial=True), self.chunk_path(index))
+        self.chunks.append(index)
+        self._save()
+
+    def finalize(self, audio_source=None):
+        """Join all finished chunks into output_path and drop the checkpoint"""
+        if not self.chunks:
+            raise ValueError("No frames were written, nothing to finalize")
+        concat_segments([self.chunk_path(i) for i in self.chunks], self.output_path, audio_source)
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({'key': self.key, 'chunk_frames': self.chunk_frames, 'chunks': self.chunks}, f)
+        os.replace(tmp, self.path)
+
+
+class ChunkedWriter:
+    """Video writer that rolls over to a new journal chunk every chunk_frames frames"""
+
+    def __init__(self, journal, make_writer):
+        # make_writer(path) -> writer with write()/release(), see core.video_io.open_writer
+        self.journal = journal
+        self.make_writer = make_writer
+        self.index = len(journal.chunks)
+        self.count = 0
+        self.out = None
+
+    def write(self, frame):
+        if self.out is None:
+            self.out = self.make_writer(self.journal.chunk_path(self.index, partial=True))
+        self.out.write(frame)
+        self.count += 1
+        if self.count == self.journal.chunk_frames:
+            self._finish_chunk()
+
+    def close(self):
+        """Finish the trailing partial chunk (call only when the job completed)"""
+        if self.out is not None:
+            self._finish_chunk()
+
+    def release(self):
+        """Stop writing without marking the current chunk done (job failed)"""
+        if self.out is not None:
+            self.out.release()
+            self.out = None
+
+    def _finish_chunk(self):
+        self.out.release()
+        self.out = None
+        self.journal.mark_done(self.index)
+        self.index += 1
+        self.count = 0
@@ -0,0 +1,150 @@
+# core/detection.py
+import numpy as np
+from insightface.app.common import Face
+
+from core.face_index import iou
+
+MIN_DET_SIDE = 160
+MAX_DET_SIDE = 1280
+TARGET_FACE_PX = 40  # Face size at detector scale that det_10g still finds reliably
+
+
+def _round32(x):
+    return max(32, int(round(x / 32.0)) * 32)
+
+
+def pick_det_size(width, height, min_face=None):
+    """
+    Detector input size (w, h) for an image, keeping its aspect ratio.
+
+    min_face is the smallest face (in pixels of the input image) that must
+    still be found; by default faces are assumed to be at least 1/8 of the
+    short side, which fits talking-head footage. Small inputs are never
+    upscaled, large ones are shrunk until min_face lands at TARGET_FACE_PX.
+    """
+    if min_face is None:
+        min_face = min(width, height) / 8.0
+    long_side = max(width, height)
+    scale = min(1.0, TARGET_FACE_PX / max(float(min_face), 1.0), MAX_DET_SIDE / long_side)
+    scale = max(scale, min(1.0, MIN_DET_SIDE / long_side))
+    return _round32(width * scale), _round32(height * scale)
+
+
+def nms_faces(faces, threshold=0.4):
+    """Drop faces overlapping a higher scoring one by more than threshold IoU"""
+    if len(faces) < 2:
+        return faces
+    faces = sorted(faces, key=lambda f: -float(f.det_score))
+    boxes = np.array([f.bbox for f in faces], dtype=np.float32)
+    overlap = iou(boxes, boxes)
+    keep = []
+    for i in range(len(faces)):
+        if all(overlap[i, j] <= threshold for j in keep):
+            keep.append(i)
+    return [faces[i] for i in keep]
+
+
+def detect_tiled(detect_fn, image, tile_size=1280, overlap=0.25, min_face=None):
+    """
+    Detect faces in a very large image tile by tile. Each tile is a view into
+    the image, so nothing is copied, and the detector input stays bounded by
+    tile_size however big the image is. Small faces that a single downscaled
+    pass would miss are found in the tiles; a downscaled whole-image pass
+    catches faces larger than the tile overlap. Duplicates are merged by NMS.
+    """
+    h, w = image.shape[:2]
+    step = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(length):
+        points = list(range(0, max(length - tile_size, 0) + 1, step))
+        if points[-1] + tile_size < length:
+            points.append(length - tile_size)
+        return points
+
+    faces = list(detect_fn(image, pick_det_size(w, h)))
+    for y in starts(h):
+        for x in starts(w):
+            tile = image[y:y + tile_size, x:x + tile_size]
+            th, tw = tile.shape[:2]
+            offset = np.array([x, y], dtype=np.float32)
+            # Tiles are there for the small faces, so run them at (up to) full resolution
+            for f in detect_fn(tile, pick_det_size(tw, th, min_face or TARGET_FACE_PX)):
+                faces.append(Face(bbox=f.bbox + np.tile(offset, 2), kps=f.kps + offset, det_score=f.det_score))
+    return nms_faces(faces)
+
+
+class RoiDetector:
+    """
+    Re-detect faces only inside an expanded region around each of the
+    previous frame's faces, with a full-frame scan every
+    `full_scan_interval` frames, whenever a face is lost, or when the
+    regions together cover more than `max_roi_fraction` of the frame (a
+    full scan is cheaper then).
+    """
+
+    def __init__(self, detect_fn, full_scan_interval=30, expand=0.75, min_face=None, max_roi_fraction=0.5):
+        # detect_fn(image, det_size) -> faces, e.g. FaceSwapper.detect_faces
+        self.detect_fn = detect_fn
+        self.full_scan_interval = max(1, int(full_scan_interval))
+        self.expand = expand
+        self.min_face = min_face
+        self.max_roi_fraction = max_roi_fraction
+        self.faces = []
+        self.since_full_scan = 0
+        self.full_scans = 0
+        self.roi_scans = 0
+
+    def update(self, frame):
+        faces = None
+        if self.faces and self.since_full_scan < self.full_scan_interval:
+            faces = self._detect_roi(frame)
+        if not faces:
+            h, w = frame.shape[:2]
+            faces = self.detect_fn(frame, pick_det_size(w, h, self.min_face))
+            self.since_full_scan = 0
+            self.full_scans += 1
+        else:
+            self.roi_scans += 1
+        self.since_full_scan += 1
+        self.faces = faces
+        return faces
+
+    def rois(self, shape):
+        """One (x1, y1, x2, y2, face_size) region per tracked face; overlapping ones are merged"""
+        h, w = shape[:2]
+        rois = []
+        for f in self.faces:
+            x1, y1, x2, y2 = (float(v) for v in f.bbox)
+            size = max(x2 - x1, y2 - y1)
+            margin = max(size * self.expand, 16)
+            rois.append([max(x1 - margin, 0), max(y1 - margin, 0), min(x2 + margin, w), min(y2 + margin, h), size])
+        merged = []
+        for roi in sorted(rois):
+            for other in merged:
+                if roi[0] < other[2] and other[0] < roi[2] and roi[1] < other[3] and other[1] < roi[3]:
+                    other[:4] = [min(roi[0], other[0]), min(roi[1], other[1]), max(roi[2], other[2]),
+                                 max(roi[3], other[3])]
+                    other[4] = min(roi[4], other[4])
+                    break
+            else:
+                merged.append(roi)
+        return [tuple(int(v) for v in roi[:4]) + (roi[4],) for roi in merged]
+
+    def _detect_roi(self, frame):
+        h, w = frame.shape[:2]
+        rois = self.rois(frame.shape)
+        if sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2, _ in rois) > self.max_roi_fraction * w * h:
+            return None
+        faces = []
+        for x1, y1, x2, y2, face_size in rois:
+            if x2 - x1 < 16 or y2 - y1 < 16:
+                return None
+            # Faces in the ROI are about as big as last frame's, so size the detector for them
+            det_size = pick_det_size(x2 - x1, y2 - y1, min_face=face_size * 0.5)
+            found = self.detect_fn(frame[y1:y2, x1:x2], det_size)
+            if not found:
+                return None  # A face was lost (or left): rescan the whole frame
+            offset = np.array([x1, y1], dtype=np.float32)
+            faces.extend(Face(bbox=f.bbox + np.tile(offset, 2), kps=f.kps + offset, det_score=f.det_score)
+                         for f in found)
+        return nms_faces(faces)
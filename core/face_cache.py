@@ -0,0 +1,192 @@
+# core/face_cache.py
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from insightface.app.common import Face
+
+
+class SourceFaceCache:
+    """
+    Cache of analysed source faces keyed by image content hash + face index.
+
+    Entries live in an in-memory LRU. If `cache_dir` is set they are also
+    written there as small .npz files (embedding, bbox, kps, det_score), so
+    other processes and later runs skip detection and recognition too.
+    """
+
+    def __init__(self, max_entries=256, cache_dir=None):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def image_key(image):
+        """Content hash of a decoded image (shape and dtype included)"""
+        h = hashlib.blake2b(digest_size=20)
+        h.update(f"{image.shape}{image.dtype}".encode())
+        h.update(np.ascontiguousarray(image).data)
+        return h.hexdigest()
+
+    def get(self, digest, index):
+        key = (digest, index)
+        with self._lock:
+            face = self._entries.get(key)
+            if face is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return face
+
+        face = self._load(digest, index)
+        with self._lock:
+            if face is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, face)
+        return face
+
+    def put(self, digest, index, face):
+        face = Face(bbox=np.asarray(face.bbox, dtype=np.float32),
+                    kps=np.asarray(face.kps, dtype=np.float32),
+                    det_score=float(face.det_score),
+                    embedding=np.asarray(face.normed_embedding, dtype=np.float32))
+        with self._lock:
+            self._remember((digest, index), face)
+        if self.cache_dir:
+            self._save(digest, index, face)
+        return face
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _remember(self, key, face):
+        self._entries[key] = face
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _path(self, digest, index):
+        return os.path.join(self.cache_dir, f"{digest}_{index}.npz")
+
+    def _load(self, digest, index):
+        if not self.cache_dir:
+            return None
+        path = self._path(digest, index)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                return Face(bbox=data['bbox'], kps=data['kps'],
+                            det_score=float(data['det_score']), embedding=data['embedding'])
+        except Exception as e:
+            print(f"⚠ Ignoring corrupt face cache entry {path}: {e}")
+            return None  # Recompute it
+
+    def _save(self, digest, index, face):
+        path = self._path(digest, index)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, bbox=face.bbox, kps=face.kps,
+                 det_score=np.float32(face.det_score), embedding=face.embedding)
+        os.replace(tmp, path)  # Atomic, so concurrent readers never see half a file
+
+
+class ResultCache:
+    """
+    Swapped images keyed by a hash of source, target and swap options.
+
+    Entries live in an in-memory LRU bounded by total bytes. If `cache_dir`
+    is set they are also written there as lossless PNGs, so identical jobs
+    resubmitted to other processes or in later runs are served from disk.
+    """
+
+    def __init__(self, max_bytes=256 * 2**20, cache_dir=None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(source_digest, target_digest, options):
+        h = hashlib.blake2b(digest_size=20)
+        h.update(f"{source_digest}|{target_digest}|".encode())
+        h.update(json.dumps(options, sort_keys=True, default=str).encode())
+        return h.hexdigest()
+
+    def get(self, key):
+        """Cached result (shared, don't modify it) or None"""
+        with self._lock:
+            image = self._entries.get(key)
+            if image is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return image
+
+        image = self._load(key)
+        with self._lock:
+            if image is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, image)
+        return image
+
+    def put(self, key, image):
+        image = image.copy()  # The caller's array may be pasted onto again
+        with self._lock:
+            self._remember(key, image)
+        if self.cache_dir:
+            self._save(key, image)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remember(self, key, image):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old.nbytes
+        if image.nbytes > self.max_bytes:
+            return
+        self._entries[key] = image
+        self._bytes += image.nbytes
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.png")
+
+    def _load(self, key):
+        if not self.cache_dir:
+            return None
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        return cv2.imread(path)  # None for a corrupt entry, which is then recomputed
+
+    def _save(self, key, image):
+        path = self._path(key)
+        ok, encoded = cv2.imencode(".png", image)
+        if not ok:
+            return
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(encoded.tobytes())
+        os.replace(tmp, path)
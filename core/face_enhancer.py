@@ -0,0 +1,171 @@
+# core/face_enhancer.py
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from core.face_index import iou
+from core.face_swapper import paste_back
+from core.video_pipeline import OrderedSection
+
+GFPGAN_PATH = "models/GFPGANv1.4.pth"
+CROP_SIZE = 512
+# FFHQ 5-point template for 512px crops (same as facexlib's FaceRestoreHelper)
+FFHQ_TEMPLATE = np.array([[192.98138, 239.94708], [318.90277, 240.1936], [256.63416, 314.01935],
+                          [201.26117, 371.41043], [313.08905, 371.15118]], dtype=np.float32)
+
+
+class FaceEnhancer:
+    """
+    GFPGAN v1.4 restoration applied to aligned 512px face crops only.
+
+    The network is built on first use, not at import or construction, so
+    nothing is paid unless enhancement is actually requested. Crops from
+    several faces and frames go through the network as one batch and are
+    blended back with the same ROI-limited paste-back as the swap.
+    """
+
+    def __init__(self, model_path=GFPGAN_PATH, device=None, max_batch=8):
+        self.model_path = model_path
+        self.device = device
+        self.max_batch = max_batch
+        self._net = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self._net is not None:
+                return self._net
+            if not os.path.exists(self.model_path):
+                raise FileNotFoundError(f"Face enhancer model not found: {self.model_path}. "
+                                        "Run: python -m utils.model_downloader")
+            try:
+                import torch
+                from gfpgan.archs.gfpganv1_clean_arch import GFPGANv1Clean
+            except ImportError as e:
+                raise ImportError("Face enhancement needs the optional 'gfpgan' package: pip install gfpgan") from e
+
+            self.device = self.device or ('cuda' if torch.cuda.is_available() else 'cpu')
+            net = GFPGANv1Clean(out_size=CROP_SIZE, num_style_feat=512, channel_multiplier=2, decoder_load_path=None,
+                                fix_decoder=False, num_mlp=8, input_is_latent=True, different_w=True, narrow=1,
+                                sft_half=True)
+            state = torch.load(self.model_path, map_location='cpu')
+            net.load_state_dict(state['params_ema'] if 'params_ema' in state else state['params'], strict=True)
+            self._net = net.eval().to(self.device)
+            print("Face enhancer loaded successfully!")
+            return self._net
+
+    def align(self, img, face):
+        """Aligned 512px crop of a face and its affine matrix"""
+        M, _ = cv2.estimateAffinePartial2D(face.kps.astype(np.float32), FFHQ_TEMPLATE, method=cv2.LMEDS)
+        crop = cv2.warpAffine(img, M, (CROP_SIZE, CROP_SIZE), borderMode=cv2.BORDER_CONSTANT,
+                              borderValue=(135, 133, 132))
+        return crop, M
+
+    def restore(self, crops):
+        """Run GFPGAN on a list of BGR uint8 crops, in batches"""
+        if not crops:
+            return []
+        import torch
+
+        net = self.load()
+        out = []
+        for i in range(0, len(crops), self.max_batch):
+            batch = np.stack(crops[i:i + self.max_batch])[..., ::-1]  # BGR -> RGB
+            x = torch.from_numpy(np.ascontiguousarray(batch.transpose(0, 3, 1, 2))).float().div_(255)
+            x = x.sub_(0.5).div_(0.5).to(self.device)
+            with torch.no_grad():
+                y = net(x, return_rgb=False)[0]
+            y = y.clamp_(-1, 1).add_(1).mul_(127.5).round_().byte().cpu().numpy()
+            out.extend(np.ascontiguousarray(y.transpose(0, 2, 3, 1)[..., ::-1]))
+        return out
+
+    def enhance(self, jobs):
+        """Restore every (image, face) job in place"""
+        aligned = [self.align(img, face) for img, face in jobs]
+        for (img, _), (crop, M), face_crop in zip(jobs, aligned, self.restore([crop for crop, _ in aligned])):
+            paste_back(img, face_crop, M)
+
+
+class SequenceEnhancer:
+    """
+    Restoration state of one video job, shared by all its workers.
+
+    GFPGAN runs on every every_n-th frame of the video (key frames); the
+    frames in between reuse each face's last restoration as a residual in
+    aligned face space, so it follows the face as it moves. At each key
+    frame the new residual is blended with the previous one (weight `blend`
+    on the new one) to suppress flicker. Residuals belong to face tracks,
+    matched by identity (when mapped) and box overlap, so they stay with
+    the right person when faces come and go.
+
+    Workers call enhance() with consecutive micro-batches in any order. The
+    network runs right away, in parallel; applying residuals, which needs
+    the state of the frames before, waits for the previous batch.
+    """
+
+    def __init__(self, enhancer, every_n=1, blend=0.5, iou_threshold=0.3, timeout=600):
+        self.enhancer = enhancer
+        self.every_n = max(1, int(every_n))
+        self.blend = blend
+        self.iou_threshold = iou_threshold
+        self.tracks = {}  # id -> dict: identity, bbox, residual, seen (frame index)
+        self._next_track = 0
+        self._ordered = OrderedSection(timeout)
+
+    def is_key(self, index):
+        return index % self.every_n == 0
+
+    def enhance(self, frames, first_index):
+        """
+        Restore faces in place. frames lists, in frame order starting at
+        frame first_index, the (image, face) jobs of each frame.
+        """
+        error = None
+        try:
+            aligned = [[self.enhancer.align(img, face) for img, face in jobs] for jobs in frames]
+            key_crops = [crop for i, crops in enumerate(aligned) if self.is_key(first_index + i) for crop, _ in crops]
+            restored = iter(self.enhancer.restore(key_crops))
+        except Exception as e:
+            error = e
+
+        # Even a failed batch takes its turn, or every later batch waits for good
+        with self._ordered.turn(first_index, len(frames)):
+            if error is not None:
+                raise error
+            for i, (jobs, crops) in enumerate(zip(frames, aligned)):
+                self._apply(first_index + i, jobs, crops, restored)
+
+    def _apply(self, index, jobs, crops, restored):
+        used = set()
+        for (img, face), (crop, M) in zip(jobs, crops):
+            track_id = self._match(face, used)
+            track = self.tracks.get(track_id)
+            if self.is_key(index):
+                residual = next(restored).astype(np.int16) - crop
+                if track is not None and self.blend < 1:
+                    residual = (self.blend * residual + (1 - self.blend) * track['residual']).astype(np.int16)
+            elif track is not None:
+                residual = track['residual']
+            else:
+                # A face that appeared since the last key frame: restore it now
+                residual = self.enhancer.restore([crop])[0].astype(np.int16) - crop
+            if track is None:
+                track_id, self._next_track = self._next_track, self._next_track + 1
+            used.add(track_id)
+            self.tracks[track_id] = {'identity': face.get('identity'), 'bbox': np.asarray(face.bbox, dtype=np.float32),
+                                     'residual': residual, 'seen': index}
+            paste_back(img, np.clip(crop + residual, 0, 255).astype(np.uint8), M)
+        # Faces unseen for a whole key interval are gone
+        self.tracks = {k: t for k, t in self.tracks.items() if index - t['seen'] <= self.every_n}
+
+    def _match(self, face, used):
+        """Id of the live track this face continues, or None"""
+        candidates = [k for k, t in self.tracks.items() if k not in used and t['identity'] == face.get('identity')]
+        if not candidates:
+            return None
+        overlap = iou(np.asarray(face.bbox, dtype=np.float32)[None],
+                      np.stack([self.tracks[k]['bbox'] for k in candidates]))[0]
+        best = int(overlap.argmax())
+        return candidates[best] if overlap[best] >= self.iou_threshold else None
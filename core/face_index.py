@@ -0,0 +1,124 @@
+# core/face_index.py
+import numpy as np
+
+
+def iou(a, b):
+    """IoU between every box in a (N, 4) and every box in b (M, 4)"""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+
+class FaceIndex:
+    """
+    Reference embeddings of target people, each mapped to the source face
+    that should replace them. Several references may share one identity.
+    Matching a frame's faces is one (faces x references) matrix multiply.
+    """
+
+    def __init__(self, threshold=0.35):
+        self.threshold = threshold
+        self.matrix = np.zeros((0, 512), dtype=np.float32)
+        self.identities = []  # Row -> identity label
+        self.sources = {}  # Identity label -> source face
+
+    def __len__(self):
+        return len(self.identities)
+
+    def add(self, embedding, source_face, identity=None):
+        embedding = np.array(embedding, dtype=np.float32).reshape(1, -1)
+        embedding /= np.linalg.norm(embedding)
+        identity = len(self.sources) if identity is None else identity
+        if self.matrix.shape[1] != embedding.shape[1]:
+            self.matrix = np.zeros((0, embedding.shape[1]), dtype=np.float32)
+        self.matrix = np.concatenate([self.matrix, embedding], axis=0)
+        self.identities.append(identity)
+        self.sources[identity] = source_face
+        return identity
+
+    def match(self, embeddings, exclude=()):
+        """
+        Identity for each row of a normalized (N, D) embedding matrix, or
+        None below the threshold. One identity is given to at most one face
+        per call (the best scoring one), since a person appears once per frame;
+        identities in exclude are already present and are not handed out.
+        """
+        n = len(embeddings)
+        if n == 0 or not self.identities:
+            return [None] * n, np.zeros(n, dtype=np.float32)
+        sims = np.asarray(embeddings, dtype=np.float32) @ self.matrix.T
+        best = sims.argmax(axis=1)
+        scores = sims[np.arange(n), best]
+        result = [None] * n
+        taken = set(exclude)
+        for i in np.argsort(-scores):
+            identity = self.identities[best[i]]
+            if scores[i] >= self.threshold and identity not in taken:
+                result[i] = identity
+                taken.add(identity)
+        return result, scores
+
+
+class IdentityMatcher:
+    """
+    Assigns an identity (and with it a source face) to every detected face of
+    consecutive frames. Faces that overlap a face from the previous frame
+    inherit its identity, so recognition only runs for new faces and, per
+    track, every `recheck_interval` frames. Unknown faces are tracked too,
+    so a bystander isn't re-recognized on every frame.
+    """
+
+    def __init__(self, index, embed_fn, iou_threshold=0.5, recheck_interval=30):
+        # embed_fn(image, faces) -> normalized (N, D) embeddings, e.g. FaceSwapper.embed_faces
+        self.index = index
+        self.embed_fn = embed_fn
+        self.iou_threshold = iou_threshold
+        self.recheck_interval = max(1, int(recheck_interval))
+        self.tracks = []  # dicts: bbox, identity, age
+        self.recognitions = 0
+
+    def assign(self, frame, faces):
+        """Sets face['identity'] and face['source'] (None when unmatched) and returns faces"""
+        if not faces:
+            self.tracks = []
+            return faces
+
+        inherited = [None] * len(faces)
+        if self.tracks:
+            overlap = iou(np.array([f.bbox for f in faces], dtype=np.float32),
+                          np.array([t['bbox'] for t in self.tracks], dtype=np.float32))
+            used = set()
+            # Greedy, best overlap first
+            for flat in np.argsort(-overlap, axis=None):
+                i, j = divmod(int(flat), overlap.shape[1])
+                if overlap[i, j] < self.iou_threshold:
+                    break
+                if inherited[i] is None and j not in used and self.tracks[j]['age'] < self.recheck_interval:
+                    inherited[i] = self.tracks[j]
+                    used.add(j)
+
+        unknown = [i for i, track in enumerate(inherited) if track is None]
+        identities = {}
+        if unknown:
+            embeddings = self.embed_fn(frame, [faces[i] for i in unknown])
+            self.recognitions += len(unknown)
+            present = [track['identity'] for track in inherited if track is not None]
+            matched, _ = self.index.match(embeddings, exclude=present)
+            identities = dict(zip(unknown, matched))
+
+        tracks = []
+        for i, face in enumerate(faces):
+            if inherited[i] is not None:
+                identity, age = inherited[i]['identity'], inherited[i]['age'] + 1
+            else:
+                identity, age = identities[i], 0
+            face['identity'] = identity
+            face['source'] = self.index.sources.get(identity) if identity is not None else None
+            tracks.append({'bbox': face.bbox, 'identity': identity, 'age': age})
+        self.tracks = tracks
+        return faces
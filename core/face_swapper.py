@@ -3,91 +3,663 @@ import cv2
 import numpy as np
 import insightface
 from insightface.app import FaceAnalysis
+from insightface.app.common import Face
 from insightface.data import get_image
+from insightface.utils import face_align
+from insightface.model_zoo.arcface_onnx import ArcFaceONNX
+from insightface.model_zoo.attribute import Attribute
+from insightface.model_zoo.inswapper import INSwapper
+from insightface.model_zoo.landmark import Landmark
+from insightface.model_zoo.retinaface import RetinaFace
+from insightface.utils import ensure_available
 import onnxruntime as ort
+import hashlib
+import json
 import os
 from PIL import Image, ImageEnhance
+import itertools
 import threading
+import time
+from collections import deque
+from core.video_options import VideoOptions
+from core.video_pipeline import OrderedSection, VideoPipeline
+from core.face_tracker import FaceTracker
+from core.face_cache import ResultCache, SourceFaceCache
+from core.face_index import FaceIndex, IdentityMatcher
+from core.checkpoint import CheckpointJournal, ChunkedWriter
+from core.metrics import Metrics
+from core.detection import RoiDetector, detect_tiled, pick_det_size
+from core.video_io import (REPEAT_FRAME, DuplicateFrameFilter, FramePool, budget_frames, open_reader, open_writer,
+                           probe, resolve_backend, thumbnail)
+from utils.model_optimizer import VARIANTS, create_session, detector_path, variant_path
+
+# buffalo_l modules loaded per analysis profile. The inswapper path only needs
+# detection (bbox + 5-point kps) for targets and the ArcFace embedding for the
+# source, so 'swap' skips the genderage and 106/3D landmark heads entirely.
+ANALYSIS_PROFILES = {
+    'swap': ['detection', 'recognition'],
+    'full': None,
+}
+
+# buffalo_l model files and the insightface class that wraps each one
+BUFFALO_L_MODULES = {
+    'detection': ('det_10g.onnx', RetinaFace),
+    'recognition': ('w600k_r50.onnx', ArcFaceONNX),
+    'genderage': ('genderage.onnx', Attribute),
+    'landmark_2d_106': ('2d106det.onnx', Landmark),
+    'landmark_3d_68': ('1k3d68.onnx', Landmark),
+}
+
+
+def load_analysis(allowed_modules, session_fn, det_size=(640, 640), det_thresh=0.5, root='~/.insightface'):
+    """
+    FaceAnalysis over buffalo_l whose models run on session_fn(path, taskname).
+    FaceAnalysis itself builds a session per model file and prepare(ctx_id=-1)
+    rebuilds each one, so replacing them afterwards still paid for both.
+    """
+    model_dir = ensure_available('models', 'buffalo_l', root=root)
+    app = FaceAnalysis.__new__(FaceAnalysis)
+    app.model_dir = model_dir
+    app.models = {}
+    for taskname, (filename, model_cls) in BUFFALO_L_MODULES.items():
+        if allowed_modules is None or taskname in allowed_modules:
+            path = os.path.join(model_dir, filename)
+            app.models[taskname] = model_cls(model_file=path, session=session_fn(path, taskname))
+    app.det_model = app.models['detection']
+    app.det_thresh, app.det_size = det_thresh, det_size
+    # ctx_id >= 0 keeps the session as built; only the detector has settings to prepare
+    app.det_model.prepare(0, input_size=det_size, det_thresh=det_thresh)
+    return app
+
 
 class FaceSwapper:
-    def __init__(self):
+    def __init__(self, profile='swap', face_cache=None, model_variant='fp32', intra_op_threads=None,
+                 inter_op_threads=None, adaptive_det=False, min_face=None, metrics=None, tile_size=None,
+                 result_cache=None):
+        if profile not in ANALYSIS_PROFILES:
+            raise ValueError(f"Unknown analysis profile '{profile}'. Choose from: {', '.join(ANALYSIS_PROFILES)}")
+        if model_variant not in VARIANTS:
+            raise ValueError(f"Unknown model variant '{model_variant}'. Choose from: {', '.join(VARIANTS)}")
+        self.profile = profile
+        self.model_variant = model_variant
+        # Adaptive detection sizes the detector input from each image instead of a fixed 640x640
+        self.adaptive_det = adaptive_det
+        self.min_face = min_face
+        # Images with a longer side than tile_size are detected tile by tile (bounded detector memory)
+        self.tile_size = tile_size
+        # Source faces are analysed once per image content, then reused
+        self.face_cache = face_cache if face_cache is not None else SourceFaceCache()
+        # Finished swap_faces results, keyed by source/target content and options (off by default)
+        self.result_cache = result_cache
+        # Stage timers and counters; pass a shared Metrics to aggregate several swappers
+        self.metrics = metrics if metrics is not None else Metrics()
         self.model_path = "models/inswapper_128.onnx"
-        self.app = FaceAnalysis(name='buffalo_l', providers=['CUDAExecutionProvider', 'CPUExecutionProvider'])
-        self.app.prepare(ctx_id=0 if ort.get_device() == 'GPU' else -1, det_size=(640, 640))
-        
-        # Load the swap model
-        self.swap_model = insightface.model_zoo.get_model(self.model_path, download=False)
+
+        # Load the analysis and swap models
+        if ort.get_device() == 'GPU':
+            self.app = FaceAnalysis(name='buffalo_l', allowed_modules=ANALYSIS_PROFILES[profile],
+                                    providers=['CUDAExecutionProvider', 'CPUExecutionProvider'])
+            self.app.prepare(ctx_id=0, det_size=(640, 640))
+            self.swap_model = insightface.model_zoo.get_model(self.model_path, download=False)
+        else:
+            # CPU: every model gets exactly one session, with tuned threads, the
+            # chosen variant and the cached optimized graph (see utils/model_optimizer.py)
+            threads = dict(intra_op_threads=intra_op_threads, inter_op_threads=inter_op_threads)
+            swap_path = variant_path(self.model_path, model_variant)
+            if not os.path.exists(swap_path):
+                raise FileNotFoundError(f"Model variant not found: {swap_path}. Run: python -m utils.model_optimizer")
+            # emap is read from the fp32 file, the variant only supplies the session
+            self.swap_model = INSwapper(model_file=self.model_path,
+                                        session=create_session(swap_path, model_variant, **threads))
+
+            def session_for(path, taskname):
+                if taskname != 'detection':
+                    return create_session(path, 'fp32', **threads)
+                det_path = detector_path(model_variant)
+                if os.path.exists(det_path):
+                    return create_session(det_path, model_variant, **threads)
+                print(f"⚠ Detector variant '{model_variant}' not found, using fp32 detector")
+                return create_session(path, 'fp32', **threads)
+
+            self.app = load_analysis(ANALYSIS_PROFILES[profile], session_for, det_size=(640, 640))
+        # Models exported with a fixed batch of 1 still go through swap_batch,
+        # they just get one session.run per crop instead of one per batch
+        batch_dim = self.swap_model.session.get_inputs()[0].shape[0]
+        self.swap_batchable = not isinstance(batch_dim, int)
+        self._enhancer = None  # GFPGAN stage, only built when enhancement is asked for
+        self._enhancer_lock = threading.Lock()
         print("Face swap model loaded successfully!")
 
+    def warm_up(self):
+        """
+        Run one dummy inference through every session, so ORT's lazy
+        allocations happen now rather than on the first real request
+        """
+        start = time.perf_counter()
+        self.app.det_model.detect(np.zeros((640, 640, 3), dtype=np.uint8), input_size=(640, 640), max_num=0,
+                                  metric='default')
+        for taskname, model in self.app.models.items():
+            if taskname == 'detection':
+                continue
+            inp = model.session.get_inputs()[0]
+            shape = [d if isinstance(d, int) else 1 for d in inp.shape]
+            model.session.run(None, {inp.name: np.zeros(shape, dtype=np.float32)})
+        w, h = self.swap_model.input_size
+        latent = np.zeros((1, self.swap_model.emap.shape[1]), dtype=np.float32)
+        latent[0, 0] = 1.0
+        self._run_swap(np.zeros((1, 3, h, w), dtype=np.float32), latent)
+        print(f"✓ Models warmed up in {time.perf_counter() - start:.2f}s")
+
+    def get_enhancer(self):
+        """The face restoration stage, created on first use"""
+        with self._enhancer_lock:
+            if self._enhancer is None:
+                from core.face_enhancer import FaceEnhancer
+                self._enhancer = FaceEnhancer()
+            return self._enhancer
+
     def get_faces(self, image):
-        """Detect all faces in image"""
-        faces = self.app.get(image)
+        """Detect all faces in image and run every loaded analysis module on them"""
+        with self.metrics.timer('analyze'):
+            faces = self.app.get(image)
+        self.metrics.incr('faces_detected', len(faces))
         return sorted(faces, key=lambda x: x.bbox[0])  # Sort left to right
 
-    def swap_faces(self, source_img, target_img, source_face_index=0, target_face_index=0):
-        """Swap specific face from source to target"""
-        source_faces = self.get_faces(source_img)
-        target_faces = self.get_faces(target_img)
+    def detect_faces(self, image, det_size=None):
+        """Detect all faces in image (bbox + kps only, no recognition)"""
+        if det_size is None and self.tile_size and max(image.shape[:2]) > self.tile_size:
+            faces = detect_tiled(self._detect, image, self.tile_size, min_face=self.min_face)
+        else:
+            if det_size is None and self.adaptive_det:
+                det_size = pick_det_size(image.shape[1], image.shape[0], self.min_face)
+            faces = self._detect(image, det_size)
+        self.metrics.incr('faces_detected', len(faces))
+        return sorted(faces, key=lambda x: x.bbox[0])  # Sort left to right
+
+    def _detect(self, image, det_size=None):
+        with self.metrics.timer('detect'):
+            bboxes, kpss = self.app.det_model.detect(image, input_size=det_size, max_num=0, metric='default')
+        return [Face(bbox=bboxes[i, 0:4], kps=kpss[i], det_score=bboxes[i, 4]) for i in range(bboxes.shape[0])]
 
+    def get_source_face(self, source_img, source_face_index=0):
+        """Analysed source face, served from the face cache when possible"""
+        digest = self.face_cache.image_key(source_img)
+        source_face = self.face_cache.get(digest, source_face_index)
+        if source_face is not None:
+            return source_face
+
+        source_faces = self.get_faces(source_img)
+        if len(source_faces) == 0:
+            raise ValueError("No face detected in source image!")
         if source_face_index >= len(source_faces):
             raise ValueError(f"Source face index {source_face_index} not found. Only {len(source_faces)} faces detected.")
+        for i, face in enumerate(source_faces):
+            self.face_cache.put(digest, i, face)
+        return source_faces[source_face_index]
+
+    def embed_faces(self, image, faces):
+        """Normalized ArcFace embeddings (N, 512) of detected faces, in one batched forward"""
+        rec = self.app.models['recognition']
+        with self.metrics.timer('recognize'):
+            crops = [face_align.norm_crop(image, landmark=f.kps, image_size=rec.input_size[0]) for f in faces]
+            if isinstance(rec.session.get_inputs()[0].shape[0], int):  # Exported with a fixed batch of 1
+                feats = np.concatenate([rec.get_feat(crop) for crop in crops]).astype(np.float32)
+            else:
+                feats = rec.get_feat(crops).astype(np.float32)
+        return feats / np.linalg.norm(feats, axis=1, keepdims=True)
+
+    def build_face_index(self, mapping, threshold=0.35):
+        """
+        FaceIndex from (reference_img, source_img[, reference_face_index,
+        source_face_index]) entries: the person shown in reference_img is
+        replaced by the chosen face of source_img. Give several references
+        of the same person with the same source image to map them together.
+        """
+        index = FaceIndex(threshold=threshold)
+        identities = {}
+        for entry in mapping:
+            reference_img, source_img = entry[0], entry[1]
+            reference_face_index = entry[2] if len(entry) > 2 else 0
+            source_face_index = entry[3] if len(entry) > 3 else 0
+            reference_faces = self.get_faces(reference_img)
+            if reference_face_index >= len(reference_faces):
+                raise ValueError(f"Reference face index {reference_face_index} not found. "
+                                 f"Only {len(reference_faces)} faces detected.")
+            source_face = self.get_source_face(source_img, source_face_index)
+            key = (self.face_cache.image_key(source_img), source_face_index)
+            identities[key] = index.add(reference_faces[reference_face_index].normed_embedding, source_face,
+                                        identities.get(key))
+        return index
+
+    def output_options(self):
+        """Swapper settings that change its output, for cache and checkpoint keys"""
+        return {'profile': self.profile, 'model_variant': self.model_variant, 'adaptive_det': self.adaptive_det,
+                'min_face': self.min_face, 'tile_size': self.tile_size}
+
+    def result_key(self, source_img, target_img, source_face_index=0, target_face_index=0, enhance=False):
+        """Result cache key: content of both images plus everything that changes the output"""
+        options = dict(self.output_options(), source_face_index=source_face_index,
+                       target_face_index=target_face_index, enhance=enhance)
+        return ResultCache.key(self.face_cache.image_key(source_img), self.face_cache.image_key(target_img), options)
+
+    def swap_faces(self, source_img, target_img, source_face_index=0, target_face_index=0, enhance=False,
+                   in_place=False):
+        """
+        Swap specific face from source to target, optionally restoring the
+        swapped face with GFPGAN. With in_place=True target_img itself is
+        modified and returned, saving a full-size copy (8K: ~100MB).
+        With a result_cache, identical requests are answered from it.
+        """
+        cache_key = None
+        if self.result_cache is not None:
+            cache_key = self.result_key(source_img, target_img, source_face_index, target_face_index, enhance)
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                self.metrics.incr('result_cache_hits')
+                if in_place:
+                    np.copyto(target_img, cached)
+                    return target_img
+                return cached.copy()
+
+        source_face = self.get_source_face(source_img, source_face_index)
+        target_faces = self.detect_faces(target_img)  # Targets only need kps for alignment
+
         if target_face_index >= len(target_faces):
             raise ValueError(f"Target face index {target_face_index} not found. Only {len(target_faces)} faces detected.")
 
-        source_face = source_faces[source_face_index]
         target_face = target_faces[target_face_index]
 
-        result = target_img.copy()
-        result = self.swap_model.get(result, target_face, source_face, paste_back=True)
-        
+        result = target_img if in_place else target_img.copy()
+        self.swap_batch([(result, target_face, source_face)])
+        if enhance:
+            with self.metrics.timer('enhance'):
+                self.get_enhancer().enhance([(result, target_face)])
+        if cache_key is not None:
+            self.result_cache.put(cache_key, result)
+
         return result
 
-    def process_video(self, source_path, target_path, output_path, callback=None):
-        """Process video frame by frame"""
-        source_img = cv2.imread(source_path)
-        if source_img is None:
-            raise FileNotFoundError(f"Source image not found: {source_path}")
-            
-        cap = cv2.VideoCapture(target_path)
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
-        
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        current_frame = 0
-        
-        source_faces = self.get_faces(source_img)
-        if len(source_faces) == 0:
-            raise ValueError("No face detected in source image!")
-            
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-                
+    def swap_batch(self, jobs, max_batch=32):
+        """
+        Swap a list of (image, target_face, source_face) jobs with batched
+        inswapper runs. Each image is pasted onto in place and returned.
+        Several jobs may share one image (multi-face swaps).
+        """
+        if not jobs:
+            return []
+        model = self.swap_model
+        size = model.input_size[0]
+
+        metrics = self.metrics
+        crops, mats, latents = [], [], []
+        with metrics.timer('align'):
+            for img, target_face, source_face in jobs:
+                aimg, M = face_align.norm_crop2(img, target_face.kps, size)
+                crops.append(aimg)
+                mats.append(M)
+                latents.append(self.source_latent(source_face))
+
+            blob = cv2.dnn.blobFromImages(crops, 1.0 / model.input_std, model.input_size,
+                                          (model.input_mean, model.input_mean, model.input_mean), swapRB=True)
+            latent = np.concatenate(latents, axis=0)
+        with metrics.timer('swap'):
+            preds = [self._run_swap(blob[i:i + max_batch], latent[i:i + max_batch])
+                     for i in range(0, len(jobs), max_batch)]
+            pred = np.concatenate(preds, axis=0)
+        bgr_fakes = np.ascontiguousarray(np.clip(255 * pred.transpose((0, 2, 3, 1)), 0, 255).astype(np.uint8)[..., ::-1])
+
+        with metrics.timer('paste'):
+            for (img, _, _), bgr_fake, M in zip(jobs, bgr_fakes, mats):
+                paste_back(img, bgr_fake, M)
+        metrics.incr('faces_swapped', len(jobs))
+        return [img for img, _, _ in jobs]
+
+    def source_latent(self, source_face):
+        """inswapper latent for a source face, computed once per face object"""
+        latent = source_face.get('latent')
+        if latent is None:
+            latent = np.dot(source_face.normed_embedding.reshape((1, -1)), self.swap_model.emap)
+            latent /= np.linalg.norm(latent)
+            source_face['latent'] = latent.astype(np.float32)
+        return source_face['latent']
+
+    def _run_swap(self, blob, latent):
+        model = self.swap_model
+        if self.swap_batchable:
+            return model.session.run(model.output_names, {model.input_names[0]: blob, model.input_names[1]: latent})[0]
+        return np.concatenate([
+            model.session.run(model.output_names, {model.input_names[0]: blob[i:i + 1], model.input_names[1]: latent[i:i + 1]})[0]
+            for i in range(len(blob))
+        ], axis=0)
+
+    def process_video(self, source_path, target_path, output_path, options=None, callback=None,
+                      face_index=None, preview_fn=None, source_face_index=0, **overrides):
+        """Swap a video through the decoder / worker pool / encoder pipeline, see VideoOptions"""
+        options = VideoOptions.from_dict(overrides, base=options)
+        start_frame, end_frame = options.start_frame, options.end_frame
+        if face_index is None:
+            source_img = cv2.imread(source_path)
+            if source_img is None:
+                raise FileNotFoundError(f"Source image not found: {source_path}")
+            source_face = self.get_source_face(source_img, source_face_index)
+            source_key = [self.face_cache.image_key(source_img), source_face_index]
+        else:
+            if not len(face_index):
+                raise ValueError("Face index is empty")
+            source_face = None
+            sources = np.stack([f.normed_embedding for f in face_index.sources.values()])
+            source_key = self.face_cache.image_key(np.concatenate([face_index.matrix, sources]))
+        if options.enhance:
+            self.get_enhancer().load()  # Fail here, not silently inside the workers
+
+        backend = resolve_backend(options.backend)
+        info = probe(target_path, backend)
+        fps, size = info['fps'], (info['width'], info['height'])
+        # Buffers beside the frames in flight: the one being decoded, and the last output kept for repeats
+        spare = 2 if options.skip_duplicates else 1
+        max_inflight, batch_size = options.max_inflight, options.batch_size
+        if options.memory_budget_mb and not max_inflight:
+            max_inflight = budget_frames(options.memory_budget_mb, (size[1], size[0], 3), spare)
+        if max_inflight:
+            batch_size = max(1, min(batch_size, max_inflight))  # A whole batch must fit under the cap
+        encode_options = dict(options.encode_options or {})
+        # Audio only makes sense for a whole video; segments get it back when they are joined
+        whole_video = start_frame == 0 and end_frame is None
+        audio_from = target_path if options.keep_audio and backend == 'ffmpeg' and info['has_audio'] else None
+
+        journal = None
+        if options.checkpoint_every:
+            stat = os.stat(target_path)
+            # Every option that changes the output: a resume must never splice chunks made with other settings
+            output_key = dict(options.output_key(), **self.output_options())
+            output_key.update(backend=backend, encode_options=encode_options)
+            options_key = hashlib.blake2b(json.dumps(output_key, sort_keys=True, default=str).encode(),
+                                          digest_size=8).hexdigest()
+            key = [source_key, os.path.abspath(target_path),
+                   stat.st_size, stat.st_mtime, start_frame, end_frame, options_key]
+            journal = CheckpointJournal(output_path, key, options.checkpoint_every)
+            out = ChunkedWriter(journal, lambda path: open_writer(path, backend, fps, size, **encode_options))
+        else:
+            if audio_from and whole_video:
+                encode_options['audio_from'] = audio_from
+            out = open_writer(output_path, backend, fps, size, **encode_options)
+
+        total_frames = info['frames']
+        if end_frame is not None:
+            total_frames = min(end_frame, total_frames) if total_frames > 0 else end_frame
+        total_frames = max(total_frames - start_frame, 0)
+        done_frames = journal.frames_done if journal else 0
+        reader = open_reader(target_path, backend, info, start_frame + done_frames)
+        limit = None if end_frame is None else end_frame - start_frame - done_frames
+
+        metrics = self.metrics
+        was_tracing = metrics.trace
+        if options.trace_path:
+            metrics.trace = True
+
+        def read_frames():
+            count = 0
+            while limit is None or count < limit:
+                with metrics.timer('decode'):
+                    frame = reader.read(pool.acquire())
+                if frame is None:
+                    break
+                count += 1
+                yield frame
+
+        progress = callback
+        if callback and done_frames:
+            def progress(cur, total):
+                callback(done_frames + cur, total_frames)
+
+        # Tracking and ROI detection are stateful, so they run in order on the decoder thread
+        detect_fn = None
+        if options.roi_detect:
+            detect_fn = RoiDetector(self.detect_faces, full_scan_interval=options.full_scan_interval,
+                                    min_face=self.min_face).update
+        if options.track:
+            detect_fn = FaceTracker(detect_fn or self.detect_faces, keyframe_interval=options.keyframe_interval).update
+        identify = None
+        if face_index is not None:
+            # Identities follow faces from frame to frame: workers detect in parallel, then take
+            # turns assigning them (and recognizing new faces) in frame order
+            matcher = IdentityMatcher(face_index, self.embed_faces, recheck_interval=options.recheck_interval)
+            ordered = OrderedSection()
+
+            def identify(frames, located, first_index):
+                assigned = []
+                with ordered.turn(first_index, len(frames)):
+                    for frame, faces in zip(frames, located):
+                        if faces is not REPEAT_FRAME:
+                            try:
+                                with metrics.timer('identify'):
+                                    faces = matcher.assign(frame, faces)
+                            except Exception as e:
+                                metrics.error('locate_failures', e)
+                                faces = []  # Nobody recognized: the frame is written out unchanged
+                        assigned.append(faces)
+                return assigned
+
+        # Decoder-side duplicate flags, consumed in the same frame order by the writer
+        dedup = DuplicateFrameFilter(options.duplicate_threshold) if options.skip_duplicates else None
+        repeats = deque()
+        last_written = None
+        frame_count = itertools.count()  # Frame index within this run, for the enhancer's cadence
+
+        def prepare_fn(frame):
+            index = next(frame_count)
+            if dedup is not None:
+                repeat = dedup.is_duplicate(frame)
+                repeats.append(repeat)
+                if repeat:
+                    metrics.incr('frames_duplicate')
+                    return frame, REPEAT_FRAME, index
+            if detect_fn is None:
+                return frame, None, index
+            try:
+                with metrics.timer('locate'):
+                    faces = detect_fn(frame)
+            except Exception as e:
+                # Not worth the whole video: the worker runs a full detection of this frame instead
+                metrics.error('locate_failures', e)
+                faces = None
+            return frame, faces, index
+
+        last_preview = 0.0
+
+        def write_fn(frame):
+            nonlocal last_written, last_preview
+            repeat = dedup is not None and repeats.popleft() and last_written is not None
+            output = last_written if repeat else frame
+            with metrics.timer('encode'):
+                out.write(output)
+            metrics.incr('frames_written')
+            if preview_fn is not None and time.perf_counter() - last_preview >= options.preview_interval:
+                last_preview = time.perf_counter()
+                preview_fn(thumbnail(output, options.preview_size))  # A copy, the buffer goes back to the pool
+
+            if repeat or dedup is None:
+                pool.release(frame)  # Writers are synchronous, the buffer is free again
+            else:
+                pool.release(last_written)  # Keep this output until the next fresh frame
+                last_written = frame
+
+        sequence = None
+        if options.enhance:
+            from core.face_enhancer import SequenceEnhancer
+            sequence = SequenceEnhancer(self.get_enhancer(), every_n=options.enhance_every, blend=options.enhance_blend)
+        pipeline = VideoPipeline(lambda items: self.swap_frames(items, source_face, sequence=sequence,
+                                                                identify=identify),
+                                 num_workers=options.num_workers, max_inflight=max_inflight,
+                                 prepare_fn=prepare_fn, batch_size=batch_size)
+        pool = FramePool((size[1], size[0], 3), pipeline.max_inflight + spare)
+        try:
+            pipeline.run(read_frames(), write_fn, callback=progress, total=total_frames)
+            if journal:
+                out.close()
+        finally:
+            reader.release()
+            out.release()
+        if journal:
+            journal.finalize(audio_source=audio_from if whole_video else None)
+        if options.trace_path:
+            metrics.trace = was_tracing
+            metrics.dump_trace(options.trace_path)
+
+    def swap_frames(self, items, source_face, sequence=None, identify=None):
+        """
+        Swap source_face onto a micro-batch of (frame, target_faces) items.
+        target_faces may be None, in which case the frame is detected here.
+        With source_face=None the faces' own 'source' (set by
+        IdentityMatcher) is used, and faces without one are left alone.
+        identify(frames, faces, first_index), if given, returns the detected
+        faces with their 'source' assigned.
+        With a SequenceEnhancer or identify, items carry their frame index,
+        (frame, target_faces, index), and every micro-batch of the video must
+        pass through this call.
+        A frame whose swap fails is written out unchanged; the others in the
+        batch are still swapped.
+        """
+        frames = [item[0] for item in items]
+        located = []
+        for frame, target_faces, *_ in items:
+            if target_faces is None:
+                try:
+                    target_faces = self.detect_faces(frame)
+                except Exception as e:
+                    self.metrics.error('swap_failures', e)
+                    target_faces = []
+            located.append(target_faces)
+        if identify is not None:
+            located = identify(frames, located, items[0][2])
+        frame_jobs = []  # Per frame: the (frame, target_face, source_face) jobs to swap
+        for frame, target_faces in zip(frames, located):
+            try:
+                frame_jobs.append(self._frame_jobs(frame, target_faces, source_face))
+            except Exception as e:
+                self.metrics.error('swap_failures', e)
+                frame_jobs.append([])
+        try:
+            self.swap_batch([job for jobs in frame_jobs for job in jobs])
+        except Exception:
+            # Don't let one bad frame cost the whole batch: retry frame by frame
+            for i, jobs in enumerate(frame_jobs):
+                try:
+                    self.swap_batch(jobs)
+                except Exception as e:
+                    self.metrics.error('swap_failures', e)
+                    frame_jobs[i] = []
+        if sequence is not None:
             try:
-                # Auto select first face or match by position
-                target_faces = self.get_faces(frame)
-                if target_faces:
-                    # Use the face closest to the source face position
-                    source_face = source_faces[0]
-                    target_face = min(target_faces, key=lambda f: abs(f.bbox[0] - source_face.bbox[0]))
-                    
-                    frame = self.swap_model.get(frame, target_face, source_face, paste_back=True)
-            except:
-                pass  # Keep original frame if swap fails
-                
-            out.write(frame)
-            
-            current_frame += 1
-            if callback:
-                callback(current_frame, total_frames)
-        
-        cap.release()
-        out.release()
+                with self.metrics.timer('enhance'):
+                    sequence.enhance([[(frame, face) for frame, face, _ in jobs] for jobs in frame_jobs],
+                                     first_index=items[0][2])
+            except Exception as e:
+                self.metrics.error('enhance_failures', e, len(items))  # Keep the swapped, unrestored frames
+        return frames
+
+    def _frame_jobs(self, frame, target_faces, source_face):
+        """swap_batch jobs for one video frame"""
+        if target_faces is REPEAT_FRAME:
+            return []  # process_video writes the previous output instead
+        if source_face is None:
+            # Identity mapping: every recognized face gets its own source
+            jobs = [(frame, f, f['source']) for f in target_faces or [] if f.get('source') is not None]
+        elif target_faces:
+            # Use the face closest to the source face position
+            target_face = min(target_faces, key=lambda f: abs(f.bbox[0] - source_face.bbox[0]))
+            jobs = [(frame, target_face, source_face)]
+        else:
+            jobs = []
+        if not jobs:
+            self.metrics.incr('frames_no_face')  # Written out unchanged
+        return jobs
+
+
+class PasteBuffers:
+    """Scratch arrays reused between paste-backs, grown on demand"""
+
+    def __init__(self):
+        self._store = {}
+
+    def get(self, name, shape, dtype):
+        n = int(np.prod(shape))
+        buf = self._store.get(name)
+        if buf is None or buf.size < n or buf.dtype != dtype:
+            buf = np.empty(n, dtype=dtype)
+            self._store[name] = buf
+        return buf[:n].reshape(shape)  # Contiguous view, safe as an OpenCV dst
+
+
+_paste_local = threading.local()
+
+
+def _paste_buffers():
+    buffers = getattr(_paste_local, 'buffers', None)
+    if buffers is None:
+        buffers = _paste_local.buffers = PasteBuffers()
+    return buffers
+
+
+def paste_back(target_img, bgr_fake, M, margin=0.1):
+    """
+    Blend an aligned swapped face back into target_img (in place).
+
+    Same mask as insightface's paste-back (eroded, blurred warp of the crop),
+    but everything is warped into the face bbox plus a margin instead of the
+    whole frame, scratch buffers are reused per thread, and the mask and
+    blend stay in uint8/uint16 instead of full-frame float32.
+    """
+    h, w = target_img.shape[:2]
+    size = bgr_fake.shape[0]
+    IM = cv2.invertAffineTransform(M)
+
+    # Bounding box of the crop in frame coordinates, padded and clipped
+    corners = np.array([[0, 0], [size, 0], [0, size], [size, size]], dtype=np.float32)
+    corners = corners @ IM[:, :2].T + IM[:, 2]
+    x1, y1 = np.floor(corners.min(axis=0)).astype(int)
+    x2, y2 = np.ceil(corners.max(axis=0)).astype(int)
+    pad = int(max(x2 - x1, y2 - y1) * margin) + 2
+    x1, y1 = max(x1 - pad, 0), max(y1 - pad, 0)
+    x2, y2 = min(x2 + pad, w), min(y2 + pad, h)
+    if x2 <= x1 or y2 <= y1:
+        return target_img  # Face entirely outside the frame
+    rw, rh = x2 - x1, y2 - y1
+    IM_roi = IM.copy()
+    IM_roi[:, 2] -= (x1, y1)
+
+    buffers = _paste_buffers()
+    white = buffers.get('white', (size, size), np.uint8)
+    white.fill(255)
+    fake = buffers.get('fake', (rh, rw, 3), np.uint8)
+    mask = buffers.get('mask', (rh, rw), np.uint8)
+    cv2.warpAffine(bgr_fake, IM_roi, (rw, rh), dst=fake, borderValue=0)
+    cv2.warpAffine(white, IM_roi, (rw, rh), dst=mask, borderValue=0)
+    cv2.threshold(mask, 20, 255, cv2.THRESH_BINARY, dst=mask)
+
+    _, _, mask_w, mask_h = cv2.boundingRect(mask)
+    if mask_w == 0 or mask_h == 0:
+        return target_img
+    mask_size = int(np.sqrt((mask_h - 1) * (mask_w - 1)))
+    k = max(mask_size // 10, 10)
+    cv2.erode(mask, np.ones((k, k), np.uint8), dst=mask, iterations=1)
+    k = max(mask_size // 20, 5)
+    cv2.GaussianBlur(mask, (2 * k + 1, 2 * k + 1), 0, dst=mask)
+
+    # roi = (fake * m + roi * (255 - m)) / 255, in uint16 fixed point
+    roi = target_img[y1:y2, x1:x2]
+    m = buffers.get('m16', (rh, rw, 1), np.uint16)
+    acc = buffers.get('acc', (rh, rw, 3), np.uint16)
+    tmp = buffers.get('tmp', (rh, rw, 3), np.uint16)
+    np.copyto(m, mask[..., None])
+    np.multiply(fake, m, out=acc)
+    np.subtract(255, m, out=m)
+    np.multiply(roi, m, out=tmp)
+    acc += tmp
+    acc += 127
+    acc //= 255
+    np.copyto(roi, acc, casting='unsafe')
+    return target_img
 
 # Global instance
 swapper = None
@@ -0,0 +1,89 @@
+# core/face_tracker.py
+import cv2
+import numpy as np
+from insightface.app.common import Face
+
+LK_PARAMS = dict(winSize=(21, 21), maxLevel=3,
+                 criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03))
+
+
+class FaceTracker:
+    """
+    Detect-once-then-track for video.
+
+    Full detection only runs on keyframes (every `keyframe_interval` frames,
+    or as soon as tracking confidence drops below `min_confidence`). In
+    between, each face's bbox and 5-point kps are carried forward with
+    pyramidal Lucas-Kanade optical flow and a similarity transform.
+    """
+
+    def __init__(self, detect_fn, keyframe_interval=5, min_confidence=0.6, fb_threshold=1.0, grid=4):
+        self.detect_fn = detect_fn
+        self.keyframe_interval = max(1, int(keyframe_interval))
+        self.min_confidence = min_confidence
+        self.fb_threshold = fb_threshold
+        self.grid = grid
+        self.reset()
+
+    def reset(self):
+        self.prev_gray = None
+        self.faces = []
+        self.since_keyframe = 0
+        self.keyframes = 0
+        self.tracked_frames = 0
+
+    def update(self, frame):
+        """Return the faces of `frame`, detecting or tracking as needed"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        faces = None
+        if self.prev_gray is not None and self.faces and self.since_keyframe < self.keyframe_interval:
+            faces = self._track(self.prev_gray, gray)
+
+        if faces is None:
+            faces = self.detect_fn(frame)
+            self.since_keyframe = 0
+            self.keyframes += 1
+        else:
+            self.tracked_frames += 1
+
+        self.since_keyframe += 1
+        self.prev_gray = gray
+        self.faces = faces
+        return faces
+
+    def _track(self, prev_gray, gray):
+        tracked = []
+        for face in self.faces:
+            p0 = self._points(face)
+            p1, st, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, p0, None, **LK_PARAMS)
+            if p1 is None:
+                return None
+            # Forward-backward check rejects points that drifted
+            p0r, st_back, _ = cv2.calcOpticalFlowPyrLK(gray, prev_gray, p1, None, **LK_PARAMS)
+            fb_err = np.linalg.norm((p0 - p0r).reshape(-1, 2), axis=1)
+            good = (st.ravel() == 1) & (st_back.ravel() == 1) & (fb_err < self.fb_threshold)
+            if good.mean() < self.min_confidence or good.sum() < 3:
+                return None  # Confidence dropped -> force a keyframe
+
+            M, _ = cv2.estimateAffinePartial2D(p0[good], p1[good])
+            if M is None:
+                return None
+            tracked.append(self._apply(face, M))
+        return tracked
+
+    def _points(self, face):
+        x1, y1, x2, y2 = face.bbox
+        xs = np.linspace(x1, x2, self.grid + 2)[1:-1]
+        ys = np.linspace(y1, y2, self.grid + 2)[1:-1]
+        grid = np.array([(x, y) for y in ys for x in xs], dtype=np.float32)
+        pts = np.vstack([face.kps.astype(np.float32), grid])
+        return pts.reshape(-1, 1, 2)
+
+    @staticmethod
+    def _apply(face, M):
+        kps = cv2.transform(face.kps.reshape(-1, 1, 2).astype(np.float32), M).reshape(-1, 2)
+        x1, y1, x2, y2 = face.bbox
+        corners = np.array([[x1, y1], [x2, y1], [x1, y2], [x2, y2]], dtype=np.float32)
+        corners = cv2.transform(corners.reshape(-1, 1, 2), M).reshape(-1, 2)
+        bbox = np.array([*corners.min(axis=0), *corners.max(axis=0)], dtype=np.float32)
+        return Face(bbox=bbox, kps=kps, det_score=face.det_score)
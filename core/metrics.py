@@ -0,0 +1,105 @@
+# core/metrics.py
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Metrics:
+    """
+    Per-stage timers and event counters, safe to update from many threads.
+
+    Stages (decode, detect, swap, paste, encode, ...) accumulate call count,
+    total and max time. With tracing on, every timed call is also kept as a
+    Chrome trace event (chrome://tracing or ui.perfetto.dev) so the pipeline
+    threads can be seen side by side.
+    """
+
+    def __init__(self, trace=False, max_events=200000):
+        self.trace = trace
+        self.max_events = max_events
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}  # name -> [count, total seconds, max seconds]
+            self.counters = {}
+            self.events = []
+            self.errors = {}  # Exception type -> last message
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, start)
+
+    def observe(self, stage, seconds, start=None):
+        with self._lock:
+            entry = self.stages.get(stage)
+            if entry is None:
+                entry = self.stages[stage] = [0, 0.0, 0.0]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+            if self.trace and len(self.events) < self.max_events:
+                begin = (start if start is not None else time.perf_counter() - seconds) - self._origin
+                self.events.append({'name': stage, 'ph': 'X', 'ts': round(begin * 1e6, 1),
+                                    'dur': round(seconds * 1e6, 1), 'pid': os.getpid(),
+                                    'tid': threading.get_ident()})
+
+    def incr(self, counter, n=1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def error(self, counter, exc, n=1):
+        """Count a failure that is otherwise swallowed and remember its last message"""
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + n
+            self.errors[type(exc).__name__] = str(exc)
+
+    def snapshot(self):
+        with self._lock:
+            stages = {name: {'count': c, 'total_s': round(t, 6), 'mean_ms': round(t / c * 1000, 3) if c else 0.0,
+                             'max_ms': round(m * 1000, 3)}
+                      for name, (c, t, m) in self.stages.items()}
+            return {'stages': stages, 'counters': dict(self.counters), 'errors': dict(self.errors)}
+
+    def chrome_trace(self):
+        with self._lock:
+            events = list(self.events)
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def dump_trace(self, path):
+        _write_json(path, self.chrome_trace())
+        return path
+
+    def dump_json(self, path):
+        _write_json(path, self.snapshot())
+        return path
+
+    def prometheus(self, prefix="facereenact"):
+        """Prometheus text exposition format"""
+        snap = self.snapshot()
+        lines = [f"# HELP {prefix}_stage_seconds Time spent per pipeline stage",
+                 f"# TYPE {prefix}_stage_seconds summary"]
+        for name, s in sorted(snap['stages'].items()):
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {s["total_s"]}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {s["count"]}')
+        lines += [f"# HELP {prefix}_stage_seconds_max Slowest call per pipeline stage",
+                  f"# TYPE {prefix}_stage_seconds_max gauge"]
+        for name, s in sorted(snap['stages'].items()):
+            lines.append(f'{prefix}_stage_seconds_max{{stage="{name}"}} {s["max_ms"] / 1000}')
+        for name, value in sorted(snap['counters'].items()):
+            lines += [f"# TYPE {prefix}_{name}_total counter", f"{prefix}_{name}_total {value}"]
+        return "\n".join(lines) + "\n"
+
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
@@ -0,0 +1,420 @@
+# core/segments.py
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import cv2
+
+from core.video_io import probe, resolve_backend
+
+HEARTBEAT_S = 30  # Workers touch their claimed task this often
+STALE_AFTER_S = 300  # A claimed task not touched for this long belongs to a dead worker
+PROCESS_MEMORY_MB = 1536  # Rough footprint of one worker process: its own copy of every model plus ORT arenas
+
+
+def keyframe_indices(path):
+    """Display-order frame indices of the video's keyframes (empty without ffprobe)"""
+    if shutil.which("ffprobe") is None:
+        return []
+    cmd = ["ffprobe", "-v", "error", "-select_streams", "v:0",
+           "-show_entries", "packet=pts,flags", "-of", "csv=p=0", path]
+    try:
+        out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return []
+    packets = []
+    for line in out.splitlines():
+        parts = line.strip().split(",")
+        if len(parts) < 2 or parts[0] in ("", "N/A"):
+            continue
+        packets.append((int(parts[0]), "K" in parts[1]))
+    packets.sort()  # Packets come in decode order, frames are numbered in display order
+    return [i for i, (_, key) in enumerate(packets) if key]
+
+
+def plan_segments(total_frames, num_segments, keyframes=None):
+    """
+    Split [0, total_frames) into up to num_segments (start, end) ranges,
+    snapping each cut to the nearest keyframe when keyframes are known.
+    The last segment's end is None so it always runs to the real end of
+    the stream, whatever the container claims.
+    """
+    if total_frames <= 0 or num_segments <= 1:
+        return [(0, None)]
+    bounds = [0]
+    for i in range(1, num_segments):
+        cut = total_frames * i // num_segments
+        if keyframes:
+            cut = min(keyframes, key=lambda k: abs(k - cut))
+        if bounds[-1] < cut < total_frames:
+            bounds.append(cut)
+    return list(zip(bounds, bounds[1:] + [None]))
+
+
+def concat_segments(paths, output_path, audio_source=None):
+    """
+    Join segment files in order; stream copy with ffmpeg when available.
+    audio_source, if given, is a file whose audio stream is copied in.
+    """
+    if len(paths) == 1 and not audio_source:
+        shutil.copyfile(paths[0], output_path)
+        return
+    if shutil.which("ffmpeg"):
+        list_path = output_path + ".concat.txt"
+        with open(list_path, "w") as f:
+            for path in paths:
+                escaped = os.path.abspath(path).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+        cmd = ["ffmpeg", "-y", "-v", "error", "-f", "concat", "-safe", "0", "-i", list_path]
+        if audio_source:
+            cmd += ["-i", audio_source, "-map", "0:v", "-map", "1:a?", "-shortest"]
+        try:
+            subprocess.run(cmd + ["-c", "copy", output_path], check=True)
+        finally:
+            os.remove(list_path)
+        return
+
+    print("⚠ ffmpeg not found, re-encoding segments with OpenCV (not lossless)")
+    out = None
+    for path in paths:
+        cap = cv2.VideoCapture(path)
+        if out is None:
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+            out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            out.write(frame)
+        cap.release()
+    if out is not None:
+        out.release()
+
+
+def default_processes(process_memory_mb=PROCESS_MEMORY_MB):
+    """One worker process per core, but no more full model copies than fit in the free memory"""
+    import psutil
+
+    fit = int(psutil.virtual_memory().available // (process_memory_mb * 2**20))
+    return max(1, min(os.cpu_count() or 1, fit))
+
+
+_swappers = {}  # Swapper options (JSON) -> FaceSwapper, reused by the tasks this process runs
+
+
+def _get_swapper(options):
+    from core.face_swapper import FaceSwapper
+
+    key = json.dumps(options, sort_keys=True)
+    if key not in _swappers:
+        _swappers[key] = FaceSwapper(**options)
+    return _swappers[key]
+
+
+def run_segment(task):
+    """Process one segment task in this process with its own FaceSwapper"""
+    swapper = _get_swapper(task.get('swapper', {}))
+    root, ext = os.path.splitext(task['output'])
+    partial = f"{root}.part{ext}"  # Keep the extension, VideoWriter picks the container from it
+    swapper.process_video(task['source'], task['target'], partial,
+                          start_frame=task['start'], end_frame=task['end'], **task.get('options', {}))
+    if task.get('job') and _plan_job(os.path.dirname(task['output'])) != task['job']:
+        # The job was restarted with a different plan while this segment ran
+        os.remove(partial)
+        raise RuntimeError(f"Segment {task['index']} belongs to a superseded plan, discarded")
+    os.replace(partial, task['output'])
+    return task
+
+
+class SegmentQueue:
+    """
+    Task queue in a shared directory, a stand-in for spreading segments over
+    several machines. Tasks are JSON files that move pending/ -> claimed/ ->
+    done/ (or failed/); os.rename is atomic, so only one worker claims each.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        for name in ("pending", "claimed", "done", "failed"):
+            os.makedirs(os.path.join(self.root, name), exist_ok=True)
+
+    def _path(self, state, name):
+        return os.path.join(self.root, state, name)
+
+    def submit(self, task):
+        name = f"{task['job']}_{task['index']:05d}.json"
+        tmp = os.path.join(self.root, f".{name}.{uuid.uuid4().hex}")
+        with open(tmp, "w") as f:
+            json.dump(task, f)
+        os.replace(tmp, self._path("pending", name))
+        return name
+
+    def claim(self):
+        """Claim the next pending task, or return (None, None) if there is none"""
+        for name in sorted(os.listdir(os.path.join(self.root, "pending"))):
+            try:
+                os.rename(self._path("pending", name), self._path("claimed", name))
+            except OSError:
+                continue  # Another worker got it first
+            os.utime(self._path("claimed", name))  # Claim time, for requeue_stale
+            with open(self._path("claimed", name)) as f:
+                return name, json.load(f)
+        return None, None
+
+    def finish(self, name, task, error=None):
+        state = "failed" if error else "done"
+        if error:
+            task = dict(task, error=error)
+        with open(self._path("claimed", name), "w") as f:
+            json.dump(task, f)
+        os.replace(self._path("claimed", name), self._path(state, name))
+
+    def results(self, job):
+        """(done, failed) task lists for a job"""
+        out = []
+        for state in ("done", "failed"):
+            tasks = []
+            for name in sorted(os.listdir(os.path.join(self.root, state))):
+                if name.startswith(f"{job}_"):
+                    with open(self._path(state, name)) as f:
+                        tasks.append(json.load(f))
+            out.append(tasks)
+        return out
+
+    def touch(self, name):
+        """Heartbeat for a claimed task, so requeue_stale leaves it alone"""
+        try:
+            os.utime(self._path("claimed", name))
+        except OSError:
+            pass
+
+    def requeue_stale(self, max_age):
+        """Put back tasks claimed or last touched more than max_age seconds ago (crashed workers)"""
+        now = time.time()
+        requeued = 0
+        for name in os.listdir(os.path.join(self.root, "claimed")):
+            path = self._path("claimed", name)
+            try:
+                if now - os.path.getmtime(path) > max_age:
+                    os.rename(path, self._path("pending", name))
+                    requeued += 1
+            except OSError:
+                continue
+        return requeued
+
+    def pending(self, job):
+        return sum(name.startswith(f"{job}_") for name in os.listdir(os.path.join(self.root, "pending")))
+
+    def discard(self, match):
+        """Delete every task, in any state, for which match(task) is true"""
+        for state in ("pending", "claimed", "done", "failed"):
+            for name in os.listdir(os.path.join(self.root, state)):
+                path = self._path(state, name)
+                try:
+                    with open(path) as f:
+                        task = json.load(f)
+                    if match(task):
+                        os.remove(path)
+                except (OSError, ValueError):
+                    continue  # Moved by a worker meanwhile, or half written
+
+
+def run_worker(queue_dir, poll_interval=1.0, exit_when_idle=False, heartbeat=HEARTBEAT_S):
+    """Claim and process segment tasks from a SegmentQueue until stopped"""
+    queue = SegmentQueue(queue_dir)
+    while True:
+        name, task = queue.claim()
+        if name is None:
+            if exit_when_idle:
+                return
+            time.sleep(poll_interval)
+            continue
+        running = threading.Event()
+        beat = threading.Thread(target=_heartbeat, args=(queue, name, running, heartbeat), daemon=True)
+        beat.start()
+        try:
+            run_segment(task)
+            error = None
+        except Exception as e:
+            print(f"✗ Segment {task['index']} failed: {e}")
+            error = str(e)
+        finally:
+            running.set()
+            beat.join()
+        queue.finish(name, task, error=error)
+
+
+def _heartbeat(queue, name, stop, interval):
+    while not stop.wait(interval):
+        queue.touch(name)
+
+
+def process_video_sharded(source_path, target_path, output_path, num_processes=None, num_segments=None,
+                          queue_dir=None, local_workers=None, callback=None, timeout=None, intra_op_threads=None,
+                          model_variant='fp32', **options):
+    """
+    Split the target into keyframe-aligned segments, swap each in a separate
+    worker process with its own FaceSwapper, then concatenate them in order.
+
+    With queue_dir set, segments go through a SegmentQueue instead of a
+    local pool, so workers on other machines sharing that directory
+    (python -m core.segments worker <queue_dir>) can pick them up too.
+    `local_workers` worker processes are still started here (default
+    num_processes; pass 0 to rely on remote workers only).
+
+    num_processes defaults to one per core, capped by how many model copies
+    fit in free memory (PROCESS_MEMORY_MB each). The cores are split between
+    the processes, so each one's FaceSwapper gets cores // num_processes
+    inference threads unless `intra_op_threads` says otherwise.
+
+    Tasks claimed by a worker that stopped sending heartbeats are put back
+    in the queue; `timeout` (seconds) bounds the whole queued run.
+
+    Finished segment files are kept until the final join, so rerunning an
+    interrupted job with the same inputs only processes the missing ones.
+    """
+    num_processes = num_processes or default_processes()
+    # One inference thread per process by default; the processes are the parallelism
+    if options.get('num_workers') is None:
+        options['num_workers'] = 1
+    swapper = {'model_variant': model_variant,
+               'intra_op_threads': intra_op_threads or max(1, (os.cpu_count() or 1) // num_processes)}
+
+    backend = resolve_backend(options.get('backend', 'opencv'))
+    info = probe(target_path, backend)
+    segments = plan_segments(info['frames'], num_segments or num_processes, keyframe_indices(target_path))
+    seg_dir = os.path.abspath(output_path) + ".segments"
+    # The job id follows from the plan, so a rerun of the same job can recognize its leftover tasks
+    job = _prepare_segment_dir(seg_dir, [_file_key(source_path), _file_key(target_path), segments, model_variant,
+                                         options])
+    _, ext = os.path.splitext(output_path)
+    tasks = [{
+        'job': job,
+        'index': i,
+        'source': os.path.abspath(source_path),
+        'target': os.path.abspath(target_path),
+        'start': start,
+        'end': end,
+        'output': os.path.join(seg_dir, f"segment_{i:05d}{ext or '.mp4'}"),
+        'swapper': swapper,
+        'options': options,
+    } for i, (start, end) in enumerate(segments)]
+
+    todo = [t for t in tasks if not os.path.exists(t['output'])]
+    if len(todo) < len(tasks):
+        print(f"Resuming: {len(tasks) - len(todo)} of {len(tasks)} segments already done")
+    progress = None
+    if callback:
+        def progress(done, _):
+            callback(len(tasks) - len(todo) + done, len(tasks))
+
+    ctx = mp.get_context("spawn")  # Fresh interpreters, no forked ONNX sessions
+    if todo and queue_dir is None:
+        with ctx.Pool(min(num_processes, len(todo))) as pool:
+            for done, _ in enumerate(pool.imap_unordered(run_segment, todo), 1):
+                if progress:
+                    progress(done, len(todo))
+    elif todo:
+        _run_queued(todo, queue_dir, ctx, num_processes if local_workers is None else local_workers, progress,
+                    timeout=timeout)
+
+    # Segments are video-only; the target's audio goes back in at the join
+    keep_audio = backend == 'ffmpeg' and options.get('keep_audio', True) and info['has_audio']
+    concat_segments([t['output'] for t in tasks], output_path, target_path if keep_audio else None)
+    shutil.rmtree(seg_dir, ignore_errors=True)
+
+
+def _file_key(path):
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_size, stat.st_mtime]
+
+
+def _prepare_segment_dir(seg_dir, key):
+    """
+    Reuse seg_dir if it belongs to the same job, otherwise start it fresh.
+    Returns the job id, a digest of the output location and the plan.
+    """
+    plan_path = os.path.join(seg_dir, "plan.json")
+    key = json.loads(json.dumps(key))
+    job = hashlib.blake2b(json.dumps([seg_dir, key], sort_keys=True).encode(), digest_size=6).hexdigest()
+    try:
+        with open(plan_path) as f:
+            same_job = json.load(f) == {'job': job, 'key': key}
+    except (OSError, ValueError):
+        same_job = False
+    if not same_job:
+        shutil.rmtree(seg_dir, ignore_errors=True)
+        os.makedirs(seg_dir, exist_ok=True)
+        with open(plan_path, "w") as f:
+            json.dump({'job': job, 'key': key}, f)
+    return job
+
+
+def _plan_job(seg_dir):
+    """Job id recorded in seg_dir's plan, or None"""
+    try:
+        with open(os.path.join(seg_dir, "plan.json")) as f:
+            return json.load(f).get('job')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _run_queued(tasks, queue_dir, ctx, local_workers, callback, poll_interval=1.0, timeout=None,
+                stale_after=STALE_AFTER_S):
+    queue = SegmentQueue(queue_dir)
+    job = tasks[0]['job']
+    seg_dir = os.path.dirname(tasks[0]['output'])
+    # Tasks left over from an interrupted run of this output would write into the same segment files
+    queue.discard(lambda task: task.get('job') == job or os.path.dirname(task.get('output', '')) == seg_dir)
+    for task in tasks:
+        queue.submit(task)
+
+    def start_worker():
+        w = ctx.Process(target=run_worker, args=(queue_dir, poll_interval, True), daemon=True)
+        w.start()
+        return w
+
+    workers = [start_worker() for _ in range(local_workers)]
+    deadline = None if timeout is None else time.monotonic() + timeout
+    finished = False
+    try:
+        reported = 0
+        while True:
+            done, failed = queue.results(job)
+            if failed:
+                raise RuntimeError(f"Segment {failed[0]['index']} failed: {failed[0]['error']}")
+            if callback and len(done) != reported:
+                reported = len(done)
+                callback(reported, len(tasks))
+            if len(done) == len(tasks):
+                break
+            if queue.requeue_stale(stale_after):
+                print("⚠ Requeued segments from a worker that stopped responding")
+            # Local workers exit once the queue is empty; requeued tasks need a fresh one
+            if workers and queue.pending(job) and not any(w.is_alive() for w in workers):
+                workers.append(start_worker())
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"Sharded job did not finish within {timeout}s "
+                                   f"({len(done)} of {len(tasks)} segments done)")
+            time.sleep(poll_interval)
+        finished = True
+    finally:
+        for w in workers:
+            if not finished:
+                w.terminate()
+            w.join()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "worker":
+        run_worker(sys.argv[2])
+    else:
+        print("Usage: python -m core.segments worker <queue_dir>")
@@ -0,0 +1,274 @@
+# core/video_io.py
+import json
+import queue
+import shutil
+import subprocess
+from fractions import Fraction
+
+import cv2
+import numpy as np
+
+BACKENDS = ('opencv', 'ffmpeg')
+DEFAULT_ENCODE = {'codec': 'libx264', 'crf': 18, 'preset': 'ultrafast', 'pix_fmt': 'yuv420p'}
+
+
+def ffmpeg_available():
+    return shutil.which("ffmpeg") is not None and shutil.which("ffprobe") is not None
+
+
+def resolve_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown video backend '{backend}'. Choose from: {', '.join(BACKENDS)}")
+    if backend == 'ffmpeg' and not ffmpeg_available():
+        print("⚠ ffmpeg/ffprobe not found on PATH, falling back to OpenCV video I/O")
+        return 'opencv'
+    return backend
+
+
+def probe(path, backend='opencv'):
+    """
+    fps, width, height, frame count, whether there is an audio stream and
+    whether the frame rate is variable (vfr).
+    With ffmpeg, width and height are the displayed size: ffmpeg applies the
+    stream's rotation when decoding, so a portrait phone clip stored as
+    1920x1080 with a 90 degree rotation is read as 1080x1920 frames.
+    """
+    if backend == 'ffmpeg':
+        # Whole stream sections: where the rotation lives varies across ffprobe versions
+        cmd = ["ffprobe", "-v", "error", "-show_streams", "-of", "json", path]
+        streams = json.loads(subprocess.run(cmd, capture_output=True, text=True, check=True).stdout)['streams']
+        video = next(s for s in streams if s['codec_type'] == 'video')
+        num, den = video['r_frame_rate'].split('/')
+        # ffprobe's average rate only differs from the stream's base rate when frames are unevenly spaced
+        average = video.get('avg_frame_rate', '0/0')
+        vfr = not average.endswith('/0') and Fraction(average) != Fraction(video['r_frame_rate'])
+        frames = video.get('nb_frames')
+        width, height = int(video['width']), int(video['height'])
+        if _rotation(video) % 180 == 90:
+            width, height = height, width
+        info = {'fps': float(num) / float(den or 1), 'width': width, 'height': height,
+                'frames': int(frames) if frames and frames.isdigit() else 0,
+                'has_audio': any(s['codec_type'] == 'audio' for s in streams), 'vfr': vfr}
+        if not info['frames']:
+            info['frames'] = _opencv_probe(path)['frames']  # Some containers don't store nb_frames
+        return info
+    return _opencv_probe(path)
+
+
+def _rotation(stream):
+    """Rotation in degrees from ffprobe's display matrix side data or the older 'rotate' tag"""
+    for side_data in stream.get('side_data_list', []):
+        if 'rotation' in side_data:
+            return int(float(side_data['rotation']))
+    return int(float(stream.get('tags', {}).get('rotate', 0)))
+
+
+def _opencv_probe(path):
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise FileNotFoundError(f"Target video not found: {path}")
+    info = {'fps': cap.get(cv2.CAP_PROP_FPS), 'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), 'frames': int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+            'has_audio': False, 'vfr': False}
+    cap.release()
+    return info
+
+
+REPEAT_FRAME = object()  # Marks a frame whose previous output is written again
+
+
+class DuplicateFrameFilter:
+    """
+    Flags frames nearly identical to the last kept frame (slides, freeze
+    frames, telecine repeats) from a tiny downsampled thumbnail: the mean
+    absolute difference must stay under `threshold` grey levels. Comparing
+    against the last kept frame, not the previous one, means slow fades
+    still trigger a new swap once they have drifted far enough.
+    """
+
+    def __init__(self, threshold=1.0, size=(64, 36), max_repeat=None):
+        self.threshold = threshold
+        self.size = size
+        self.max_repeat = max_repeat  # Force a fresh swap after this many repeats in a row
+        self.anchor = None
+        self.repeats = 0
+        self.duplicates = 0
+
+    def is_duplicate(self, frame):
+        thumb = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA).astype(np.int16)
+        if (self.anchor is not None and np.abs(thumb - self.anchor).mean() < self.threshold
+                and (self.max_repeat is None or self.repeats < self.max_repeat)):
+            self.repeats += 1
+            self.duplicates += 1
+            return True
+        self.anchor = thumb
+        self.repeats = 0
+        return False
+
+
+def thumbnail(frame, max_side):
+    """Downscaled copy with the longer side at most max_side (a copy even if already small)"""
+    h, w = frame.shape[:2]
+    scale = max_side / float(max(h, w))
+    if scale >= 1:
+        return frame.copy()
+    return cv2.resize(frame, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+
+
+def budget_frames(memory_budget_mb, shape, spare=0):
+    """
+    Frames that may be in flight under a memory budget for frame buffers of
+    the given shape, after the `spare` buffers kept besides them. Raises
+    ValueError when the budget can't hold even one frame in flight.
+    """
+    frame_bytes = int(np.prod(shape))
+    frames = int(memory_budget_mb * 2**20 // frame_bytes) - spare
+    if frames < 1:
+        needed = -(-(spare + 1) * frame_bytes // 2**20)  # Round up
+        raise ValueError(f"Memory budget of {memory_budget_mb} MB is too small for {shape[1]}x{shape[0]} "
+                         f"frames: needs at least {needed} MB")
+    return frames
+
+
+class FramePool:
+    """
+    Frame buffers handed to the reader and given back once the frame has been
+    written, so a long video keeps reusing the same few arrays instead of
+    allocating one per frame. Never blocks: if every buffer is in use a new
+    one is allocated, and at most `count` are kept for reuse.
+    """
+
+    def __init__(self, shape, count):
+        self.shape = tuple(shape)
+        self.count = max(1, int(count))
+        self._free = queue.LifoQueue()  # Most recently used first, still warm in cache
+
+    def acquire(self):
+        try:
+            return self._free.get_nowait()
+        except queue.Empty:
+            return np.empty(self.shape, dtype=np.uint8)
+
+    def release(self, frame):
+        if frame is not None and frame.shape == self.shape and self._free.qsize() < self.count:
+            self._free.put(frame)
+
+
+class OpenCVReader:
+    def __init__(self, path, start_frame=0):
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise FileNotFoundError(f"Target video not found: {path}")
+        if start_frame > 0:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+    def read(self, out=None):
+        """Next frame or None; decoded into `out` when it has the right shape"""
+        ret, frame = self.cap.read(out) if out is not None else self.cap.read()
+        return frame if ret else None
+
+    def release(self):
+        self.cap.release()
+
+
+class OpenCVWriter:
+    def __init__(self, path, fps, size, fourcc='mp4v'):
+        self.out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, size)
+
+    def write(self, frame):
+        self.out.write(frame)
+
+    def release(self):
+        self.out.release()
+
+
+class FFmpegReader:
+    """
+    Decode with an ffmpeg subprocess, reading raw BGR frames straight into
+    numpy arrays. A constant frame rate video starts at start_frame through
+    an input seek to its timestamp. That timestamp is wrong for a variable
+    frame rate (vfr) video, so there the frames before start_frame are
+    decoded and dropped by a trim filter instead.
+    """
+
+    def __init__(self, path, width, height, fps, start_frame=0, vfr=False):
+        self.shape = (height, width, 3)
+        self.frame_bytes = width * height * 3
+        cmd = ["ffmpeg", "-v", "error", "-nostdin"]
+        if start_frame > 0 and not vfr:
+            cmd += ["-ss", f"{start_frame / fps:.6f}"]  # Exact for constant frame rates: decodes from the keyframe before
+        cmd += ["-i", path, "-map", "0:v:0"]
+        if start_frame > 0 and vfr:
+            cmd += ["-vf", f"trim=start_frame={start_frame}"]  # Counts decoded frames, whatever their timestamps
+        cmd += ["-f", "rawvideo", "-pix_fmt", "bgr24", "-vsync", "passthrough", "-"]
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=self.frame_bytes)
+
+    def read(self, out=None):
+        frame = out if out is not None and out.shape == self.shape else np.empty(self.shape, dtype=np.uint8)
+        view = memoryview(frame).cast('B')
+        got = 0
+        while got < self.frame_bytes:
+            n = self.proc.stdout.readinto(view[got:])
+            if not n:
+                return None  # End of stream (a truncated last frame is dropped)
+            got += n
+        return frame
+
+    def release(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.stdout.close()
+        self.proc.wait()
+
+
+class FFmpegWriter:
+    """
+    Encode through an ffmpeg subprocess fed raw BGR frames on stdin.
+    Codec, CRF and preset are configurable; with audio_from set, that file's
+    audio stream is copied into the output without re-encoding. 4:2:0
+    pixel formats need even dimensions, so odd-sized frames get one black
+    row or column of padding.
+    """
+
+    def __init__(self, path, fps, size, codec=None, crf=None, preset=None, pix_fmt=None, audio_from=None):
+        opts = dict(DEFAULT_ENCODE)
+        opts.update({k: v for k, v in dict(codec=codec, crf=crf, preset=preset, pix_fmt=pix_fmt).items() if v is not None})
+        width, height = size
+        self.frame_bytes = width * height * 3
+        cmd = ["ffmpeg", "-v", "error", "-y", "-f", "rawvideo", "-pix_fmt", "bgr24",
+               "-s", f"{width}x{height}", "-r", f"{fps}", "-i", "-"]
+        if audio_from:
+            cmd += ["-i", audio_from, "-map", "0:v:0", "-map", "1:a?", "-c:a", "copy", "-shortest"]
+        if (width % 2 or height % 2) and ('420' in opts['pix_fmt'] or opts['pix_fmt'] in ('nv12', 'nv21')):
+            print(f"⚠ {width}x{height} is odd-sized, padding to even dimensions for {opts['pix_fmt']}")
+            cmd += ["-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2"]
+        cmd += ["-c:v", opts['codec'], "-pix_fmt", opts['pix_fmt']]
+        if opts['codec'] in ('libx264', 'libx265'):
+            cmd += ["-preset", str(opts['preset']), "-crf", str(opts['crf'])]
+        cmd.append(path)
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+
+    def write(self, frame):
+        # Hand the frame's own buffer to the pipe, no bytes() copy
+        self.proc.stdin.write(memoryview(np.ascontiguousarray(frame)).cast('B'))
+
+    def release(self):
+        if self.proc.stdin and not self.proc.stdin.closed:
+            try:
+                self.proc.stdin.close()
+            except BrokenPipeError:
+                pass
+        if self.proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg encoder exited with code {self.proc.returncode}")
+
+
+def open_reader(path, backend, info, start_frame=0):
+    if backend == 'ffmpeg':
+        return FFmpegReader(path, info['width'], info['height'], info['fps'], start_frame, info.get('vfr', False))
+    return OpenCVReader(path, start_frame)
+
+
+def open_writer(path, backend, fps, size, **encode_options):
+    if backend == 'ffmpeg':
+        return FFmpegWriter(path, fps, size, **encode_options)
+    return OpenCVWriter(path, fps, size)
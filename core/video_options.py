@@ -0,0 +1,60 @@
+# core/video_options.py
+from dataclasses import asdict, dataclass, fields
+
+
+@dataclass
+class VideoOptions:
+    """
+    Settings of a FaceSwapper.process_video job. Plain values only, so a job
+    file, CLI flags or a form can be turned into one with from_dict().
+    """
+
+    # Pipeline: inference workers, micro-batches and the frames in flight
+    num_workers: int = None  # Default: default_workers()
+    batch_size: int = 4  # Shrinks to fit under max_inflight
+    max_inflight: int = None  # Frames decoded but not yet written; default keeps every worker busy
+    memory_budget_mb: float = None  # Derives max_inflight from a budget for all frame buffers
+
+    # Reading and writing
+    backend: str = 'opencv'  # 'ffmpeg' streams frames through ffmpeg pipes
+    encode_options: dict = None  # codec/crf/preset, see open_writer
+    keep_audio: bool = True  # Copy the target's audio track (ffmpeg backend, whole videos)
+
+    # Range and checkpoints: with checkpoint_every=N the output is journaled
+    # in chunks of N frames and a rerun of the same job resumes after the last one
+    start_frame: int = 0
+    end_frame: int = None
+    checkpoint_every: int = None
+
+    # Locating faces. Tracking and ROI detection fall back to a full detection on failure
+    track: bool = False  # Detect on keyframes only, follow faces with optical flow in between
+    keyframe_interval: int = 5
+    roi_detect: bool = False  # Re-detect around the previous faces, full scan every full_scan_interval
+    full_scan_interval: int = 30
+    recheck_interval: int = 30  # With a face index: frames between recognitions of a track
+    skip_duplicates: bool = False  # Write the last output again for near-identical frames
+    duplicate_threshold: float = 1.0  # Mean difference of a 64x36 thumbnail
+
+    # Enhancement: GFPGAN on every enhance_every-th frame, reused and blended in between
+    enhance: bool = False
+    enhance_every: int = 1
+    enhance_blend: float = 0.5
+
+    # Live preview (with a preview_fn) and tracing
+    preview_interval: float = 1.0  # Seconds between previews
+    preview_size: int = 480  # Longer side of a preview frame
+    trace_path: str = None  # Write a Chrome trace of the run there
+
+    @classmethod
+    def from_dict(cls, options=None, base=None, **overrides):
+        """Options from a dict of settings on top of base (or the defaults); unknown keys raise TypeError"""
+        values = asdict(base) if base is not None else {}
+        values.update(options or {}, **overrides)
+        return cls(**values)
+
+    def output_key(self):
+        """The settings that change the output video, for checkpoint keys"""
+        skip = {'num_workers', 'batch_size', 'max_inflight', 'memory_budget_mb', 'keep_audio',
+                'start_frame', 'end_frame', 'checkpoint_every', 'preview_interval', 'preview_size',
+                'trace_path'}
+        return {f.name: getattr(self, f.name) for f in fields(self) if f.name not in skip}
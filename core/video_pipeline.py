@@ -0,0 +1,171 @@
+# core/video_pipeline.py
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+_STOP = object()
+
+
+def default_workers():
+    """Number of inference workers used when the caller doesn't pick one"""
+    return max(1, min(4, os.cpu_count() or 1))
+
+
+class OrderedSection:
+    """
+    Lets pipeline workers run one step of consecutive micro-batches in frame
+    order: turn(first_index, count) waits until every frame before
+    first_index has had its turn. Every frame of the video must get a turn,
+    even when its batch failed, or later batches wait for good.
+    """
+
+    def __init__(self, timeout=600):
+        self.timeout = timeout
+        self._next_frame = 0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def turn(self, first_index, count):
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._next_frame >= first_index, timeout=self.timeout):
+                raise TimeoutError(f"Frames before {first_index} never got their turn")
+            try:
+                yield
+            finally:
+                self._next_frame = max(self._next_frame, first_index + count)
+                self._cond.notify_all()
+
+
+class VideoPipeline:
+    """
+    Decoder thread -> pool of inference workers -> encoder thread.
+
+    Stages are connected by bounded queues and the number of frames in flight
+    is capped, so memory stays flat no matter how long the video is. Workers
+    may finish out of order; the encoder puts frames back in order before
+    writing them.
+
+    `prepare_fn`, if given, runs on the decoder thread in frame order (for
+    stateful work such as tracking) and its result is what the workers get.
+    process_fn receives a list of up to batch_size consecutive items (one
+    item when batch_size is 1) and must return a list of frames in the same
+    order.
+    """
+
+    def __init__(self, process_fn, num_workers=None, queue_size=None, max_inflight=None, prepare_fn=None,
+                 batch_size=1):
+        self.process_fn = process_fn
+        self.prepare_fn = prepare_fn
+        self.batch_size = max(1, int(batch_size))
+        self.num_workers = max(1, int(num_workers or default_workers()))
+        self.queue_size = queue_size or self.num_workers * 2
+        self.max_inflight = max_inflight or (self.queue_size * 2 + self.num_workers) * self.batch_size
+        self.max_inflight = max(int(self.max_inflight), self.batch_size)  # A batch must fit, or decoding stalls
+        self._abort = threading.Event()
+        self._error = None
+        self._error_lock = threading.Lock()
+
+    def run(self, frames, write_fn, callback=None, total=0):
+        """Consume the `frames` iterable and write processed frames in order"""
+        self._abort.clear()
+        self._error = None
+        slots = threading.Semaphore(self.max_inflight)
+        in_q = queue.Queue(maxsize=self.queue_size)
+        out_q = queue.Queue(maxsize=self.queue_size)
+
+        threads = [threading.Thread(target=self._guard, args=(self._decode, frames, in_q, slots), daemon=True)]
+        for _ in range(self.num_workers):
+            threads.append(threading.Thread(target=self._guard, args=(self._work, in_q, out_q), daemon=True))
+        threads.append(threading.Thread(target=self._guard,
+                                        args=(self._encode, out_q, write_fn, slots, callback, total),
+                                        daemon=True))
+
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        if self._error is not None:
+            raise self._error
+
+    def _guard(self, target, *args):
+        try:
+            target(*args)
+        except BaseException as e:
+            with self._error_lock:
+                if self._error is None:
+                    self._error = e
+            self._abort.set()
+
+    def _put(self, q, item):
+        while not self._abort.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self._abort.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _STOP
+
+    def _decode(self, frames, in_q, slots):
+        try:
+            batch = []
+            index = 0
+            for frame in frames:
+                # One slot per frame, released by the encoder once written
+                while not slots.acquire(timeout=0.1):
+                    if self._abort.is_set():
+                        return
+                batch.append(self.prepare_fn(frame) if self.prepare_fn else frame)
+                if len(batch) == self.batch_size:
+                    if not self._put(in_q, (index, batch)):
+                        return
+                    index += 1
+                    batch = []
+            if batch and not self._put(in_q, (index, batch)):
+                return
+        finally:
+            # Always let the workers drain, even if the reader blew up
+            for _ in range(self.num_workers):
+                self._put(in_q, _STOP)
+
+    def _work(self, in_q, out_q):
+        while True:
+            item = self._get(in_q)
+            if item is _STOP:
+                break
+            index, batch = item
+            if not self._put(out_q, (index, self.process_fn(batch))):
+                return
+        self._put(out_q, _STOP)
+
+    def _encode(self, out_q, write_fn, slots, callback, total):
+        pending = {}
+        next_index = 0
+        written = 0
+        stopped = 0
+        while stopped < self.num_workers:
+            item = self._get(out_q)
+            if item is _STOP:
+                if self._abort.is_set():
+                    return
+                stopped += 1
+                continue
+            index, batch = item
+            pending[index] = batch
+            while next_index in pending:
+                for frame in pending.pop(next_index):
+                    write_fn(frame)
+                    slots.release()
+                    written += 1
+                    if callback:
+                        callback(written, total)
+                next_index += 1
@@ -5,14 +5,23 @@ from tkinter import ttk, filedialog, messagebox
 from tkinterdnd2 import *
 from PIL import Image, ImageTk
 import threading
-import cv2
-import numpy as np
-from core.face_swapper import get_swapper
+import time
+from utils.lazy import lazy_import
 from utils.model_downloader import ensure_models
 
+# Heavy modules are imported on first use (cv2) or on the warm-up thread
+# (core.face_swapper -> insightface/onnxruntime), so the window opens at once
+cv2 = lazy_import("cv2")
+
 # Constants
 VERSION = "1.0.0"
 WINDOW_TITLE = f"FaceReenact-Pro v{VERSION} - Advanced Face Reenactment"
+PREVIEW_BUDGET_S = 0.25  # Latency target for the sample swap shown while picking files
+PREVIEW_MAX_SIDE = 640
+PREVIEW_MIN_SIDE = 192
+PREVIEW_BOX = 500
+PROGRESS_INTERVAL_S = 0.1  # At most 10 progress updates per second reach the Tk event loop
+VIDEO_PREVIEW_INTERVAL_S = 1.0
 
 class FaceReenactApp(Tk):
     def __init__(self):
@@ -24,13 +33,34 @@ class FaceReenactApp(Tk):
         self.target_path = None
         self.output_path = None
         self.swap_thread = None
+        # Sample previews: a newer file choice invalidates older ones, and the
+        # sample size adapts so a preview swap stays within PREVIEW_BUDGET_S
+        self.preview_generation = 0
+        self.preview_side = PREVIEW_MAX_SIDE
+        self.preview_lock = threading.Lock()
+
+        self.setup_ui()
 
-        # Ensure models are ready
-        if not os.path.exists("models/inswapper_128.onnx"):
+        # Ensure models are ready, then load and warm them up in the background
+        download = not os.path.exists("models/inswapper_128.onnx")
+        if download:
             messagebox.showinfo("First Run", "Models are being downloaded... This happens only once.")
-            threading.Thread(target=ensure_models, daemon=True).start()
+        threading.Thread(target=self.warm_up, args=(download,), daemon=True).start()
 
-        self.setup_ui()
+    def warm_up(self, download=False):
+        """Download (first run), load and warm up the models while the UI is already usable"""
+        if download and not ensure_models():
+            return
+        loading = "Loading models in the background..."
+        self.after(0, lambda: self.status_label.config(text=loading))
+        try:
+            from core.face_swapper import get_swapper
+            get_swapper().warm_up()
+        except Exception as e:
+            print(f"⚠ Background model warm-up failed: {e}")  # process_swap will report it properly
+            return
+        # Don't overwrite a status set by the user's actions in the meantime
+        self.after(0, lambda: self.status_label.cget("text") == loading and self.status_label.config(text="Ready"))
 
     def setup_ui(self):
         style = ttk.Style()
@@ -119,6 +149,7 @@ class FaceReenactApp(Tk):
             self.source_path = path
             self.load_image_preview(path, self.source_label)
             self.status_label.config(text=f"Source loaded: {os.path.basename(path)}")
+            self.schedule_preview()
 
     def load_target(self, data):
         path = self.clean_path(data)
@@ -129,6 +160,91 @@ class FaceReenactApp(Tk):
             else:
                 self.load_image_preview(path, self.target_label)
             self.status_label.config(text=f"Target loaded: {os.path.basename(path)}")
+            self.schedule_preview()
+
+    def schedule_preview(self):
+        """Swap a downscaled sample in the background whenever the file choice changes"""
+        if not self.source_path or not self.target_path:
+            return
+        if self.swap_thread and self.swap_thread.is_alive():
+            return  # The running job shows its own frames
+        self.preview_generation += 1
+        threading.Thread(target=self.render_preview,
+                         args=(self.preview_generation, self.source_path, self.target_path), daemon=True).start()
+
+    def render_preview(self, generation, source_path, target_path):
+        with self.preview_lock:  # One preview at a time; stale ones give up once they get the lock
+            if generation != self.preview_generation:
+                return
+            try:
+                from core.detection import pick_det_size
+                from core.face_swapper import get_swapper
+                from core.video_io import thumbnail
+
+                swapper = get_swapper()  # Waits for the warm-up thread if it is still loading
+                source_img = cv2.imread(source_path)
+                target_img = self.read_sample(target_path)
+                if source_img is None or target_img is None:
+                    return
+                source_face = swapper.get_source_face(source_img)  # Cached after the first preview
+                sample = thumbnail(target_img, self.preview_side)
+                start = time.perf_counter()
+                faces = swapper.detect_faces(sample, pick_det_size(sample.shape[1], sample.shape[0]))
+                if not faces:
+                    raise ValueError("no face found in target")
+                swapper.swap_batch([(sample, faces[0], source_face)])
+                elapsed = time.perf_counter() - start
+            except Exception as e:
+                message = f"Preview: {e}"
+                self.after(0, lambda: generation == self.preview_generation and
+                           self.status_label.config(text=message))
+                return
+            # Detection and paste-back cost grows with area, so scale the side by sqrt
+            scale = min((PREVIEW_BUDGET_S / max(elapsed, 1e-3)) ** 0.5, 1.5)
+            self.preview_side = int(min(PREVIEW_MAX_SIDE, max(PREVIEW_MIN_SIDE, self.preview_side * scale)))
+
+        image = Image.fromarray(cv2.cvtColor(sample, cv2.COLOR_BGR2RGB))
+        text = f"Preview {sample.shape[1]}x{sample.shape[0]} in {elapsed * 1000:.0f} ms"
+        self.after(0, lambda: generation == self.preview_generation and self.show_preview(image, text))
+
+    def read_sample(self, path):
+        """Target image, or the first frame of a target video"""
+        if path.lower().endswith(('mp4', 'mov', 'avi', 'mkv')):
+            cap = cv2.VideoCapture(path)
+            ret, frame = cap.read()
+            cap.release()
+            return frame if ret else None
+        return cv2.imread(path)
+
+    def show_preview(self, image, text=None):
+        """Show a PIL image in the preview area, fitted into the preview box (Tk thread only)"""
+        scale = min(PREVIEW_BOX / image.width, PREVIEW_BOX / image.height)
+        image = image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))),
+                             Image.Resampling.LANCZOS)
+        photo = ImageTk.PhotoImage(image)
+        self.preview_canvas.config(image=photo)
+        self.preview_canvas.image = photo
+        if text:
+            self.status_label.config(text=text, fg="#00ff88")
+
+    def progress_callback(self):
+        """Video progress callback that forwards at most one update per PROGRESS_INTERVAL_S to Tk"""
+        last = [0.0]
+
+        def progress(cur, total):
+            now = time.monotonic()
+            if (not total or cur < total) and now - last[0] < PROGRESS_INTERVAL_S:
+                return
+            last[0] = now
+            value = cur / total * 100 if total else 0
+            self.after(0, lambda: self.progress.config(value=value))
+
+        return progress
+
+    def post_video_frame(self, frame):
+        """preview_fn for process_video: called on the encoder thread with a small BGR copy"""
+        image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        self.after(0, lambda: self.show_preview(image))
 
     def clean_path(self, raw):
         path = raw.strip('{}')
@@ -150,6 +266,7 @@ class FaceReenactApp(Tk):
         self.source_path = self.target_path = None
         self.source_label.config(image="", text="Drop image here\nor click to select")
         self.target_label.config(image="", text="Drop file here\nor click to select")
+        self.preview_generation += 1  # Drop any preview still being rendered
         self.preview_canvas.config(image="")
         self.progress['value'] = 0
         self.status_label.config(text="Cleared")
@@ -167,6 +284,7 @@ class FaceReenactApp(Tk):
         if not self.output_path:
             return
 
+        self.preview_generation += 1  # The job's own frames replace the sample preview
         self.swap_btn.config(state="disabled")
         self.status_label.config(text="Processing... Please wait")
         self.progress['value'] = 0
@@ -176,7 +294,8 @@ class FaceReenactApp(Tk):
 
     def process_swap(self):
         try:
-            swapper = get_swapper()
+            from core.face_swapper import get_swapper
+            swapper = get_swapper()  # Waits for the warm-up thread if it is still loading
 
             if self.target_path.lower().endswith(('mp4', 'mov', 'avi', 'mkv')):
                 # Video processing
@@ -185,7 +304,9 @@ class FaceReenactApp(Tk):
                     self.source_path,
                     self.target_path,
                     self.output_path,
-                    callback=lambda cur, total: self.after(0, lambda: self.progress.config(value=cur/total*100))
+                    callback=self.progress_callback(),
+                    preview_fn=self.post_video_frame,
+                    preview_interval=VIDEO_PREVIEW_INTERVAL_S
                 )
             else:
                 # Image processing
@@ -225,11 +346,7 @@ class FaceReenactApp(Tk):
 
         # Show preview
         if self.output_path.lower().endswith(('jpg', 'jpeg', 'png', 'bmp', 'webp')):
-            img = Image.open(self.output_path)
-            img = img.resize((500, 500), Image.Resampling.LANCZOS)
-            photo = ImageTk.PhotoImage(img)
-            self.preview_canvas.config(image=photo)
-            self.preview_canvas.image = photo
+            self.show_preview(Image.open(self.output_path))
 
 
 if __name__ == "__main__":
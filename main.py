@@ -1 +1,173 @@
-from gui.app import FaceReenactApp; FaceReenactApp().mainloop()
\ No newline at end of file
+# main.py
+import argparse
+import json
+import os
+import sys
+import time
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="main.py", description="FaceReenact-Pro - face swap for images & videos")
+    sub = parser.add_subparsers(dest="command")
+    sub.add_parser("gui", help="Launch the desktop app (default)")
+
+    batch = sub.add_parser("batch", help="Run swap jobs headless from a manifest or a directory")
+    batch.add_argument("--manifest", help="CSV or JSONL manifest with source,target,output[,source_face_index,target_face_index]")
+    batch.add_argument("--source", help="Source face image (directory mode)")
+    batch.add_argument("--input-dir", help="Directory of target images/videos (directory mode)")
+    batch.add_argument("--output-dir", help="Where to write results (directory mode)")
+    batch.add_argument("--source-face-index", type=int, default=0)
+    batch.add_argument("--target-face-index", type=int, default=0)
+    batch.add_argument("--workers", type=int, default=4, help="Jobs run concurrently (default: 4)")
+    batch.add_argument("--video-workers", type=int, default=None, help="Inference threads per video job")
+    batch.add_argument("--track", action="store_true", help="Detect on keyframes only and track faces in between")
+    batch.add_argument("--roi-detect", action="store_true", help="Re-detect faces only around last frame's faces")
+    batch.add_argument("--backend", choices=("opencv", "ffmpeg"), default="opencv", help="Video I/O backend")
+    batch.add_argument("--codec", help="ffmpeg video codec (default: libx264)")
+    batch.add_argument("--crf", type=int, help="ffmpeg CRF (default: 18)")
+    batch.add_argument("--preset", help="ffmpeg preset (default: ultrafast)")
+    batch.add_argument("--map", action="append", metavar="REFERENCE=SOURCE",
+                       help="Video: replace the person in REFERENCE image with the face in SOURCE (repeatable)")
+    batch.add_argument("--enhance", action="store_true", help="Restore swapped faces with GFPGAN")
+    batch.add_argument("--enhance-every", type=int, default=1, help="Video: run GFPGAN every N frames (default: 1)")
+    batch.add_argument("--max-inflight", type=int, help="Video: cap on frames held in memory at once")
+    batch.add_argument("--memory-budget-mb", type=int, help="Video: derive --max-inflight from a frame buffer budget")
+    batch.add_argument("--tile-size", type=int, help="Detect faces tile by tile in images larger than this")
+    batch.add_argument("--result-cache", metavar="DIR", help="Reuse results of identical image jobs, stored in DIR")
+    batch.add_argument("--skip-duplicates", action="store_true",
+                       help="Video: reuse the previous output for near-identical frames")
+    batch.add_argument("--shard", action="store_true",
+                       help="Video: split each video into segments swapped in parallel worker processes")
+    batch.add_argument("--processes", type=int, metavar="N",
+                       help="With --shard: worker processes (default: one per core, as many as fit in memory)")
+    batch.add_argument("--queue-dir", metavar="DIR",
+                       help="With --shard: hand segments out through DIR so workers on other machines can help")
+    batch.add_argument("--checkpoint-every", type=int, metavar="N",
+                       help="Video: journal the output in chunks of N frames; a rerun resumes after the last one")
+    batch.add_argument("--report", help="Write per-job results as JSON to this file")
+    batch.add_argument("--metrics", help="Write per-stage timings and counters as JSON to this file")
+    batch.add_argument("--trace", help="Write a Chrome trace (chrome://tracing) of the run to this file")
+
+    serve = sub.add_parser("serve", help="Run the local HTTP inference server")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8000)
+    serve.add_argument("--pool-size", type=int, default=2, help="Warm FaceSwapper instances (default: 2)")
+    serve.add_argument("--max-batch", type=int, default=8, help="Max image requests per batch (default: 8)")
+    serve.add_argument("--max-wait-ms", type=float, default=10, help="How long to wait to fill a batch (default: 10)")
+    serve.add_argument("--result-cache-mb", type=int, default=256,
+                       help="Memory for cached results of repeated requests, 0 to disable (default: 256)")
+    return parser
+
+
+def print_stage_summary(snapshot):
+    stages = sorted(snapshot['stages'].items(), key=lambda kv: -kv[1]['total_s'])
+    if stages:
+        print(f"{'stage':<10}{'calls':>8}{'total s':>10}{'mean ms':>10}")
+        for name, s in stages:
+            print(f"{name:<10}{s['count']:>8}{s['total_s']:>10.2f}{s['mean_ms']:>10.2f}")
+    for name, value in sorted(snapshot['counters'].items()):
+        print(f"{name}: {value}")
+    for name, message in snapshot['errors'].items():
+        print(f"⚠ last {name}: {message}")
+
+
+def run_batch_command(args):
+    from core.batch import jobs_from_dirs, load_manifest, run_batch
+    from core.face_swapper import get_swapper
+    from utils.model_downloader import ensure_models
+
+    if args.manifest:
+        jobs = load_manifest(args.manifest)
+    elif args.source and args.input_dir and args.output_dir:
+        jobs = jobs_from_dirs(args.source, args.input_dir, args.output_dir,
+                              args.source_face_index, args.target_face_index)
+    else:
+        print("batch: give either --manifest or --source, --input-dir and --output-dir", file=sys.stderr)
+        return 2
+    if not jobs:
+        print("No jobs found.")
+        return 0
+
+    if not os.path.exists("models/inswapper_128.onnx") and not ensure_models():
+        return 1
+
+    start = time.perf_counter()
+    swapper = get_swapper()  # Load the models once for every job
+    if args.tile_size:
+        swapper.tile_size = args.tile_size
+    if args.result_cache:
+        from core.face_cache import ResultCache
+        swapper.result_cache = ResultCache(cache_dir=args.result_cache)
+    if args.trace:
+        swapper.metrics.trace = True
+    load_time = time.perf_counter() - start
+    print(f"Models loaded in {load_time:.2f}s, running {len(jobs)} jobs with {args.workers} workers")
+
+    def report(result):
+        name = os.path.basename(result['target'])
+        if result['status'] == 'ok':
+            print(f"✓ {name} -> {result['output']} ({result['seconds']:.2f}s)")
+        else:
+            print(f"✗ {name}: {result['error']} ({result['seconds']:.2f}s)")
+
+    video_options = {}
+    if args.shard:
+        if args.map:
+            print("batch: --map can't be combined with --shard", file=sys.stderr)
+            return 2
+        video_options['sharding'] = {'num_processes': args.processes, 'queue_dir': args.queue_dir}
+    if args.map:
+        import cv2
+
+        mapping = []
+        for pair in args.map:
+            reference_path, _, source_path = pair.partition("=")
+            images = [cv2.imread(reference_path), cv2.imread(source_path)]
+            if not reference_path or any(img is None for img in images):
+                print(f"batch: could not read --map {pair}", file=sys.stderr)
+                return 2
+            mapping.append(images)
+        video_options['face_index'] = swapper.build_face_index(mapping)
+
+    video_options.update({'num_workers': args.video_workers, 'track': args.track, 'roi_detect': args.roi_detect,
+                          'backend': args.backend, 'enhance': args.enhance, 'enhance_every': args.enhance_every,
+                          'max_inflight': args.max_inflight, 'memory_budget_mb': args.memory_budget_mb,
+                          'skip_duplicates': args.skip_duplicates, 'checkpoint_every': args.checkpoint_every,
+                          'encode_options': {'codec': args.codec, 'crf': args.crf, 'preset': args.preset}})
+    results = run_batch(swapper, jobs, workers=args.workers, video_options=video_options, on_result=report,
+                        enhance=args.enhance)
+
+    total = time.perf_counter() - start
+    failed = [r for r in results if r['status'] != 'ok']
+    print("=" * 60)
+    print(f"{len(results) - len(failed)} succeeded, {len(failed)} failed in {total:.2f}s "
+          f"(model load {load_time:.2f}s)")
+    print_stage_summary(swapper.metrics.snapshot())
+    if args.metrics:
+        swapper.metrics.dump_json(args.metrics)
+    if args.trace:
+        swapper.metrics.dump_trace(args.trace)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({'model_load_seconds': round(load_time, 3), 'total_seconds': round(total, 3),
+                       'results': results}, f, indent=2)
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == "batch":
+        return run_batch_command(args)
+    if args.command == "serve":
+        from server.app import serve
+        serve(args.host, args.port, pool_size=args.pool_size, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms,
+              result_cache_mb=args.result_cache_mb)
+        return 0
+
+    from gui.app import FaceReenactApp
+    FaceReenactApp().mainloop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,365 @@
+# server/app.py
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+import cv2
+import numpy as np
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import (
+    FileResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
+
+from core.face_cache import ResultCache, SourceFaceCache
+from core.face_swapper import FaceSwapper
+from core.metrics import Metrics
+
+
+class LatencyStats:
+    """Rolling window of request latencies with percentile summaries"""
+
+    def __init__(self, window=2048):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def add(self, seconds, ok=True):
+        with self._lock:
+            self.samples.append(seconds)
+            self.count += 1
+            if not ok:
+                self.errors += 1
+
+    def summary(self):
+        with self._lock:
+            samples = sorted(self.samples)
+            count, errors = self.count, self.errors
+        if not samples:
+            return {'count': count, 'errors': errors, 'p50_ms': None, 'p99_ms': None}
+        def pick(q):
+            return round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 2)
+
+        return {'count': count, 'errors': errors, 'p50_ms': pick(0.50), 'p99_ms': pick(0.99)}
+
+
+class SwapRequest:
+    def __init__(self, source_img, target_img, source_face_index, target_face_index, future):
+        self.source_img = source_img
+        self.target_img = target_img
+        self.source_face_index = source_face_index
+        self.target_face_index = target_face_index
+        self.future = future
+        self.enqueued = time.perf_counter()
+
+
+def swap_requests(swapper, batch):
+    """
+    Run a batch of image requests through one swap_batch call (worker thread).
+    Never raises: each request gets its result or its own error.
+    """
+    outcomes = [None] * len(batch)
+    jobs = []  # (request index, swap_batch job)
+    keys = {}
+    cache = swapper.result_cache
+    for i, req in enumerate(batch):
+        try:
+            if cache is not None:
+                # Key from the untouched target, before anything is pasted onto it
+                keys[i] = swapper.result_key(req.source_img, req.target_img, req.source_face_index,
+                                             req.target_face_index)
+                cached = cache.get(keys[i])
+                if cached is not None:
+                    swapper.metrics.incr('result_cache_hits')
+                    outcomes[i] = cached.copy()
+                    del keys[i]
+                    continue
+            source_face = swapper.get_source_face(req.source_img, req.source_face_index)
+            target_faces = swapper.detect_faces(req.target_img)
+            if req.target_face_index >= len(target_faces):
+                raise ValueError(f"Target face index {req.target_face_index} not found. "
+                                 f"Only {len(target_faces)} faces detected.")
+            result = req.target_img  # Decoded for this request only, so paste onto it directly
+            jobs.append((i, (result, target_faces[req.target_face_index], source_face)))
+            outcomes[i] = result
+        except Exception as e:
+            outcomes[i] = e
+            keys.pop(i, None)
+    try:
+        swapper.swap_batch([job for _, job in jobs])
+    except Exception:
+        # One bad upload must not fail the other clients: retry request by request
+        for i, job in jobs:
+            try:
+                swapper.swap_batch([job])
+            except Exception as e:
+                outcomes[i] = e
+                keys.pop(i, None)
+    for i, key in keys.items():
+        cache.put(key, outcomes[i])
+    return outcomes
+
+
+class SwapServer:
+    """
+    Warm pool of FaceSwapper instances behind an asyncio request queue.
+
+    Image requests are collected into dynamic batches (up to max_batch, or
+    whatever arrived within max_wait_ms) and each batch is handed to the
+    next idle swapper as a single swap_batch call. Video jobs check out a
+    swapper for their whole run and report progress as they go.
+    """
+
+    def __init__(self, pool_size=2, max_batch=8, max_wait_ms=10, profile='swap', result_cache_mb=256):
+        self.pool_size = pool_size
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.profile = profile
+        self.executor = ThreadPoolExecutor(max_workers=pool_size + 1)
+        self.latency = LatencyStats()
+        self.stage_metrics = Metrics()  # Shared by every swapper in the pool
+        # Resubmitted (source, target) pairs are answered without running the models
+        self.result_cache = ResultCache(max_bytes=result_cache_mb * 2**20) if result_cache_mb else None
+        self.batch_sizes = deque(maxlen=1024)
+        self.jobs = {}
+        self.requests = None
+        self.pool = None
+        self._dispatcher = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.requests = asyncio.Queue()
+        self.pool = asyncio.Queue()
+        face_cache = SourceFaceCache()  # Shared, so a source analysed by one swapper is warm for all
+        start = time.perf_counter()
+
+        def build():
+            swapper = FaceSwapper(profile=self.profile, face_cache=face_cache, metrics=self.stage_metrics,
+                                  result_cache=self.result_cache)
+            swapper.warm_up()  # First requests shouldn't pay for ORT's lazy allocations
+            return swapper
+
+        swappers = await asyncio.gather(*[loop.run_in_executor(self.executor, build) for _ in range(self.pool_size)])
+        for swapper in swappers:
+            self.pool.put_nowait(swapper)
+        print(f"Warm pool of {self.pool_size} swappers ready in {time.perf_counter() - start:.2f}s")
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def stop(self):
+        if self._dispatcher:
+            self._dispatcher.cancel()
+        self.executor.shutdown(wait=False)
+
+    async def swap(self, source_img, target_img, source_face_index=0, target_face_index=0):
+        future = asyncio.get_running_loop().create_future()
+        req = SwapRequest(source_img, target_img, source_face_index, target_face_index, future)
+        await self.requests.put(req)
+        try:
+            result = await future
+        except Exception:
+            self.latency.add(time.perf_counter() - req.enqueued, ok=False)
+            raise
+        self.latency.add(time.perf_counter() - req.enqueued)
+        return result
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.requests.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.requests.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            swapper = await self.pool.get()
+            # Whatever arrived while every swapper was busy rides along too
+            while len(batch) < self.max_batch and not self.requests.empty():
+                batch.append(self.requests.get_nowait())
+            self.batch_sizes.append(len(batch))
+            asyncio.create_task(self._run_batch(swapper, batch))
+
+    async def _run_batch(self, swapper, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            outcomes = await loop.run_in_executor(self.executor, swap_requests, swapper, batch)
+        except Exception as e:
+            outcomes = [e] * len(batch)
+        finally:
+            self.pool.put_nowait(swapper)
+        for req, outcome in zip(batch, outcomes):
+            if req.future.done():
+                continue
+            if isinstance(outcome, Exception):
+                req.future.set_exception(outcome)
+            else:
+                req.future.set_result(outcome)
+
+    async def start_video(self, source_path, target_path, output_path, **options):
+        job_id = uuid.uuid4().hex
+        job = {'id': job_id, 'status': 'queued', 'frame': 0, 'total': 0,
+               'output': output_path, 'error': None, 'started': time.time()}
+        self.jobs[job_id] = job
+
+        def progress(cur, total):
+            job['frame'], job['total'] = cur, total
+
+        async def run():
+            swapper = await self.pool.get()
+            job['status'] = 'running'
+            try:
+                await asyncio.get_running_loop().run_in_executor(
+                    self.executor,
+                    lambda: swapper.process_video(source_path, target_path, output_path, callback=progress, **options))
+                job['status'] = 'done'
+            except Exception as e:
+                job['status'] = 'failed'
+                job['error'] = str(e)
+            finally:
+                self.pool.put_nowait(swapper)
+
+        asyncio.create_task(run())
+        return job
+
+    def metrics(self):
+        sizes = list(self.batch_sizes)
+        return {
+            'latency': self.latency.summary(),
+            'queue_depth': self.requests.qsize() if self.requests else 0,
+            'idle_swappers': self.pool.qsize() if self.pool else 0,
+            'pool_size': self.pool_size,
+            'mean_batch_size': round(sum(sizes) / len(sizes), 2) if sizes else None,
+            'video_jobs': {s: sum(1 for j in self.jobs.values() if j['status'] == s)
+                           for s in ('queued', 'running', 'done', 'failed')},
+            'pipeline': self.stage_metrics.snapshot(),
+        }
+
+    def prometheus(self):
+        """Pipeline stage metrics plus the server's own gauges, as Prometheus text"""
+        latency = self.latency.summary()
+        lines = [self.stage_metrics.prometheus().rstrip("\n"),
+                 "# TYPE facereenact_requests_total counter", f"facereenact_requests_total {latency['count']}",
+                 "# TYPE facereenact_request_errors_total counter",
+                 f"facereenact_request_errors_total {latency['errors']}",
+                 "# TYPE facereenact_queue_depth gauge",
+                 f"facereenact_queue_depth {self.requests.qsize() if self.requests else 0}",
+                 "# TYPE facereenact_idle_swappers gauge",
+                 f"facereenact_idle_swappers {self.pool.qsize() if self.pool else 0}"]
+        return "\n".join(lines) + "\n"
+
+
+
+def decode_upload(data, name):
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise HTTPException(status_code=400, detail=f"Could not decode {name} image")
+    return img
+
+
+def save_upload(upload, path):
+    """Copy an upload to disk in chunks; a video never has to fit in memory"""
+    with open(path, "wb") as f:
+        shutil.copyfileobj(upload.file, f)
+
+
+def create_app(pool_size=2, max_batch=8, max_wait_ms=10, work_dir=None, result_cache_mb=256):
+    server = SwapServer(pool_size=pool_size, max_batch=max_batch, max_wait_ms=max_wait_ms,
+                        result_cache_mb=result_cache_mb)
+    work_dir = work_dir or tempfile.mkdtemp(prefix="facereenact_")
+
+    @asynccontextmanager
+    async def lifespan(app):
+        await server.start()
+        yield
+        await server.stop()
+
+    app = FastAPI(title="FaceReenact-Pro", lifespan=lifespan)
+    app.state.server = server
+
+    @app.get("/health")
+    async def health():
+        return {'status': 'ok', 'idle_swappers': server.pool.qsize()}
+
+    @app.get("/metrics")
+    async def metrics():
+        return server.metrics()
+
+    @app.get("/metrics/prometheus", response_class=PlainTextResponse)
+    async def metrics_prometheus():
+        return PlainTextResponse(server.prometheus(), media_type="text/plain; version=0.0.4")
+
+    @app.post("/swap")
+    async def swap(source: UploadFile = File(...), target: UploadFile = File(...),
+                   source_face_index: int = 0, target_face_index: int = 0, image_format: str = "png"):
+        if image_format not in ("png", "jpg"):
+            raise HTTPException(status_code=400, detail="image_format must be png or jpg")
+        source_img = decode_upload(await source.read(), "source")
+        target_img = decode_upload(await target.read(), "target")
+        try:
+            result = await server.swap(source_img, target_img, source_face_index, target_face_index)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e)) from e
+        ok, encoded = cv2.imencode(f".{image_format}", result)
+        if not ok:
+            raise HTTPException(status_code=500, detail="Could not encode result")
+        return Response(content=encoded.tobytes(), media_type="image/jpeg" if image_format == "jpg" else "image/png")
+
+    @app.post("/video")
+    async def video(source: UploadFile = File(...), target: UploadFile = File(...), track: bool = False):
+        job_dir = os.path.join(work_dir, uuid.uuid4().hex)
+        os.makedirs(job_dir)
+        source_path = os.path.join(job_dir, "source" + os.path.splitext(source.filename or "")[1])
+        target_path = os.path.join(job_dir, "target" + os.path.splitext(target.filename or ".mp4")[1])
+        for upload, path in ((source, source_path), (target, target_path)):
+            await run_in_threadpool(save_upload, upload, path)
+        job = await server.start_video(source_path, target_path, os.path.join(job_dir, "output.mp4"), track=track)
+        return {'id': job['id']}
+
+    @app.get("/video/{job_id}/progress")
+    async def video_progress(job_id: str):
+        job = server.jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Unknown job")
+
+        async def stream():
+            # Newline-delimited JSON, one event per tick until the job ends
+            while True:
+                event = {k: job[k] for k in ('id', 'status', 'frame', 'total', 'error')}
+                yield json.dumps(event) + "\n"
+                if job['status'] in ('done', 'failed'):
+                    return
+                await asyncio.sleep(0.5)
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    @app.get("/video/{job_id}/result")
+    async def video_result(job_id: str):
+        job = server.jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Unknown job")
+        if job['status'] != 'done':
+            raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+        return FileResponse(job['output'], media_type="video/mp4", filename="output.mp4")
+
+    return app
+
+
+def serve(host="127.0.0.1", port=8000, **kwargs):
+    import uvicorn
+
+    uvicorn.run(create_app(**kwargs), host=host, port=port)
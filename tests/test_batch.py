@@ -0,0 +1,38 @@
+from core import batch
+from core.batch import make_job, run_job
+
+
+class FakeSwapper:
+    def __init__(self):
+        self.calls = []
+
+    def process_video(self, source, target, output, **kwargs):
+        self.calls.append(kwargs)
+
+
+def test_video_job_passes_the_source_face_index(tmp_path):
+    swapper = FakeSwapper()
+    job = make_job("face.jpg", "clip.mp4", str(tmp_path / "out.mp4"), source_face_index=2)
+    result = run_job(swapper, job, video_options={'batch_size': 8})
+    assert result['status'] == 'ok'
+    assert swapper.calls == [{'source_face_index': 2, 'batch_size': 8}]
+
+
+def test_video_job_rejects_a_target_face_index(tmp_path):
+    swapper = FakeSwapper()
+    result = run_job(swapper, make_job("face.jpg", "clip.mp4", str(tmp_path / "out.mp4"), target_face_index=1))
+    assert result['status'] == 'failed'
+    assert 'target_face_index' in result['error']
+    assert not swapper.calls
+
+
+def test_sharded_video_job_runs_in_worker_processes(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(batch, 'process_video_sharded', lambda *args, **kwargs: calls.append(kwargs))
+    swapper = FakeSwapper()
+    job = make_job("face.jpg", "clip.mp4", str(tmp_path / "out.mp4"))
+    sharding = {'num_processes': 3, 'queue_dir': None}
+    result = run_job(swapper, job, video_options={'sharding': sharding, 'track': True})
+    assert result['status'] == 'ok'
+    assert calls == [{'num_processes': 3, 'queue_dir': None, 'source_face_index': 0, 'track': True}]
+    assert not swapper.calls
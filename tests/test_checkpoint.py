@@ -0,0 +1,56 @@
+import os
+
+from core.checkpoint import CheckpointJournal, ChunkedWriter
+
+
+class FakeWriter:
+    def __init__(self, path):
+        self.path = path
+        self.frames = 0
+
+    def write(self, frame):
+        self.frames += 1
+
+    def release(self):
+        with open(self.path, "w") as f:
+            f.write(str(self.frames))
+
+
+def write_frames(journal, count):
+    out = ChunkedWriter(journal, FakeWriter)
+    for i in range(count):
+        out.write(i)
+    return out
+
+
+def test_chunks_roll_over_and_resume(tmp_path):
+    output = str(tmp_path / "out.mp4")
+    journal = CheckpointJournal(output, ['job'], chunk_frames=4)
+    write_frames(journal, 10).release()  # Interrupted: the trailing 2 frames are not a finished chunk
+    assert journal.chunks == [0, 1]
+    assert os.path.exists(journal.chunk_path(1))
+    assert not os.path.exists(journal.chunk_path(2))
+
+    resumed = CheckpointJournal(output, ['job'], chunk_frames=4)
+    assert resumed.frames_done == 8
+    out = write_frames(resumed, 2)
+    out.close()
+    assert resumed.chunks == [0, 1, 2]
+    with open(resumed.chunk_path(2)) as f:
+        assert f.read() == "2"
+
+
+def test_different_key_starts_over(tmp_path):
+    output = str(tmp_path / "out.mp4")
+    write_frames(CheckpointJournal(output, ['job', 1], chunk_frames=2), 4).release()
+    journal = CheckpointJournal(output, ['job', 2], chunk_frames=2)
+    assert journal.frames_done == 0
+    assert not os.path.exists(journal.chunk_path(0))
+
+
+def test_missing_chunk_file_ends_the_resume(tmp_path):
+    output = str(tmp_path / "out.mp4")
+    journal = CheckpointJournal(output, ['job'], chunk_frames=2)
+    write_frames(journal, 6).release()
+    os.remove(journal.chunk_path(1))
+    assert CheckpointJournal(output, ['job'], chunk_frames=2).chunks == [0]
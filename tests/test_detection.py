@@ -0,0 +1,58 @@
+import numpy as np
+from insightface.app.common import Face
+
+from core.detection import RoiDetector
+
+
+def face(x1, y1, x2, y2):
+    return Face(bbox=np.array([x1, y1, x2, y2], dtype=np.float32), kps=np.zeros((5, 2), dtype=np.float32),
+                det_score=0.9)
+
+
+class FakeDetector:
+    """Finds the given faces (frame coordinates) that lie fully inside the image it is shown"""
+
+    def __init__(self, frame, faces):
+        self.frame, self.faces, self.calls = frame, faces, []
+
+    def __call__(self, image, det_size):
+        # Crops are views into the frame, so their offset follows from the data pointers
+        offset = (image.__array_interface__['data'][0] - self.frame.__array_interface__['data'][0]) // 3
+        y, x = divmod(offset, self.frame.shape[1])
+        h, w = image.shape[:2]
+        self.calls.append((w, h))
+        return [face(*(f.bbox - [x, y, x, y])) for f in self.faces
+                if f.bbox[0] >= x and f.bbox[1] >= y and f.bbox[2] <= x + w and f.bbox[3] <= y + h]
+
+
+def test_one_roi_per_face():
+    frame = np.zeros((500, 1000, 3), dtype=np.uint8)
+    faces = [face(20, 200, 60, 240), face(930, 200, 970, 240)]
+    detect = FakeDetector(frame, faces)
+    roi = RoiDetector(detect, full_scan_interval=30)
+    assert len(roi.update(frame)) == 2  # First frame: full scan
+    found = roi.update(frame)
+    assert roi.roi_scans == 1
+    assert sorted(int(f.bbox[0]) for f in found) == [20, 930]
+    # Two small regions, not one box spanning the frame
+    assert all(w < 200 and h < 200 for w, h in detect.calls[1:])
+
+
+def test_large_rois_fall_back_to_a_full_scan():
+    frame = np.zeros((200, 200, 3), dtype=np.uint8)
+    detect = FakeDetector(frame, [face(40, 40, 160, 160)])
+    roi = RoiDetector(detect)
+    roi.update(frame)
+    roi.update(frame)
+    assert (roi.full_scans, roi.roi_scans) == (2, 0)
+
+
+def test_lost_face_triggers_a_full_scan():
+    frame = np.zeros((500, 1000, 3), dtype=np.uint8)
+    faces = [face(20, 200, 60, 240), face(930, 200, 970, 240)]
+    detect = FakeDetector(frame, faces)
+    roi = RoiDetector(detect)
+    roi.update(frame)
+    faces.pop()
+    assert len(roi.update(frame)) == 1
+    assert roi.full_scans == 2
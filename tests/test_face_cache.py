@@ -0,0 +1,67 @@
+import numpy as np
+from insightface.app.common import Face
+
+from core.face_cache import ResultCache, SourceFaceCache
+
+
+def face(value):
+    return Face(bbox=np.full(4, value, dtype=np.float32), kps=np.zeros((5, 2), dtype=np.float32),
+                det_score=0.9, embedding=np.full(512, value, dtype=np.float32))
+
+
+def test_source_faces_evict_least_recently_used():
+    cache = SourceFaceCache(max_entries=2)
+    cache.put('a', 0, face(1))
+    cache.put('b', 0, face(2))
+    assert cache.get('a', 0) is not None  # 'a' is now the most recent
+    cache.put('c', 0, face(3))
+    assert cache.get('b', 0) is None
+    assert cache.get('a', 0) is not None
+    assert cache.get('c', 0) is not None
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_source_faces_are_shared_through_the_cache_dir(tmp_path):
+    SourceFaceCache(cache_dir=str(tmp_path)).put('a', 1, face(5))
+    loaded = SourceFaceCache(cache_dir=str(tmp_path)).get('a', 1)
+    assert loaded is not None
+    assert np.allclose(loaded.bbox, 5)
+    assert loaded.embedding.shape == (512,)
+
+
+def test_corrupt_source_face_entry_is_a_miss(tmp_path):
+    cache = SourceFaceCache(cache_dir=str(tmp_path))
+    (tmp_path / "a_0.npz").write_bytes(b"not a zip file")
+    assert cache.get('a', 0) is None
+    assert cache.misses == 1
+
+
+def image(value, side=10):
+    return np.full((side, side, 3), value, dtype=np.uint8)
+
+
+def test_results_evict_by_total_bytes():
+    cache = ResultCache(max_bytes=2 * image(0).nbytes)
+    cache.put('a', image(1))
+    cache.put('b', image(2))
+    cache.get('a')
+    cache.put('c', image(3))
+    assert cache.get('b') is None
+    assert int(cache.get('a')[0, 0, 0]) == 1
+    assert int(cache.get('c')[0, 0, 0]) == 3
+
+
+def test_result_larger_than_the_cache_is_not_kept():
+    cache = ResultCache(max_bytes=image(0).nbytes)
+    cache.put('a', image(1))
+    cache.put('big', image(2, side=20))
+    assert cache.get('big') is None
+    assert cache.get('a') is not None  # Nothing was evicted to make room for it
+
+
+def test_results_are_copied_and_shared_through_the_cache_dir(tmp_path):
+    result = image(7)
+    ResultCache(cache_dir=str(tmp_path)).put('a', result)
+    result[:] = 0  # The caller keeps using its array
+    loaded = ResultCache(cache_dir=str(tmp_path)).get('a')
+    assert int(loaded[0, 0, 0]) == 7
@@ -0,0 +1,91 @@
+import threading
+
+import numpy as np
+import pytest
+from insightface.app.common import Face
+
+from core import face_enhancer
+from core.face_enhancer import SequenceEnhancer
+
+
+class FakeEnhancer:
+    """Crops are filled with the face's 'level'; restoring doubles them"""
+
+    def __init__(self):
+        self.calls = []
+
+    def align(self, img, face):
+        return np.full((2, 2, 3), face['level'], dtype=np.uint8), face  # The face stands in for M
+
+    def restore(self, crops):
+        self.calls.append(len(crops))
+        return [crop * 2 for crop in crops]
+
+
+@pytest.fixture
+def pasted(monkeypatch):
+    pasted = []
+    monkeypatch.setattr(face_enhancer, 'paste_back',
+                        lambda img, crop, face: pasted.append((face['name'], int(crop[0, 0, 0]))))
+    return pasted
+
+
+def face(name, x, level, identity=None):
+    return Face(name=name, level=level, identity=identity,
+                bbox=np.array([x, 0, x + 10, 10], dtype=np.float32))
+
+
+def test_cadence_runs_across_batches(pasted):
+    enhancer = FakeEnhancer()
+    sequence = SequenceEnhancer(enhancer, every_n=4, blend=1)
+    for start in range(0, 8, 2):
+        sequence.enhance([[(None, face('a', 0, 10))] for _ in range(2)], first_index=start)
+    assert enhancer.calls == [1, 0, 1, 0]  # Only frames 0 and 4 hit the network
+    assert pasted == [('a', 20)] * 8  # The frames in between still get the restoration
+
+
+def test_residuals_follow_faces_not_slots(pasted):
+    sequence = SequenceEnhancer(FakeEnhancer(), every_n=2, blend=1)
+    sequence.enhance([[(None, face('a', 0, 10)), (None, face('b', 100, 50))]], first_index=0)
+    # Next frame lists the faces in the other order
+    sequence.enhance([[(None, face('b', 101, 50)), (None, face('a', 1, 10))]], first_index=1)
+    assert pasted[2:] == [('b', 100), ('a', 20)]
+
+
+def test_new_face_between_key_frames_is_restored(pasted):
+    enhancer = FakeEnhancer()
+    sequence = SequenceEnhancer(enhancer, every_n=10, blend=1)
+    sequence.enhance([[(None, face('a', 0, 10))], [(None, face('a', 0, 10)), (None, face('c', 200, 30))]],
+                     first_index=0)
+    assert enhancer.calls == [1, 1]
+    assert pasted[-1] == ('c', 60)
+
+
+def test_batches_finishing_out_of_order(pasted):
+    sequence = SequenceEnhancer(FakeEnhancer(), every_n=3, blend=0.5)
+    levels = [10, 20, 30, 40, 50, 60]
+    frames = [[(None, face('a', 0, level))] for level in levels]
+    later = threading.Thread(target=sequence.enhance, args=(frames[3:], 3))
+    later.start()
+    later.join(timeout=0.2)
+    assert later.is_alive()  # Waits for frames 0-2 before applying residuals
+    sequence.enhance(frames[:3], 0)
+    later.join(timeout=5)
+    assert not later.is_alive()
+    # Frame 3 blends its residual (40) with the one carried from frame 0 (10)
+    assert [value for _, value in pasted] == [20, 30, 40, 65, 75, 85]
+
+
+def test_failed_batch_still_hands_over(pasted):
+    enhancer = FakeEnhancer()
+    sequence = SequenceEnhancer(enhancer, every_n=1)
+
+    def restore(crops):
+        raise RuntimeError("out of memory")
+
+    enhancer.restore = restore
+    with pytest.raises(RuntimeError):
+        sequence.enhance([[(None, face('a', 0, 10))]], first_index=0)
+    enhancer.restore = FakeEnhancer().restore
+    sequence.enhance([[(None, face('a', 0, 10))]], first_index=1)
+    assert pasted == [('a', 20)]
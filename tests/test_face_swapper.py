@@ -0,0 +1,240 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+import pytest
+from insightface.app.common import Face
+
+from core import face_swapper
+from core.face_cache import SourceFaceCache
+from core.face_index import FaceIndex, IdentityMatcher
+from core.face_swapper import FaceSwapper
+from core.metrics import Metrics
+from core.video_io import REPEAT_FRAME
+from core.video_options import VideoOptions
+
+
+@pytest.fixture
+def swapper():
+    # No models: swap_frames only needs metrics, detect_faces and swap_batch
+    swapper = FaceSwapper.__new__(FaceSwapper)
+    swapper.metrics = Metrics()
+    swapper.swapped = []
+
+    def swap_batch(jobs):
+        if any(img[0, 0, 0] == 255 for img, _, _ in jobs):
+            raise RuntimeError("bad crop")
+        for img, _, _ in jobs:
+            img += 1
+            swapper.swapped.append(img)
+        return [img for img, _, _ in jobs]
+
+    swapper.swap_batch = swap_batch
+    return swapper
+
+
+def frame(value=0):
+    return np.full((4, 4, 3), value, dtype=np.uint8)
+
+
+def face(x=0.0):
+    return Face(bbox=np.array([x, 0, x + 1, 1], dtype=np.float32), kps=np.zeros((5, 2), dtype=np.float32))
+
+
+def test_swaps_every_frame(swapper):
+    items = [(frame(), [face()]) for _ in range(3)]
+    result = swapper.swap_frames(items, face())
+    assert [int(f[0, 0, 0]) for f in result] == [1, 1, 1]
+
+
+def test_bad_frame_does_not_drop_the_batch(swapper):
+    items = [(frame(), [face()]), (frame(255), [face()]), (frame(), [face()])]
+    result = swapper.swap_frames(items, face())
+    assert [int(f[0, 0, 0]) for f in result] == [1, 255, 1]
+    assert swapper.metrics.snapshot()['counters']['swap_failures'] == 1
+
+
+def test_detection_error_only_skips_that_frame(swapper):
+    def detect_faces(image):
+        raise RuntimeError("detector failed")
+
+    swapper.detect_faces = detect_faces
+    items = [(frame(), [face()]), (frame(), None)]
+    result = swapper.swap_frames(items, face())
+    assert [int(f[0, 0, 0]) for f in result] == [1, 0]
+    assert swapper.metrics.snapshot()['counters']['swap_failures'] == 1
+
+
+def test_repeat_and_faceless_frames_are_left_alone(swapper):
+    items = [(frame(), REPEAT_FRAME), (frame(), []), (frame(), [face()])]
+    result = swapper.swap_frames(items, face())
+    assert [int(f[0, 0, 0]) for f in result] == [0, 0, 1]
+    assert swapper.metrics.snapshot()['counters']['frames_no_face'] == 1
+
+
+def test_identity_mapping_uses_each_face_source(swapper):
+    mapped, unmapped = face(0), face(10)
+    mapped['source'] = face()
+    items = [(frame(), [mapped, unmapped])]
+    swapper.swap_frames(items, None)
+    assert len(swapper.swapped) == 1
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = str(tmp_path / "target.avi")
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 10, (64, 48))
+    for i in range(12):
+        out.write(np.full((48, 64, 3), i * 10, dtype=np.uint8))
+    out.release()
+    return path
+
+
+@pytest.fixture
+def video_swapper(swapper, tmp_path):
+    swapper.face_cache = SourceFaceCache()
+    swapper.get_source_face = lambda image, index=0: face()
+    swapper.detect_faces = lambda image, det_size=None: [face()]
+    cv2.imwrite(str(tmp_path / "source.png"), frame())
+    return swapper
+
+
+@pytest.mark.parametrize("batch_size", [1, 4])
+def test_process_video_batch_sizes(video_swapper, video, tmp_path, batch_size):
+    output = str(tmp_path / "output.avi")
+    video_swapper.process_video(str(tmp_path / "source.png"), video, output, batch_size=batch_size, num_workers=2)
+    assert video_swapper.metrics.snapshot()['counters']['frames_written'] == 12
+    assert len(video_swapper.swapped) == 12
+    assert cv2.VideoCapture(output).get(cv2.CAP_PROP_FRAME_COUNT) == 12
+
+
+def test_process_video_takes_an_options_object(video_swapper, video, tmp_path):
+    batches = []
+    swap_frames = video_swapper.swap_frames
+
+    def record(items, *args, **kwargs):
+        batches.append(len(items))
+        return swap_frames(items, *args, **kwargs)
+
+    video_swapper.swap_frames = record
+    options = VideoOptions(batch_size=3, end_frame=9)
+    video_swapper.process_video(str(tmp_path / "source.png"), video, str(tmp_path / "output.avi"), options,
+                                end_frame=6)  # Keyword arguments override the options
+    assert sum(batches) == 6 and max(batches) == 3
+    assert options.end_frame == 9
+    with pytest.raises(TypeError):
+        video_swapper.process_video(str(tmp_path / "source.png"), video, str(tmp_path / "output.avi"), bogus=1)
+
+
+def test_process_video_rejects_a_budget_below_one_frame(video_swapper, video, tmp_path):
+    output = tmp_path / "output.avi"
+    with pytest.raises(ValueError, match="Memory budget"):
+        video_swapper.process_video(str(tmp_path / "source.png"), video, str(output), memory_budget_mb=0.01)
+    assert not output.exists()
+
+
+def test_process_video_fits_batches_under_a_small_budget(video_swapper, video, tmp_path):
+    batches = []
+    swap_frames = video_swapper.swap_frames
+
+    def record(items, *args, **kwargs):
+        batches.append(len(items))
+        return swap_frames(items, *args, **kwargs)
+
+    video_swapper.swap_frames = record
+    # Three 64x48 frames: one decoding, two in flight
+    video_swapper.process_video(str(tmp_path / "source.png"), video, str(tmp_path / "output.avi"),
+                                memory_budget_mb=3 * 64 * 48 * 3 / 2**20, batch_size=4)
+    assert max(batches) == 2
+    assert sum(batches) == 12
+
+
+def test_load_analysis_builds_one_session_per_allowed_module(monkeypatch, tmp_path):
+    class FakeModel:
+        def __init__(self, model_file, session):
+            self.model_file, self.session = model_file, session
+
+        def prepare(self, ctx_id, **kwargs):
+            assert ctx_id >= 0  # ctx_id < 0 would rebuild the session
+            self.prepared = kwargs
+
+    monkeypatch.setattr(face_swapper, 'ensure_available', lambda *args, **kwargs: str(tmp_path))
+    monkeypatch.setattr(face_swapper, 'BUFFALO_L_MODULES',
+                        {task: (name, FakeModel) for task, (name, _) in face_swapper.BUFFALO_L_MODULES.items()})
+    sessions = []
+
+    def session_fn(path, taskname):
+        sessions.append((os.path.basename(path), taskname))
+        return taskname
+
+    app = face_swapper.load_analysis(['detection', 'recognition'], session_fn)
+    assert sorted(sessions) == [('det_10g.onnx', 'detection'), ('w600k_r50.onnx', 'recognition')]
+    assert sorted(app.models) == ['detection', 'recognition']
+    assert app.det_model.session == 'detection'
+    assert app.det_model.prepared == {'input_size': (640, 640), 'det_thresh': 0.5}
+
+
+def test_process_video_falls_back_when_locating_fails(video_swapper, video, tmp_path, monkeypatch):
+    class FlakyDetector:
+        def __init__(self, detect_fn, **kwargs):
+            self.calls = 0
+
+        def update(self, frame):
+            self.calls += 1
+            if self.calls == 3:
+                raise RuntimeError("lost track")
+            return [face()]
+
+    monkeypatch.setattr(face_swapper, 'RoiDetector', FlakyDetector)
+    video_swapper.min_face = 0
+    video_swapper.process_video(str(tmp_path / "source.png"), video, str(tmp_path / "output.avi"), roi_detect=True)
+    counters = video_swapper.metrics.snapshot()['counters']
+    assert counters['locate_failures'] == 1
+    assert len(video_swapper.swapped) == 12  # The failed frame was detected in full and swapped
+
+
+def test_mapped_video_detects_in_workers_and_assigns_in_order(video_swapper, video, tmp_path, monkeypatch):
+    detected_on, assigned_on, assigned = set(), set(), []
+
+    def detect_faces(image, det_size=None):
+        detected_on.add(threading.current_thread())
+        return [face()]
+
+    class RecordingMatcher(IdentityMatcher):
+        def assign(self, frame, faces):
+            assigned_on.add(threading.current_thread())
+            assigned.append(float(frame.mean()))
+            return super().assign(frame, faces)
+
+    monkeypatch.setattr(face_swapper, 'IdentityMatcher', RecordingMatcher)
+    video_swapper.detect_faces = detect_faces
+    video_swapper.embed_faces = lambda image, faces: np.ones((len(faces), 2), dtype=np.float32) / np.sqrt(2)
+    index = FaceIndex()
+    source = face()
+    source['embedding'] = np.ones(2, dtype=np.float32)
+    index.add([1, 1], source, identity='alice')
+    video_swapper.process_video(None, video, str(tmp_path / "output.avi"), face_index=index,
+                                batch_size=2, num_workers=3)
+    assert detected_on <= assigned_on  # Worker threads, not the decoder
+    assert assigned == sorted(assigned) and len(assigned) == 12
+    assert len(video_swapper.swapped) == 12
+
+
+def test_checkpoint_key_covers_output_options(video_swapper, video, tmp_path, monkeypatch):
+    keys = []
+    journal_cls = face_swapper.CheckpointJournal
+
+    def record(output_path, key, chunk_frames):
+        keys.append(key)
+        return journal_cls(output_path, key, chunk_frames)
+
+    monkeypatch.setattr(face_swapper, 'CheckpointJournal', record)
+    video_swapper.profile, video_swapper.model_variant = 'swap', 'fp32'
+    video_swapper.adaptive_det, video_swapper.min_face, video_swapper.tile_size = False, None, None
+    source, output = str(tmp_path / "source.png"), str(tmp_path / "output.avi")
+    for options in ({}, {}, {'skip_duplicates': True}, {'encode_options': {'crf': 30}}):
+        video_swapper.process_video(source, video, output, checkpoint_every=5, **options)
+    assert keys[0] == keys[1]
+    assert keys[2] != keys[0]
+    assert keys[3] not in (keys[0], keys[2])
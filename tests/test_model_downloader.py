@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils import model_downloader
+from utils.model_downloader import ChecksumError, download_url, fetch_model
+
+PAYLOAD = os.urandom(100_000)
+DIGEST = hashlib.sha256(PAYLOAD).hexdigest()
+
+
+class Server:
+    """Local file server; Range support and failing requests are switchable per test"""
+
+    def __init__(self):
+        self.ranges = True
+        self.fail_ranges = set()  # Range starts answered with a dropped connection
+        self.requests = []
+        self.etag = '"v1"'
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                header = self.headers.get('Range')
+                server.requests.append(header)
+                if header and server.ranges:
+                    start, _, end = header.split("=")[1].partition("-")
+                    start, end = int(start), int(end) if end else len(PAYLOAD) - 1
+                    body = PAYLOAD[start:end + 1]
+                    self.send_response(206)
+                    self.send_header('ETag', server.etag)
+                    self.send_header('Content-Range', f"bytes {start}-{end}/{len(PAYLOAD)}")
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    if start in server.fail_ranges:
+                        self.wfile.write(body[:10])  # Then hang up mid-chunk
+                        return
+                    self.wfile.write(body)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(PAYLOAD)))
+                self.end_headers()
+                self.wfile.write(PAYLOAD)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/model.onnx"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def chunk_requests(self):
+        return [r for r in self.requests if r and r != "bytes=0-0"]
+
+
+@pytest.fixture
+def server():
+    server = Server()
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
+
+
+def test_parallel_range_download(server, tmp_path):
+    out = str(tmp_path / "model.onnx")
+    assert download_url(server.url, out, DIGEST, connections=4, chunk_bytes=16_384) == DIGEST
+    assert open(out, "rb").read() == PAYLOAD
+    assert len(server.chunk_requests()) == 7
+    assert not os.path.exists(out + ".part") and not os.path.exists(out + ".part.json")
+
+
+def test_download_without_range_support(server, tmp_path):
+    server.ranges = False
+    out = str(tmp_path / "model.onnx")
+    assert download_url(server.url, out, DIGEST) == DIGEST
+    assert open(out, "rb").read() == PAYLOAD
+
+
+def test_interrupted_download_resumes(server, tmp_path):
+    out = str(tmp_path / "model.onnx")
+    server.fail_ranges = {3 * 16_384}
+    with pytest.raises(OSError):
+        download_url(server.url, out, DIGEST, connections=1, chunk_bytes=16_384)
+    assert not os.path.exists(out)
+    with open(out + ".part.json") as f:
+        assert 3 not in json.load(f)['done']
+
+    server.fail_ranges = set()
+    server.requests.clear()
+    assert download_url(server.url, out, DIGEST, connections=2, chunk_bytes=16_384) == DIGEST
+    assert open(out, "rb").read() == PAYLOAD
+    # Only the chunk that failed is fetched again
+    assert server.chunk_requests() == [f"bytes={3 * 16_384}-{4 * 16_384 - 1}"]
+
+
+def test_changed_file_restarts_instead_of_resuming(server, tmp_path):
+    out = str(tmp_path / "model.onnx")
+    server.fail_ranges = {3 * 16_384}
+    with pytest.raises(OSError):
+        download_url(server.url, out, DIGEST, connections=1, chunk_bytes=16_384)
+    with open(out + ".part.json") as f:
+        assert json.load(f)['etag'] == '"v1"'
+
+    server.fail_ranges = set()
+    server.requests.clear()
+    server.etag = '"v2"'  # Same size, new upload
+    assert download_url(server.url, out, DIGEST, connections=2, chunk_bytes=16_384) == DIGEST
+    assert len(server.chunk_requests()) == 7  # Nothing kept from the old file
+
+
+def test_checksum_mismatch(server, tmp_path):
+    out = str(tmp_path / "model.onnx")
+    with pytest.raises(ChecksumError):
+        download_url(server.url, out, "0" * 64, chunk_bytes=16_384)
+    assert not os.path.exists(out)
+    assert not os.path.exists(out + ".part")
+
+
+@pytest.fixture
+def entry(server, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv(model_downloader.MANIFEST_ENV, raising=False)
+    return {'filename': "model.onnx", 'sha256': None, 'urls': [server.url]}
+
+
+def test_first_download_pins_the_hash_locally_and_in_the_cache(entry, tmp_path):
+    cache = tmp_path / "cache"
+    fetch_model(entry, model_dir="models", cache_dir=str(cache))
+    assert (cache / "model.onnx").read_bytes() == PAYLOAD
+    for manifest in ("models/manifest.json", cache / "manifest.json"):
+        with open(manifest) as f:
+            assert json.load(f)["model.onnx"]["sha256"] == DIGEST
+
+
+def test_cache_hit_is_checked_against_the_shared_manifest(entry, server, tmp_path):
+    cache = tmp_path / "cache"
+    cache.mkdir()
+    (cache / "model.onnx").write_bytes(b"x" * len(PAYLOAD))  # Right size, wrong bytes
+    (cache / "manifest.json").write_text(json.dumps({"model.onnx": {"sha256": DIGEST}}))
+    fetch_model(dict(entry, sha256=DIGEST), model_dir="models", cache_dir=str(cache))
+    assert (tmp_path / "models" / "model.onnx").read_bytes() == PAYLOAD
+    assert server.requests  # Downloaded instead of trusting the cache
+
+
+def test_shared_manifest_overrides_local_pins(monkeypatch, tmp_path):
+    monkeypatch.setattr(model_downloader, 'MODELS', [{'filename': "model.onnx", 'sha256': None, 'urls': []}])
+    local, shared = tmp_path / "local.json", tmp_path / "shared.json"
+    local.write_text(json.dumps({"model.onnx": {"sha256": "a" * 64, "urls": ["http://local/"]}}))
+    shared.write_text(json.dumps({"model.onnx": {"sha256": "b" * 64}}))
+    monkeypatch.setenv(model_downloader.MANIFEST_ENV, str(shared))
+    entry, = model_downloader.load_manifest(str(local), model_downloader.shared_manifests())
+    assert entry['sha256'] == "b" * 64
+    assert entry['urls'] == ["http://local/"]
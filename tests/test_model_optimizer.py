@@ -0,0 +1,40 @@
+import onnx
+import onnxruntime as ort
+import pytest
+from onnx import TensorProto, helper
+
+from utils import model_optimizer
+
+
+@pytest.fixture
+def model(tmp_path):
+    x = helper.make_tensor_value_info('x', TensorProto.FLOAT, [1, 4])
+    y = helper.make_tensor_value_info('y', TensorProto.FLOAT, [1, 4])
+    graph = helper.make_graph([helper.make_node('Relu', ['x'], ['y'])], 'relu', [x], [y])
+    proto = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 13)])
+    proto.ir_version = 8
+    path = str(tmp_path / "relu.onnx")
+    onnx.save(proto, path)
+    return path
+
+
+def test_session_cache_is_saved_portable_and_reused(model, tmp_path, monkeypatch):
+    optimized = []
+    optimize_graph = model_optimizer.optimize_graph
+
+    def record(src, dst):
+        optimized.append(src)
+        return optimize_graph(src, dst)
+
+    monkeypatch.setattr(model_optimizer, 'optimize_graph', record)
+    cache_dir = str(tmp_path / "cache")
+    first = model_optimizer.create_session(model, cache_dir=cache_dir)
+    second = model_optimizer.create_session(model, cache_dir=cache_dir)
+    assert optimized == [model]  # Only the first load optimizes and saves
+    assert first.get_inputs()[0].name == second.get_inputs()[0].name == 'x'
+    assert second._model_path == model_optimizer.cached_model_path(model, cache_dir)
+
+
+def test_sessions_run_every_optimization_at_load(model):
+    so = model_optimizer.session_options()
+    assert so.graph_optimization_level == ort.GraphOptimizationLevel.ORT_ENABLE_ALL
@@ -0,0 +1,145 @@
+import os
+import threading
+import time
+
+import pytest
+
+from core import segments
+from core.segments import SegmentQueue, _prepare_segment_dir, _run_queued, plan_segments
+
+
+def task(job, index, seg_dir="/tmp/out.mp4.segments"):
+    return {'job': job, 'index': index, 'output': os.path.join(seg_dir, f"segment_{index:05d}.mp4")}
+
+
+def test_plan_segments_even_split():
+    assert plan_segments(100, 4) == [(0, 25), (25, 50), (50, 75), (75, None)]
+
+
+def test_plan_segments_snaps_to_keyframes():
+    assert plan_segments(100, 2, keyframes=[0, 40, 90]) == [(0, 40), (40, None)]
+
+
+def test_plan_segments_drops_duplicate_cuts():
+    assert plan_segments(100, 4, keyframes=[0, 60]) == [(0, 60), (60, None)]
+    assert plan_segments(0, 4) == [(0, None)]
+
+
+def test_queue_lifecycle(tmp_path):
+    queue = SegmentQueue(tmp_path)
+    for i in range(2):
+        queue.submit(task("job", i))
+    name, claimed = queue.claim()
+    assert claimed['index'] == 0
+    queue.finish(name, claimed)
+    name, claimed = queue.claim()
+    queue.finish(name, claimed, error="boom")
+    assert queue.claim() == (None, None)
+    done, failed = queue.results("job")
+    assert [t['index'] for t in done] == [0]
+    assert failed[0]['error'] == "boom"
+
+
+def test_requeue_stale(tmp_path):
+    queue = SegmentQueue(tmp_path)
+    queue.submit(task("job", 0))
+    queue.submit(task("job", 1))
+    stale, _ = queue.claim()
+    fresh, _ = queue.claim()
+    old = time.time() - 600
+    os.utime(tmp_path / "claimed" / stale, (old, old))
+    assert queue.requeue_stale(300) == 1
+    assert queue.pending("job") == 1
+    assert queue.claim()[0] == stale
+    queue.touch(fresh)
+    assert queue.requeue_stale(300) == 0
+
+
+def test_discard(tmp_path):
+    queue = SegmentQueue(tmp_path)
+    queue.submit(task("old", 0))
+    queue.submit(task("other", 0, seg_dir="/tmp/other.mp4.segments"))
+    assert queue.claim()[0] == "old_00000.json"
+    queue.submit(task("old", 1))
+    queue.discard(lambda t: t['job'] == "old")
+    assert os.listdir(tmp_path / "claimed") == []
+    assert os.listdir(tmp_path / "pending") == ["other_00000.json"]
+
+
+def test_segment_dir_reused_only_for_the_same_plan(tmp_path):
+    seg_dir = str(tmp_path / "out.mp4.segments")
+    job = _prepare_segment_dir(seg_dir, ["source", "target", [[0, None]], {}])
+    open(os.path.join(seg_dir, "segment_00000.mp4"), "w").close()
+    assert _prepare_segment_dir(seg_dir, ["source", "target", [[0, None]], {}]) == job
+    assert os.path.exists(os.path.join(seg_dir, "segment_00000.mp4"))
+    assert _prepare_segment_dir(seg_dir, ["source", "target", [[0, 10], [10, None]], {}]) != job
+    assert not os.path.exists(os.path.join(seg_dir, "segment_00000.mp4"))
+
+
+def test_run_queued_times_out_without_workers(tmp_path):
+    with pytest.raises(TimeoutError):
+        _run_queued([task("job", 0)], str(tmp_path), None, 0, None, poll_interval=0.05, timeout=0.2)
+
+
+def test_run_queued_drops_leftover_tasks_of_the_same_job(tmp_path):
+    queue = SegmentQueue(tmp_path)
+    queue.submit(task("job", 0))
+    name, claimed = queue.claim()
+    queue.finish(name, claimed, error="from an earlier run")
+    # Without the cleanup the old failure would abort this run
+    with pytest.raises(TimeoutError):
+        _run_queued([task("job", 0)], str(tmp_path), None, 0, None, poll_interval=0.05, timeout=0.2)
+
+
+def test_run_queued_requeues_tasks_of_dead_workers(tmp_path):
+    queue = SegmentQueue(tmp_path)
+    progress = []
+
+    def remote_worker():
+        # The first claim is abandoned, as if the worker crashed
+        abandoned = None
+        while True:
+            name, claimed = queue.claim()
+            if name is None:
+                time.sleep(0.02)
+                continue
+            if abandoned is None:
+                abandoned = name
+                old = time.time() - 600
+                os.utime(tmp_path / "claimed" / name, (old, old))
+                continue
+            queue.finish(name, claimed)
+            if len(queue.results("job")[0]) == 2:
+                return
+
+    worker = threading.Thread(target=remote_worker, daemon=True)
+    worker.start()
+    _run_queued([task("job", 0), task("job", 1)], str(tmp_path), None, 0,
+                lambda done, total: progress.append((done, total)), poll_interval=0.05, timeout=10)
+    worker.join(timeout=5)
+    assert progress[-1] == (2, 2)
+
+
+def test_default_processes_fit_in_memory(monkeypatch):
+    import psutil
+
+    class Memory:
+        available = 4 * 1536 * 2**20
+
+    monkeypatch.setattr(psutil, 'virtual_memory', lambda: Memory)
+    monkeypatch.setattr(os, 'cpu_count', lambda: 32)
+    assert segments.default_processes() == 4
+    Memory.available = 0
+    assert segments.default_processes() == 1
+
+
+def test_segment_swappers_are_reused_per_options(monkeypatch):
+    from core import face_swapper
+
+    built = []
+    monkeypatch.setattr(face_swapper, 'FaceSwapper', lambda **kwargs: built.append(kwargs) or object())
+    monkeypatch.setattr(segments, '_swappers', {})
+    first = segments._get_swapper({'intra_op_threads': 8, 'model_variant': 'fp32'})
+    assert segments._get_swapper({'model_variant': 'fp32', 'intra_op_threads': 8}) is first
+    segments._get_swapper({'intra_op_threads': 4, 'model_variant': 'fp32'})
+    assert built == [{'intra_op_threads': 8, 'model_variant': 'fp32'}, {'intra_op_threads': 4, 'model_variant': 'fp32'}]
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from insightface.app.common import Face
+
+from core.face_cache import ResultCache
+from core.metrics import Metrics
+
+pytest.importorskip("fastapi")
+from server.app import SwapRequest, swap_requests  # noqa: E402
+
+
+class FakeSwapper:
+    def __init__(self, result_cache=None):
+        self.result_cache = result_cache
+        self.metrics = Metrics()
+
+    def result_key(self, source_img, target_img, source_face_index, target_face_index):
+        return f"{int(target_img[0, 0, 0])}"
+
+    def get_source_face(self, image, index):
+        return Face(bbox=np.zeros(4))
+
+    def detect_faces(self, image):
+        return [Face(bbox=np.zeros(4))]
+
+    def swap_batch(self, jobs):
+        if any(img[0, 0, 0] == 255 for img, _, _ in jobs):
+            raise RuntimeError("bad crop")
+        for img, _, _ in jobs:
+            img += 1
+        return [img for img, _, _ in jobs]
+
+
+def request(value, target_face_index=0):
+    image = np.full((2, 2, 3), value, dtype=np.uint8)
+    return SwapRequest(image.copy(), image, 0, target_face_index, future=None)
+
+
+def test_bad_request_only_fails_itself():
+    outcomes = swap_requests(FakeSwapper(), [request(0), request(255), request(10)])
+    assert int(outcomes[0][0, 0, 0]) == 1
+    assert isinstance(outcomes[1], RuntimeError)
+    assert int(outcomes[2][0, 0, 0]) == 11
+
+
+def test_cache_hits_survive_a_failed_batch():
+    cache = ResultCache()
+    cache.put("5", np.full((2, 2, 3), 6, dtype=np.uint8))
+    outcomes = swap_requests(FakeSwapper(cache), [request(5), request(255), request(1, target_face_index=3)])
+    assert int(outcomes[0][0, 0, 0]) == 6
+    assert isinstance(outcomes[1], RuntimeError)
+    assert isinstance(outcomes[2], ValueError)
+    assert cache.get("255") is None  # Failures are never cached
+
+
+@pytest.mark.parametrize("values", [[0, 10], [0]])
+def test_successes_are_cached(values):
+    cache = ResultCache()
+    swap_requests(FakeSwapper(cache), [request(v) for v in values])
+    assert all(int(cache.get(str(v))[0, 0, 0]) == v + 1 for v in values)
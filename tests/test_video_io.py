@@ -0,0 +1,86 @@
+import json
+import subprocess
+
+import numpy as np
+import pytest
+
+from core import video_io
+from core.video_io import FramePool, budget_frames
+
+FRAME_8K = (4320, 7680, 3)
+
+
+def test_budget_frames():
+    frame_mb = 1080 * 1920 * 3 / 2**20
+    assert budget_frames(int(frame_mb * 10) + 1, (1080, 1920, 3)) == 10
+    assert budget_frames(int(frame_mb * 10) + 1, (1080, 1920, 3), spare=2) == 8
+
+
+def test_budget_smaller_than_a_frame_is_rejected():
+    with pytest.raises(ValueError, match="needs at least 190 MB"):
+        budget_frames(64, FRAME_8K, spare=1)
+
+
+def test_frame_pool_reuses_buffers():
+    pool = FramePool((2, 2, 3), count=2)
+    a, b, c = pool.acquire(), pool.acquire(), pool.acquire()  # Never blocks
+    for frame in (a, b, c):
+        pool.release(frame)
+    assert pool.acquire() is b  # Most recently released first, only `count` kept
+    assert pool.acquire() is a
+    assert pool.acquire() is not c
+
+
+def test_frame_pool_ignores_other_shapes():
+    pool = FramePool((2, 2, 3), count=2)
+    pool.release(np.zeros((3, 3, 3), dtype=np.uint8))
+    assert pool.acquire().shape == (2, 2, 3)
+
+
+def ffprobe_output(video_stream, audio=False):
+    streams = [dict({'codec_type': 'video', 'r_frame_rate': '30/1', 'nb_frames': '90'}, **video_stream)]
+    if audio:
+        streams.append({'codec_type': 'audio'})
+    return json.dumps({'streams': streams})
+
+
+@pytest.mark.parametrize("stream, size", [
+    ({'width': 1920, 'height': 1080}, (1920, 1080)),
+    ({'width': 1920, 'height': 1080, 'side_data_list': [{'rotation': -90}]}, (1080, 1920)),
+    ({'width': 1920, 'height': 1080, 'tags': {'rotate': '270'}}, (1080, 1920)),
+    ({'width': 1920, 'height': 1080, 'side_data_list': [{'rotation': 180}]}, (1920, 1080)),
+])
+def test_ffmpeg_probe_reports_the_displayed_size(monkeypatch, stream, size):
+    def run(cmd, **kwargs):
+        return subprocess.CompletedProcess(cmd, 0, stdout=ffprobe_output(stream, audio=True))
+
+    monkeypatch.setattr(video_io.subprocess, 'run', run)
+    info = video_io.probe("clip.mp4", 'ffmpeg')
+    assert (info['width'], info['height']) == size
+    assert info['frames'] == 90 and info['fps'] == 30.0 and info['has_audio']
+
+
+@pytest.mark.parametrize("rates, vfr", [(('30/1', '30/1'), False), (('30000/1001', '0/0'), False),
+                                         (('60/1', '24107/1000'), True)])
+def test_ffmpeg_probe_detects_variable_frame_rates(monkeypatch, rates, vfr):
+    stream = {'width': 64, 'height': 48, 'r_frame_rate': rates[0], 'avg_frame_rate': rates[1]}
+    monkeypatch.setattr(video_io.subprocess, 'run',
+                        lambda cmd, **kwargs: subprocess.CompletedProcess(cmd, 0, stdout=ffprobe_output(stream)))
+    assert video_io.probe("clip.mp4", 'ffmpeg')['vfr'] == vfr
+
+
+@pytest.mark.parametrize("vfr", [False, True])
+def test_ffmpeg_reader_seeks_by_frame_count_when_vfr(monkeypatch, vfr):
+    commands = []
+    monkeypatch.setattr(video_io.subprocess, 'Popen', lambda cmd, **kwargs: commands.append(cmd))
+    video_io.FFmpegReader("clip.mp4", 64, 48, 30.0, start_frame=90, vfr=vfr)
+    assert ("-ss" in commands[0]) != vfr
+    assert ("trim=start_frame=90" in commands[0]) == vfr
+
+
+@pytest.mark.parametrize("size, padded", [((1280, 720), False), ((1279, 720), True), ((640, 361), True)])
+def test_ffmpeg_writer_pads_odd_sizes(monkeypatch, size, padded):
+    commands = []
+    monkeypatch.setattr(video_io.subprocess, 'Popen', lambda cmd, **kwargs: commands.append(cmd))
+    video_io.FFmpegWriter("out.mp4", 25, size)
+    assert ("pad=ceil(iw/2)*2:ceil(ih/2)*2" in commands[0]) == padded
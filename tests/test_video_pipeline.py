@@ -0,0 +1,105 @@
+import threading
+import time
+
+import pytest
+
+from core.video_pipeline import VideoPipeline
+
+
+def double(items):
+    assert isinstance(items, list)
+    # Uneven delays so workers finish out of order
+    time.sleep(0.001 * (items[0] % 3))
+    return [item * 2 for item in items]
+
+
+@pytest.mark.parametrize("batch_size", [1, 3, 4])
+@pytest.mark.parametrize("num_workers", [1, 4])
+def test_frames_written_in_order(batch_size, num_workers):
+    written = []
+    VideoPipeline(double, num_workers=num_workers, batch_size=batch_size).run(range(50), written.append)
+    assert written == [i * 2 for i in range(50)]
+
+
+def test_process_fn_always_gets_a_list():
+    batches = []
+
+    def process(items):
+        batches.append(list(items))
+        return items
+
+    VideoPipeline(process, num_workers=1, batch_size=1).run(range(5), lambda frame: None)
+    assert sorted(batches) == [[0], [1], [2], [3], [4]]
+
+
+def test_prepare_fn_runs_in_frame_order():
+    seen = []
+
+    def prepare(frame):
+        seen.append(frame)
+        return frame + 100
+
+    written = []
+    VideoPipeline(lambda items: items, num_workers=3, prepare_fn=prepare, batch_size=2).run(range(9),
+                                                                                            written.append)
+    assert seen == list(range(9))
+    assert written == [i + 100 for i in range(9)]
+
+
+def test_progress_callback():
+    calls = []
+    VideoPipeline(double, num_workers=2, batch_size=2).run(range(5), lambda f: None,
+                                                           callback=lambda cur, total: calls.append((cur, total)),
+                                                           total=5)
+    assert calls == [(i, 5) for i in range(1, 6)]
+
+
+def test_inflight_frames_are_capped():
+    inflight = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def frames():
+        nonlocal inflight, peak
+        for i in range(40):
+            with lock:
+                inflight += 1
+                peak = max(peak, inflight)
+            yield i
+
+    def write(frame):
+        nonlocal inflight
+        with lock:
+            inflight -= 1
+
+    pipeline = VideoPipeline(double, num_workers=4, max_inflight=6, batch_size=2)
+    pipeline.run(frames(), write)
+    assert pipeline.max_inflight == 6
+    assert peak <= 6 + 1  # Plus the frame decoded while waiting for a slot
+
+
+def test_worker_error_is_raised():
+    def process(items):
+        if 7 in items:
+            raise RuntimeError("bad frame")
+        return items
+
+    with pytest.raises(RuntimeError, match="bad frame"):
+        VideoPipeline(process, num_workers=2, batch_size=1).run(range(100), lambda frame: None)
+
+
+def test_reader_error_is_raised():
+    def frames():
+        yield 0
+        raise OSError("read failed")
+
+    with pytest.raises(OSError, match="read failed"):
+        VideoPipeline(double, num_workers=2).run(frames(), lambda frame: None)
+
+
+def test_writer_error_is_raised():
+    def write(frame):
+        raise ValueError("disk full")
+
+    with pytest.raises(ValueError, match="disk full"):
+        VideoPipeline(double, num_workers=2).run(range(100), write)
@@ -1,7 +1,49 @@
+import argparse
+import hashlib
+import json
 import os
+import shutil
+import threading
+import urllib.error
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
 from tqdm import tqdm
 
+MODEL_DIR = "models"
+# Local overrides and pinned hashes: {"inswapper_128.onnx": {"sha256": "...", "urls": [...]}}
+MANIFEST_PATH = os.path.join(MODEL_DIR, "manifest.json")
+MIRROR_ENV = "FACEREENACT_MODEL_MIRROR"  # Base URL tried first, e.g. http://fileserver/models/
+CACHE_ENV = "FACEREENACT_MODEL_CACHE"  # Directory shared between nodes/checkouts
+# Provisioned manifest of known-good hashes, same format as MANIFEST_PATH; wins over local pins.
+# A manifest.json in the cache directory is read the same way.
+MANIFEST_ENV = "FACEREENACT_MODEL_MANIFEST"
+CHUNK_BYTES = 16 * 2**20
+USER_AGENT = "FaceReenact-Pro model downloader"
+
+# sha256 stays None until a known-good hash is pinned (see --pin) or provisioned through a
+# shared manifest ($FACEREENACT_MODEL_MANIFEST, <cache dir>/manifest.json); never guess one
+MODELS = [
+    {
+        'filename': "inswapper_128.onnx",
+        'description': "face swap model (~554MB)",
+        'required': True,
+        'sha256': None,
+        'urls': ["https://huggingface.co/ezioruan/inswapper_128.onnx/resolve/main/inswapper_128.onnx"],
+        'manual': "https://huggingface.co/ezioruan/inswapper_128.onnx/tree/main",
+    },
+    {
+        'filename': "GFPGANv1.4.pth",
+        'description': "face enhancer model (~349MB)",
+        'required': False,
+        'sha256': None,
+        'urls': ["https://github.com/TencentARC/GFPGAN/releases/download/v1.3.0/GFPGANv1.4.pth",
+                 "https://huggingface.co/datasets/Gourieff/ReActor/resolve/main/models/facerestore_models/GFPGANv1.4.pth"],
+        'manual': "https://github.com/TencentARC/GFPGAN/releases/tag/v1.3.0",
+    },
+]
+
+
 class DownloadProgressBar(tqdm):
     """Progress bar for download tracking"""
     def update_to(self, b=1, bsize=1, tsize=None):
@@ -9,69 +51,281 @@ class DownloadProgressBar(tqdm):
             self.total = tsize
         self.update(b * bsize - self.n)
 
-def download_url(url, output_path):
-    """Download a file from URL with progress bar"""
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    with DownloadProgressBar(unit='B', unit_scale=True, miniters=1, desc=output_path.split(os.sep)[-1]) as t:
-        urllib.request.urlretrieve(url, filename=output_path, reporthook=t.update_to)
 
-def ensure_models():
+class ChecksumError(Exception):
+    pass
+
+
+def sha256_file(path, block=4 * 2**20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for data in iter(lambda: f.read(block), b""):
+            h.update(data)
+    return h.hexdigest()
+
+
+def _open(url, start=None, end=None, timeout=30, if_range=None):
+    headers = {'User-Agent': USER_AGENT}
+    if start is not None:
+        headers['Range'] = f"bytes={start}-{'' if end is None else end}"
+        if if_range:
+            headers['If-Range'] = if_range  # The server sends the whole (changed) file instead of a stale range
+    return urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=timeout)
+
+
+def probe_url(url):
+    """
+    (size or None, whether the server honours Range requests, validators):
+    validators holds the ETag and Last-Modified headers, None when missing.
+    """
+    with _open(url, 0, 0) as resp:
+        validators = {'etag': resp.headers.get('ETag'), 'last_modified': resp.headers.get('Last-Modified')}
+        if resp.status == 206:
+            total = resp.headers.get('Content-Range', '').rpartition('/')[2]
+            return (int(total) if total.isdigit() else None), True, validators
+        length = resp.headers.get('Content-Length')
+        return (int(length) if length and length.isdigit() else None), False, validators
+
+
+def _copy_stream(resp, f, bar, limit=None):
+    remaining = limit
+    while remaining is None or remaining > 0:
+        data = resp.read(2**20 if remaining is None else min(2**20, remaining))
+        if not data:
+            break
+        f.write(data)
+        bar.update(len(data))
+        if remaining is not None:
+            remaining -= len(data)
+    if remaining:
+        raise OSError(f"Connection closed with {remaining} bytes missing")
+
+
+def _write_state(path, state):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def download_url(url, output_path, sha256=None, connections=4, chunk_bytes=CHUNK_BYTES):
+    """
+    Download a file from URL with progress bar, resumable and in parallel.
+
+    Data goes to output_path + '.part' and only replaces output_path once it
+    is complete and matches sha256 (when given). Servers that honour Range
+    are fetched in chunk_bytes pieces over `connections` connections, and the
+    finished chunks are recorded next to the .part file, so an interrupted
+    download resumes where it stopped. It only resumes from the same URL
+    while the server reports the same ETag and Last-Modified; otherwise the
+    file changed and the download starts over. Returns the file's SHA-256.
+    """
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    part, state_path = output_path + ".part", output_path + ".part.json"
+    size, ranges, validators = probe_url(url)
+    etag = validators['etag']
+    # A weak ETag can't be used with If-Range; Last-Modified can
+    if_range = etag if etag and not etag.startswith('W/') else validators['last_modified']
+
+    with DownloadProgressBar(unit='B', unit_scale=True, miniters=1, total=size,
+                             desc=os.path.basename(output_path)) as bar:
+        if ranges and size:
+            chunks = [(start, min(start + chunk_bytes, size) - 1) for start in range(0, size, chunk_bytes)]
+            state = dict(validators, url=url, size=size, chunk_bytes=chunk_bytes, done=[])
+            if os.path.exists(state_path) and os.path.exists(part):
+                with open(state_path) as f:
+                    saved = json.load(f)
+                if all(saved.get(key) == state[key] for key in ('url', 'size', 'chunk_bytes', 'etag', 'last_modified')):
+                    state['done'] = saved['done']
+                else:
+                    print(f"⚠ {os.path.basename(output_path)} changed on the server, restarting its download")
+                    bar.update(sum(end - start + 1 for i, (start, end) in enumerate(chunks) if i in state['done']))
+            if not state['done'] or not os.path.exists(part):
+                with open(part, "wb") as f:
+                    f.truncate(size)
+            lock = threading.Lock()
+
+            def fetch(i):
+                start, end = chunks[i]
+                with _open(url, start, end, if_range=if_range) as resp, open(part, "r+b") as f:
+                    if resp.status != 206:
+                        raise OSError(f"Server ignored the Range request for chunk {i}")
+                    f.seek(start)
+                    _copy_stream(resp, f, bar, end - start + 1)
+                with lock:
+                    state['done'].append(i)
+                    _write_state(state_path, state)
+
+            todo = [i for i in range(len(chunks)) if i not in set(state['done'])]
+            with ThreadPoolExecutor(max_workers=max(1, connections)) as pool:
+                for future in [pool.submit(fetch, i) for i in todo]:
+                    future.result()
+        else:
+            # No Range support: a single stream, restarted from zero on failure
+            with _open(url) as resp, open(part, "wb") as f:
+                _copy_stream(resp, f, bar, size)
+
+    digest = sha256_file(part)
+    if sha256 and digest != sha256.lower():
+        for path in (part, state_path):
+            if os.path.exists(path):
+                os.remove(path)
+        raise ChecksumError(f"SHA-256 mismatch for {os.path.basename(output_path)}: expected {sha256}, got {digest}")
+    os.replace(part, output_path)
+    if os.path.exists(state_path):
+        os.remove(state_path)
+    return digest
+
+
+def _read_manifest(path):
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+
+def shared_manifests(cache_dir=None):
+    """Provisioned manifests, lowest priority first"""
+    paths = [os.path.join(cache_dir, "manifest.json") if cache_dir else None, os.environ.get(MANIFEST_ENV)]
+    return [path for path in paths if path]
+
+
+def load_manifest(path=MANIFEST_PATH, shared=()):
+    """
+    Built-in model list merged with the local manifest (pinned hashes, extra
+    URLs) and then the shared manifests, whose hashes override local pins.
+    """
+    layers = [_read_manifest(path)] + [_read_manifest(p) for p in shared]
+    models = []
+    for entry in MODELS:
+        entry = dict(entry)
+        urls = []
+        for overrides in layers:
+            local = overrides.get(entry['filename'], {})
+            if local.get('sha256'):
+                entry['sha256'] = local['sha256']
+            urls = list(local.get('urls', [])) + urls
+        entry['urls'] = urls + entry['urls']
+        models.append(entry)
+    return models
+
+
+def pin_hash(filename, digest, path=MANIFEST_PATH):
+    manifest = _read_manifest(path)
+    manifest.setdefault(filename, {})['sha256'] = digest
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    _write_state(path, manifest)
+
+
+def is_valid(path, sha256=None, urls=()):
+    """
+    Whether an existing model file is complete. With a known hash it must
+    match; without one its size is checked against the server's, so a file
+    cut short by an old interrupted download isn't taken as valid.
+    """
+    if not os.path.exists(path):
+        return False
+    if sha256:
+        return sha256_file(path) == sha256.lower()
+    for url in urls:
+        try:
+            size, _, _ = probe_url(url)
+        except (urllib.error.URLError, OSError, ValueError):
+            continue
+        if size is not None:
+            return os.path.getsize(path) == size
+    return True  # Offline and nothing to compare against
+
+
+def _candidate_urls(entry, mirror):
+    urls = list(entry['urls'])
+    if mirror:
+        urls.insert(0, mirror.rstrip("/") + "/" + entry['filename'])
+    return urls
+
+
+def fetch_model(entry, model_dir=MODEL_DIR, mirror=None, cache_dir=None, connections=4):
+    """
+    Make sure one model is present and verified: local file, then cache dir,
+    then mirror/URLs. A file whose hash nobody has pinned yet is trusted on
+    first use and its hash pinned locally and in the cache dir's manifest,
+    so every node sharing that cache verifies against the same bytes.
+    """
+    path = os.path.join(model_dir, entry['filename'])
+    urls = _candidate_urls(entry, mirror)
+    if is_valid(path, entry['sha256'], urls):
+        return path
+
+    cached = os.path.join(cache_dir, entry['filename']) if cache_dir else None
+    digest = None
+    if cached and is_valid(cached, None, urls):
+        print(f"Copying {entry['filename']} from cache {cache_dir}")
+        os.makedirs(model_dir, exist_ok=True)
+        shutil.copyfile(cached, path + ".part")
+        digest = sha256_file(path + ".part")  # Verify the copy itself, not just the cache file
+        if entry['sha256'] and digest != entry['sha256'].lower():
+            print(f"⚠ Cached {entry['filename']} does not match the pinned sha256, downloading instead")
+            os.remove(path + ".part")
+            digest = None
+        else:
+            os.replace(path + ".part", path)
+
+    if digest is None:
+        errors = []
+        for url in urls:
+            try:
+                digest = download_url(url, path, entry['sha256'], connections=connections)
+                break
+            except (urllib.error.URLError, OSError, ValueError, ChecksumError) as e:
+                print(f"⚠ {url}: {e}")
+                errors.append(e)
+        else:
+            raise errors[-1] if errors else FileNotFoundError(entry['filename'])
+        if cached:
+            os.makedirs(cache_dir, exist_ok=True)
+            shutil.copyfile(path, cached + ".part")
+            os.replace(cached + ".part", cached)
+
+    if not entry['sha256']:
+        # Later runs, here and on nodes sharing the cache, verify against these bytes
+        print(f"⚠ No pinned sha256 for {entry['filename']}, trusting it on first use")
+        pin_hash(entry['filename'], digest)
+        print(f"  pinned sha256 {digest} in {MANIFEST_PATH}")
+        if cache_dir:
+            pin_hash(entry['filename'], digest, os.path.join(cache_dir, "manifest.json"))
+    return path
+
+
+def ensure_models(mirror=None, cache_dir=None, connections=4):
     """
     Download all required models for FaceReenact-Pro.
     This will automatically download models on first run.
     """
-    model_dir = "models"
-    os.makedirs(model_dir, exist_ok=True)
+    mirror = mirror or os.environ.get(MIRROR_ENV)
+    cache_dir = cache_dir or os.environ.get(CACHE_ENV)
+    os.makedirs(MODEL_DIR, exist_ok=True)
     
     print("=" * 60)
     print("FaceReenact-Pro Model Downloader")
     print("=" * 60)
     
     all_success = True
-
-    # 1. Main face swap model: inswapper_128.onnx (~554MB)
-    model_path = os.path.join(model_dir, "inswapper_128.onnx")
-    if not os.path.exists(model_path):
-        print("\n[1/2] Downloading face swap model (~554MB)...")
-        print("This will happen only once and may take a few minutes.")
-        url = "https://huggingface.co/ezioruan/inswapper_128.onnx/resolve/main/inswapper_128.onnx"
-        try:
-            download_url(url, model_path)
-            print("✓ Face swap model downloaded successfully!")
-        except urllib.error.HTTPError as e:
-            print(f"✗ Error downloading model: {e}")
-            print("\nManual download required:")
-            print("URL: https://huggingface.co/ezioruan/inswapper_128.onnx/tree/main")
-            print(f"Save to: {model_path}")
-            all_success = False
-    else:
-        print("\n[1/2] ✓ Face swap model already exists")
-
-    # 2. GFPGAN for face restoration (~349MB)
-    gfpgan_path = os.path.join(model_dir, "GFPGANv1.4.pth")
-    if not os.path.exists(gfpgan_path):
-        print("\n[2/2] Downloading face enhancer model (~349MB)...")
-        print("This improves output quality significantly.")
-        url = "https://github.com/TencentARC/GFPGAN/releases/download/v1.3.0/GFPGANv1.4.pth"
+    models = load_manifest(shared=shared_manifests(cache_dir))
+    for i, entry in enumerate(models, 1):
+        print(f"\n[{i}/{len(models)}] {entry['description']}")
         try:
-            download_url(url, gfpgan_path)
-            print("✓ Face enhancer downloaded successfully!")
-        except urllib.error.HTTPError as e:
-            print(f"⚠ Warning: Could not download from GitHub: {e}")
-            print("Trying alternative source...")
-            # Fallback to Hugging Face mirror
-            try:
-                alt_url = "https://huggingface.co/datasets/Gourieff/ReActor/resolve/main/models/facerestore_models/GFPGANv1.4.pth"
-                download_url(alt_url, gfpgan_path)
-                print("✓ Face enhancer downloaded from alternative source!")
-            except Exception as e2:
-                print(f"✗ Alternative download also failed: {e2}")
-                print("\nManual download (optional but recommended):")
-                print("URL: https://github.com/TencentARC/GFPGAN/releases/tag/v1.3.0")
-                print(f"Save to: {gfpgan_path}")
+            fetch_model(entry, mirror=mirror, cache_dir=cache_dir, connections=connections)
+            print(f"✓ {entry['filename']} is ready")
+        except (OSError, ValueError, ChecksumError) as e:
+            mark = "✗" if entry['required'] else "⚠"
+            print(f"{mark} Could not download {entry['filename']}: {e}")
+            print("\nManual download" + ("" if entry['required'] else " (optional but recommended)") + ":")
+            print(f"URL: {entry['manual']}")
+            print(f"Save to: {os.path.join(MODEL_DIR, entry['filename'])}")
+            if entry['required']:
+                all_success = False
+            else:
                 print("\nNote: You can continue without it, but face quality may be lower.")
-    else:
-        print("\n[2/2] ✓ Face enhancer model already exists")
 
     print("\n" + "=" * 60)
     if all_success:
@@ -84,8 +338,40 @@ def ensure_models():
     
     return all_success
 
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Download and verify FaceReenact-Pro models")
+    parser.add_argument("--mirror", help=f"Base URL tried before the public sources (or ${MIRROR_ENV})")
+    parser.add_argument("--cache-dir", help=f"Shared local model cache (or ${CACHE_ENV})")
+    parser.add_argument("--connections", type=int, default=4, help="Parallel connections per file (default: 4)")
+    parser.add_argument("--verify", action="store_true", help="Only check the files in models/ against the manifest")
+    parser.add_argument("--pin", action="store_true", help="Record the SHA-256 of the files in models/ as known-good")
+    args = parser.parse_args(argv)
+
+    if args.verify or args.pin:
+        ok = True
+        for entry in load_manifest(shared=shared_manifests(args.cache_dir or os.environ.get(CACHE_ENV))):
+            path = os.path.join(MODEL_DIR, entry['filename'])
+            if not os.path.exists(path):
+                print(f"- {entry['filename']}: missing")
+                ok = ok and not entry['required']
+                continue
+            digest = sha256_file(path)
+            if args.pin:
+                pin_hash(entry['filename'], digest)
+                print(f"✓ {entry['filename']}: pinned {digest}")
+            elif entry['sha256'] is None:
+                print(f"? {entry['filename']}: no pinned hash ({digest})")
+            elif digest == entry['sha256'].lower():
+                print(f"✓ {entry['filename']}: ok")
+            else:
+                print(f"✗ {entry['filename']}: sha256 {digest} does not match {entry['sha256']}")
+                ok = False
+        return 0 if ok else 1
+    return 0 if ensure_models(args.mirror, args.cache_dir, args.connections) else 1
+
 if __name__ == "__main__":
-    ensure_models()
+    raise SystemExit(main())
 
 
 
@@ -0,0 +1,341 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import platform
+import threading
+import time
+
+import numpy as np
+import onnxruntime as ort
+
+MODEL_DIR = "models"
+SWAP_MODEL = os.path.join(MODEL_DIR, "inswapper_128.onnx")
+DETECTOR_NAME = "det_10g.onnx"  # buffalo_l detector
+VARIANTS = ('fp32', 'opt', 'int8_dynamic', 'int8_static')
+SESSION_CACHE_DIR = os.path.join(MODEL_DIR, "cache")
+
+
+def variant_path(path, variant):
+    """models/inswapper_128.onnx + 'int8_dynamic' -> models/inswapper_128.int8_dynamic.onnx"""
+    if variant == 'fp32':
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{variant}{ext}"
+
+
+def detector_path(variant='fp32', root='~/.insightface'):
+    """
+    Path of the buffalo_l detector for a variant. Variants live in models/,
+    not next to det_10g.onnx: FaceAnalysis loads every .onnx in the buffalo_l
+    folder and would pick up a variant as a second detector.
+    """
+    original = os.path.join(os.path.expanduser(root), "models", "buffalo_l", DETECTOR_NAME)
+    if variant == 'fp32':
+        return original
+    return variant_path(os.path.join(MODEL_DIR, DETECTOR_NAME), variant)
+
+
+def default_threads():
+    """Tuned CPU thread split: physical-ish cores for intra-op, one inter-op thread"""
+    cores = os.cpu_count() or 1
+    return max(1, cores // 2 if cores > 4 else cores), 1
+
+
+def session_options(intra_op_threads=None, inter_op_threads=None, optimized_model_path=None):
+    """SessionOptions with explicit thread counts for CPU inference"""
+    so = ort.SessionOptions()
+    intra, inter = default_threads()
+    so.intra_op_num_threads = intra_op_threads or intra
+    so.inter_op_num_threads = inter_op_threads or inter
+    so.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if optimized_model_path:
+        so.optimized_model_filepath = optimized_model_path
+    return so
+
+
+def cached_model_path(path, cache_dir=SESSION_CACHE_DIR):
+    """
+    Where the session-optimized copy of a model is cached. The key covers the
+    source file, the ORT version and the architecture. The copy is saved at
+    ORT_ENABLE_EXTENDED, which holds no instruction-set-specific layouts, so
+    a models/ folder can be shared between AVX2 and AVX-512 hosts.
+    """
+    stat = os.stat(path)
+    key = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}|{ort.__version__}|{platform.machine()}|extended"
+    digest = hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, f"{name}.{digest}.onnx")
+
+
+def create_session(path, variant='fp32', providers=None, intra_op_threads=None, inter_op_threads=None,
+                   cache_dir=SESSION_CACHE_DIR):
+    """
+    CPU session for a model. The first load saves ORT's portable optimized
+    graph (fusions, constant folding) to cache_dir; later loads start from
+    that copy, so only the CPU-specific layout passes of ORT_ENABLE_ALL are
+    left to run. cache_dir=None turns it off.
+    """
+    providers = providers or ['CPUExecutionProvider']
+    so = session_options(intra_op_threads, inter_op_threads)
+    if variant == 'opt' or not cache_dir:
+        return ort.InferenceSession(path, sess_options=so, providers=providers)
+
+    cached = cached_model_path(path, cache_dir)
+    if os.path.exists(cached):
+        try:
+            return ort.InferenceSession(cached, sess_options=so, providers=providers)
+        except Exception as e:
+            print(f"⚠ Ignoring unreadable session cache {cached}: {e}")
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = f"{cached}.{os.getpid()}.{threading.get_ident()}.tmp"  # Published only once fully written
+    try:
+        optimize_graph(path, tmp)
+        os.replace(tmp, cached)
+    except Exception as e:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        print(f"⚠ Could not cache the optimized graph of {os.path.basename(path)}: {e}")
+        return ort.InferenceSession(path, sess_options=so, providers=providers)
+    return ort.InferenceSession(cached, sess_options=so, providers=providers)
+
+
+def optimize_graph(src, dst):
+    """Run ORT's graph optimizations once and serialize the result"""
+    so = ort.SessionOptions()
+    # EXTENDED keeps the file portable across CPUs; ALL adds hardware-specific layout transforms
+    so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+    so.optimized_model_filepath = dst
+    ort.InferenceSession(src, sess_options=so, providers=['CPUExecutionProvider'])
+    return dst
+
+
+def quantize_dynamic_int8(src, dst):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(src, dst, weight_type=QuantType.QInt8)
+    return dst
+
+
+def quantize_static_int8(src, dst, calibration_inputs):
+    """Static INT8 (QDQ, per-channel) calibrated on a list of input feeds"""
+    from onnxruntime.quantization import (
+        CalibrationDataReader,
+        QuantFormat,
+        QuantType,
+        quantize_static,
+    )
+
+    class Reader(CalibrationDataReader):
+        def __init__(self, feeds):
+            self.feeds = iter(feeds)
+
+        def get_next(self):
+            return next(self.feeds, None)
+
+    quantize_static(src, dst, Reader(calibration_inputs), quant_format=QuantFormat.QDQ,
+                    per_channel=True, activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+    return dst
+
+
+def synthetic_feeds(path, count=16, seed=0, image_range=(0.0, 1.0)):
+    """
+    Random input feeds matching a model's inputs (batch 1, dynamic dims filled
+    from hints). Image inputs are uniform over image_range, the range the
+    model's preprocessing produces; only a fallback when no real faces exist.
+    """
+    rng = np.random.default_rng(seed)
+    session = ort.InferenceSession(path, providers=['CPUExecutionProvider'])
+    feeds = []
+    for _ in range(count):
+        feed = {}
+        for inp in session.get_inputs():
+            shape = [d if isinstance(d, int) else (1 if i == 0 else 640) for i, d in enumerate(inp.shape)]
+            if len(shape) == 2:  # inswapper latent is unit-norm
+                data = rng.standard_normal(shape).astype(np.float32)
+                data /= np.linalg.norm(data, axis=1, keepdims=True)
+            else:
+                data = rng.uniform(*image_range, size=shape).astype(np.float32)
+            feed[inp.name] = data
+        feeds.append(feed)
+    return feeds
+
+
+def swap_feeds(path, images, count=16):
+    """
+    inswapper feeds from the faces found in real images, preprocessed like
+    INSwapper.get: a norm_crop2 crop scaled to [0, 1] and a source latent
+    (embedding through emap, unit-norm), over every target/source pair of
+    faces. Needs buffalo_l.
+    """
+    import itertools
+
+    import cv2
+    from insightface.model_zoo.inswapper import INSwapper
+    from insightface.utils import face_align
+
+    from core.face_swapper import load_analysis
+
+    def session_fn(model_path, _):
+        return ort.InferenceSession(model_path, providers=['CPUExecutionProvider'])
+
+    app = load_analysis(['detection', 'recognition'], session_fn)
+    faces = []
+    for image_path in images:
+        img = cv2.imread(image_path)
+        if img is not None:
+            faces.extend((img, face) for face in app.get(img))
+    if not faces:
+        return []
+
+    swapper = INSwapper(model_file=path, session=session_fn(path, None))
+    size = swapper.input_size
+    feeds = []
+    for target, source in itertools.islice(itertools.product(range(len(faces)), repeat=2), count):
+        img, face = faces[target]
+        crop, _ = face_align.norm_crop2(img, face.kps, size[0])
+        blob = cv2.dnn.blobFromImage(crop, 1.0 / swapper.input_std, size, (swapper.input_mean,) * 3, swapRB=True)
+        latent = faces[source][1].normed_embedding.reshape((1, -1)) @ swapper.emap
+        latent /= np.linalg.norm(latent)
+        feeds.append({swapper.input_names[0]: blob, swapper.input_names[1]: latent.astype(np.float32)})
+    return feeds
+
+
+def image_feeds(path, images, size):
+    """Detector calibration feeds from real images, preprocessed like insightface's RetinaFace"""
+    import cv2
+
+    session = ort.InferenceSession(path, providers=['CPUExecutionProvider'])
+    name = session.get_inputs()[0].name
+    feeds = []
+    for image_path in images:
+        img = cv2.imread(image_path)
+        if img is None:
+            continue
+        scale = min(size / img.shape[0], size / img.shape[1])
+        resized = cv2.resize(img, (int(img.shape[1] * scale), int(img.shape[0] * scale)))
+        canvas = np.zeros((size, size, 3), dtype=np.uint8)
+        canvas[:resized.shape[0], :resized.shape[1]] = resized
+        feeds.append({name: cv2.dnn.blobFromImage(canvas, 1.0 / 128, (size, size), (127.5, 127.5, 127.5), swapRB=True)})
+    return feeds
+
+
+def prepare_variants(src, variants, calibration_feeds=None, dst_for=None, image_range=(0.0, 1.0)):
+    """Build the requested variants of one model; returns {variant: path}"""
+    dst_for = dst_for or (lambda v: variant_path(src, v))
+    built = {'fp32': src}
+    for variant in variants:
+        if variant == 'fp32':
+            continue
+        dst = dst_for(variant)
+        os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+        start = time.perf_counter()
+        if variant == 'opt':
+            optimize_graph(src, dst)
+        elif variant == 'int8_dynamic':
+            quantize_dynamic_int8(src, dst)
+        elif variant == 'int8_static':
+            quantize_static_int8(src, dst, calibration_feeds or synthetic_feeds(src, image_range=image_range))
+        else:
+            raise ValueError(f"Unknown variant '{variant}'. Choose from: {', '.join(VARIANTS)}")
+        print(f"✓ {os.path.basename(dst)} ({time.perf_counter() - start:.1f}s, {os.path.getsize(dst) / 1e6:.1f}MB)")
+        built[variant] = dst
+    return built
+
+
+def compare_variants(built, feeds, runs=20, intra_op_threads=None, inter_op_threads=None):
+    """Latency and output error of every variant against fp32 on the same feeds"""
+    reference = None
+    rows = []
+    for variant, path in built.items():
+        session = create_session(path, variant, intra_op_threads=intra_op_threads, inter_op_threads=inter_op_threads,
+                                 cache_dir=None)
+        outputs = [session.run(None, feed) for feed in feeds]
+        times = []
+        for i in range(runs):
+            feed = feeds[i % len(feeds)]
+            start = time.perf_counter()
+            session.run(None, feed)
+            times.append(time.perf_counter() - start)
+        times.sort()
+        row = {
+            'variant': variant,
+            'path': path,
+            'size_mb': round(os.path.getsize(path) / 1e6, 1),
+            'p50_ms': round(times[len(times) // 2] * 1000, 2),
+            'mean_ms': round(sum(times) / len(times) * 1000, 2),
+        }
+        if reference is None:
+            reference = outputs
+        else:
+            a = np.concatenate([x.ravel() for o in reference for x in o])
+            b = np.concatenate([x.ravel() for o in outputs for x in o])
+            row['max_abs_err'] = float(np.abs(a - b).max())
+            row['mean_abs_err'] = float(np.abs(a - b).mean())
+            row['cosine'] = float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b) + 1e-12))
+        rows.append(row)
+    base = rows[0]['p50_ms']
+    for row in rows:
+        row['speedup'] = round(base / row['p50_ms'], 2) if row['p50_ms'] else None
+    return rows
+
+
+def print_report(name, rows):
+    print(f"\n{name}")
+    print(f"{'variant':<14}{'size MB':>9}{'p50 ms':>9}{'speedup':>9}{'cosine':>9}{'max err':>10}")
+    for r in rows:
+        cosine = f"{r['cosine']:.4f}" if 'cosine' in r else "-"
+        err = f"{r['max_abs_err']:.4f}" if 'max_abs_err' in r else "-"
+        print(f"{r['variant']:<14}{r['size_mb']:>9}{r['p50_ms']:>9}{r['speedup']:>9}{cosine:>9}{err:>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build optimized / INT8 model variants and compare them")
+    parser.add_argument("--variants", nargs="+", default=['opt', 'int8_dynamic', 'int8_static'], choices=VARIANTS)
+    parser.add_argument("--calibration-images", nargs="*", default=glob.glob("screenshots/*.jpg"),
+                        help="Images whose faces calibrate the static INT8 variants and measure accuracy")
+    parser.add_argument("--intra-op-threads", type=int)
+    parser.add_argument("--inter-op-threads", type=int)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--report", default=os.path.join(MODEL_DIR, "variants_report.json"))
+    args = parser.parse_args(argv)
+
+    report = {'threads': {'intra_op': args.intra_op_threads or default_threads()[0],
+                          'inter_op': args.inter_op_threads or default_threads()[1]}}
+
+    print("=" * 60)
+    print("Preparing face swap model variants")
+    det_src = detector_path()
+    swap_calibration = swap_feeds(SWAP_MODEL, args.calibration_images) if os.path.exists(det_src) else []
+    if not swap_calibration:
+        print("⚠ No faces to calibrate on (needs buffalo_l and --calibration-images with faces); "
+              "using random inputs, so the int8_static accuracy below is only indicative")
+    swap_built = prepare_variants(SWAP_MODEL, args.variants, swap_calibration or None)
+    rows = compare_variants(swap_built, swap_calibration or synthetic_feeds(SWAP_MODEL, count=8, seed=1), args.runs,
+                            args.intra_op_threads, args.inter_op_threads)
+    print_report("inswapper_128", rows)
+    report['inswapper_128'] = rows
+    report['inswapper_128_inputs'] = 'faces' if swap_calibration else 'random'
+
+    if os.path.exists(det_src):
+        print("\nPreparing detector variants")
+        calibration = image_feeds(det_src, args.calibration_images, 640) or None
+        det_built = prepare_variants(det_src, args.variants, calibration, dst_for=detector_path,
+                                     image_range=(-1.0, 1.0))
+        feeds = calibration or synthetic_feeds(det_src, count=4, image_range=(-1.0, 1.0))
+        rows = compare_variants(det_built, feeds, args.runs, args.intra_op_threads, args.inter_op_threads)
+        print_report("det_10g", rows)
+        report['det_10g'] = rows
+    else:
+        print(f"\n⚠ Detector not found at {det_src}; run the app once so insightface downloads buffalo_l")
+
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()